@@ -0,0 +1,73 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))  # リポジトリルートをパスに追加
+
+import numpy as np
+import torch
+from omegaconf import OmegaConf
+from src.data.utils.batch_transform import BatchAugment, BatchAugmentCollate
+from src.data.utils.collate import custom_collate_rnd
+from src.data.utils.transform_factory import RandomTransform, TransformFactory
+
+def make_sample(rng, T, H, W, event_channels):
+    return {
+        "images": rng.randint(0, 255, (T, 3, H, W), dtype=np.uint8),
+        "events": rng.randint(0, 8, (T, event_channels, H, W)).astype(np.float32),
+        "labels": [[{"bbox": [100.0, 100.0, 180.0, 160.0], "type": "Car"}] for _ in range(T)],
+        "reset_state": False,
+    }
+
+def copy_sample(sample):
+    # transform は labels を書き換えるため、反復ごとに元のサンプルから作り直す
+    return dict(sample, labels=[[dict(l, bbox=list(l["bbox"])) for l in f] for f in sample["labels"]])
+
+def per_sample(transform, samples):
+    return custom_collate_rnd([transform(copy_sample(s)) for s in samples])
+
+def batched(collate, samples):
+    return collate([copy_sample(s) for s in samples])
+
+def measure(fn, repeat, warmup=2):
+    for _ in range(warmup):
+        fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-sample (NumPy/cv2) and batch-level (grid_sample) augmentation.")
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--seq_len", type=int, default=5)
+    parser.add_argument("--height", type=int, default=375)
+    parser.add_argument("--width", type=int, default=1242)
+    parser.add_argument("--event_channels", type=int, default=20)
+    parser.add_argument("--target_size", type=int, nargs=2, default=[640, 640])
+    parser.add_argument("--torch_threads", type=int, default=None, help="torch intra-op threads for the batch engine.")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.torch_threads is not None:
+        torch.set_num_threads(args.torch_threads)
+
+    transform_cfg = OmegaConf.create({
+        "target_size": args.target_size, "rotate_range": [-10, 10], "zoom_weight": [8, 2],
+    })
+    transform = RandomTransform(TransformFactory("train", transform_cfg))
+    collate = BatchAugmentCollate(custom_collate_rnd, BatchAugment("train", transform_cfg))
+    rng = np.random.RandomState(0)
+
+    print(f"torch threads: {torch.get_num_threads()}")
+    for batch_size in args.batch_sizes:
+        samples = [make_sample(rng, args.seq_len, args.height, args.width, args.event_channels)
+                   for _ in range(batch_size)]
+        t_sample = measure(lambda: per_sample(transform, samples), args.repeat)
+        t_batch = measure(lambda: batched(collate, samples), args.repeat)
+        print(f"B={batch_size:<3}: per-sample {t_sample * 1000:8.1f} ms/batch, "
+              f"batch {t_batch * 1000:8.1f} ms/batch  (x{t_sample / t_batch:.2f})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import argparse
+import sys
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))  # リポジトリルートをパスに追加
+
+import numpy as np
+from omegaconf import OmegaConf
+from src.data.dataloader import build_random_dataloader
+
+def frame_cache_hit_rate(order, cumulative_sizes, seq_len: int, capacity: int):
+    """ サンプル順 order で読んだときの、容量 capacity フレームの LRU キャッシュのヒット率 """
+    cache = OrderedDict()
+    hits = total = 0
+    for idx in order:
+        seq = int(np.searchsorted(cumulative_sizes, idx, side="right"))
+        local = idx - (cumulative_sizes[seq - 1] if seq > 0 else 0)
+        for frame in range(local, local + seq_len):
+            key = (seq, frame)
+            total += 1
+            if key in cache:
+                hits += 1
+                cache.move_to_end(key)
+            else:
+                cache[key] = None
+                if len(cache) > capacity:
+                    cache.popitem(last=False)
+    return hits / max(total, 1)
+
+def measure(loader, max_batches: int, warmup: int = 3):
+    """ warmup バッチを除いた samples/s """
+    samples = 0
+    start = None
+    for i, batch in enumerate(loader):
+        if i == warmup:
+            start = time.perf_counter()
+        if i >= warmup:
+            samples += len(batch["data"]["reset_state"])
+        if i + 1 >= warmup + max_batches:
+            break
+    if start is None:
+        return 0.0
+    return samples / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare full shuffle and block shuffle: frame-cache hit rate and loader throughput.")
+    parser.add_argument("--config", type=Path, required=True, help="Dataset/dataloader config (yaml).")
+    parser.add_argument("--block_size", type=int, default=64)
+    parser.add_argument("--buffer_size", type=int, default=256)
+    parser.add_argument("--cache_frames", type=int, default=1024, help="Simulated LRU frame cache capacity.")
+    parser.add_argument("--max_batches", type=int, default=50)
+    args = parser.parse_args()
+
+    cfg = OmegaConf.load(args.config)
+    settings = {
+        "full shuffle": {"sampler": {"type": "random"}},
+        "block shuffle": {"sampler": {"type": "block", "block_size": args.block_size, "buffer_size": args.buffer_size}},
+    }
+
+    baseline = None
+    for name, override in settings.items():
+        loader = build_random_dataloader(mode="train", cfg=OmegaConf.merge(cfg, override))
+        dataset = loader.dataset
+        order = list(loader.sampler)
+        hit_rate = frame_cache_hit_rate(order, dataset.cumulative_sizes, cfg.seq_len, args.cache_frames)
+        throughput = measure(loader, args.max_batches)
+        baseline = baseline or throughput
+        print(f"{name:<14}: frame cache hit rate {hit_rate * 100:5.1f}%, "
+              f"{throughput:8.1f} samples/s  (x{throughput / baseline:.2f})")
+        del loader
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))  # リポジトリルートをパスに追加
+
+from omegaconf import OmegaConf
+from src.data.dataloader import build_random_dataloader, build_stream_dataloader
+
+def run_epochs(loader, num_epochs: int, max_batches: int):
+    """ 各エポックの「最初のバッチが届くまでの時間」と全体時間を計測 """
+    first_batch_s = []
+    epoch_s = []
+    for _ in range(num_epochs):
+        start = time.perf_counter()
+        first = None
+        for i, _batch in enumerate(loader):
+            if first is None:
+                first = time.perf_counter() - start
+            if i + 1 >= max_batches:
+                break
+        first_batch_s.append(first)
+        epoch_s.append(time.perf_counter() - start)
+    return first_batch_s, epoch_s
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the epoch-boundary stall with and without persistent workers.")
+    parser.add_argument("--config", type=Path, required=True, help="Dataset/dataloader config (yaml).")
+    parser.add_argument("--mode", default="train", choices=["train", "val", "test"])
+    parser.add_argument("--streaming", action="store_true", help="Use build_stream_dataloader.")
+    parser.add_argument("--epochs", type=int, default=4)
+    parser.add_argument("--max_batches", type=int, default=50, help="Batches per epoch.")
+    args = parser.parse_args()
+
+    cfg = OmegaConf.load(args.config)
+    build = build_stream_dataloader if args.streaming else build_random_dataloader
+
+    for persistent in (False, True):
+        run_cfg = OmegaConf.merge(cfg, {"hardware": {"persistent_workers": persistent}})
+        loader = build(mode=args.mode, cfg=run_cfg)
+        first, total = run_epochs(loader, args.epochs, args.max_batches)
+        # 1 エポック目はどちらもワーカー起動を含むため、2 エポック目以降を比較する
+        later = first[1:] or first
+        print(f"persistent_workers={persistent}: "
+              f"first-batch latency per epoch = {[f'{s * 1000:.1f}ms' for s in first]}, "
+              f"mean after epoch 0 = {sum(later) / len(later) * 1000:.1f}ms, "
+              f"total = {sum(total):.2f}s")
+        del loader
+
+if __name__ == "__main__":
+    main()
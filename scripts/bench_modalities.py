@@ -0,0 +1,53 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))  # リポジトリルートをパスに追加
+
+from omegaconf import OmegaConf
+from src.data.dataloader import build_random_dataloader, build_stream_dataloader
+
+MODALITY_SETS = [
+    ["images", "events", "labels"],
+    ["events", "labels"],
+    ["images", "labels"],
+    ["labels"],
+]
+
+def measure(loader, max_batches: int, warmup: int = 3):
+    """ warmup バッチを除いた samples/s """
+    samples = 0
+    start = None
+    for i, batch in enumerate(loader):
+        if i == warmup:
+            start = time.perf_counter()
+        if i >= warmup:
+            samples += len(batch["data"]["reset_state"])
+        if i + 1 >= warmup + max_batches:
+            break
+    if start is None:
+        return 0.0
+    return samples / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare loader throughput for each modality subset.")
+    parser.add_argument("--config", type=Path, required=True, help="Dataset/dataloader config (yaml).")
+    parser.add_argument("--mode", default="train", choices=["train", "val", "test"])
+    parser.add_argument("--streaming", action="store_true", help="Use build_stream_dataloader.")
+    parser.add_argument("--max_batches", type=int, default=50)
+    args = parser.parse_args()
+
+    cfg = OmegaConf.load(args.config)
+    build = build_stream_dataloader if args.streaming else build_random_dataloader
+
+    baseline = None
+    for modalities in MODALITY_SETS:
+        loader = build(mode=args.mode, cfg=OmegaConf.merge(cfg, {"modalities": modalities}))
+        throughput = measure(loader, args.max_batches)
+        baseline = baseline or throughput
+        print(f"{'+'.join(modalities):<22} {throughput:8.1f} samples/s  (x{throughput / baseline:.2f})")
+        del loader
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))  # リポジトリルートをパスに追加
+
+from omegaconf import OmegaConf
+from src.data.dataloader import get_seq_ids
+from src.data.online_reader import OnlineSequenceReader
+from src.data.utils.transform_factory import TransformFactory
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay sequences frame by frame with OnlineSequenceReader and report per-frame latency percentiles.")
+    parser.add_argument("--config", type=Path, required=True, help="Dataset/dataloader config (yaml).")
+    parser.add_argument("--mode", default="test", choices=["train", "val", "test"], help="Sequence split to replay.")
+    parser.add_argument("--seq_ids", nargs="+", default=None, help="Sequences to replay (default: the split's sequences).")
+    parser.add_argument("--prefetch", type=int, default=2)
+    parser.add_argument("--num_threads", type=int, default=2)
+    parser.add_argument("--history", type=int, default=1)
+    parser.add_argument("--model_ms", type=float, default=0.0, help="Simulated per-frame model time [ms].")
+    args = parser.parse_args()
+
+    cfg = OmegaConf.load(args.config)
+    transform_cfg = cfg.get("transform", None)
+    transform = TransformFactory("val", transform_cfg).build_for_random() if transform_cfg is not None else None
+
+    for seq in args.seq_ids or get_seq_ids(args.mode):
+        reader = OnlineSequenceReader(
+            data_dir=cfg.data_dir,
+            sequence_name=seq,
+            ev_repr_name=cfg.ev_repr_name,
+            downsample=cfg.get("downsample", False),
+            transform=transform,
+            history=args.history,
+            prefetch=args.prefetch,
+            num_threads=args.num_threads,
+        )
+        start = time.perf_counter()
+        for _ in reader:
+            if args.model_ms:
+                time.sleep(args.model_ms / 1e3)
+        elapsed = time.perf_counter() - start
+        s = reader.latency_stats()
+        if not s:
+            continue
+        print(f"{seq}: {s['frames']} frames, {s['frames'] / elapsed:.1f} frames/s, latency p50 {s['latency_p50_ms']:.2f} / "
+              f"p90 {s['latency_p90_ms']:.2f} / p99 {s['latency_p99_ms']:.2f} ms, wait p99 {s['wait_p99_ms']:.2f} ms")
+
+if __name__ == "__main__":
+    main()
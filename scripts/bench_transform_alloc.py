@@ -0,0 +1,71 @@
+import argparse
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))  # リポジトリルートをパスに追加
+
+import numpy as np
+from omegaconf import OmegaConf
+from src.data.utils.buffer_pool import BufferPool
+from src.data.utils.transform_factory import TransformFactory
+
+def make_sample(rng, T, H, W, event_channels):
+    return {
+        "images": rng.randint(0, 255, (T, 3, H, W), dtype=np.uint8),
+        "events": rng.randint(0, 8, (T, event_channels, H, W)).astype(np.float32),
+        "labels": [[{"bbox": [100.0, 100.0, 180.0, 160.0], "type": "Car"}] for _ in range(T)],
+    }
+
+def run(factory, pool, samples, warmup):
+    """ warmup 後の 1 サンプルあたりの (新規確保数, 確保バイト, ピーク一時メモリ, 時間) """
+    for s in samples[:warmup]:
+        factory.build_for_random()(s)
+    allocs0, bytes0 = pool.allocations, pool.allocated_bytes
+
+    tracemalloc.start()
+    peaks = []
+    start = time.perf_counter()
+    for s in samples[warmup:]:
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        factory.build_for_random()(s)
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - base)
+    elapsed = time.perf_counter() - start
+    tracemalloc.stop()
+
+    n = len(samples) - warmup
+    return ((pool.allocations - allocs0) / n, (pool.allocated_bytes - bytes0) / n,
+            float(np.mean(peaks)), elapsed / n)
+
+def main():
+    parser = argparse.ArgumentParser(description="Count per-sample output allocations of the train transform with and without BufferPool.")
+    parser.add_argument("--seq_len", type=int, default=5)
+    parser.add_argument("--height", type=int, default=375)
+    parser.add_argument("--width", type=int, default=1242)
+    parser.add_argument("--event_channels", type=int, default=20)
+    parser.add_argument("--target_size", type=int, nargs=2, default=[640, 640])
+    parser.add_argument("--num_samples", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=5)
+    args = parser.parse_args()
+
+    transform_cfg = OmegaConf.create({
+        "target_size": args.target_size, "rotate_range": [-10, 10], "zoom_weight": [8, 2],
+    })
+    rng = np.random.RandomState(0)
+
+    for name, pool in (("no pool", BufferPool(num_slots=1, reuse=False)),
+                       ("BufferPool", BufferPool(num_slots=2))):
+        # reuse=False のプールは毎回確保するので、従来の実装と同じ確保回数を数えられる
+        factory = TransformFactory("train", transform_cfg, pool=pool)
+        np.random.seed(0)
+        samples = [make_sample(rng, args.seq_len, args.height, args.width, args.event_channels)
+                   for _ in range(args.num_samples)]
+        allocs, nbytes, peak, sec = run(factory, pool, samples, args.warmup)
+        print(f"{name:<10}: {allocs:6.1f} output allocs/sample, {nbytes / 1024 ** 2:8.1f} MB allocated/sample, "
+              f"peak transient {peak / 1024 ** 2:8.1f} MB, {sec * 1000:7.1f} ms/sample")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import argparse
+import pickle
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))  # リポジトリルートをパスに追加
+
+from omegaconf import OmegaConf
+from src.data.dataloader import get_seq_ids
+from src.data.dataset import build_random_dataset
+from src.data.utils.collate import custom_collate_rnd
+from torch.utils.data import DataLoader
+
+def memory_kb(pid: int) -> dict:
+    """ /proc/<pid>/smaps_rollup の Rss / Pss / Private (= USS) [kB] (Linux のみ) """
+    out = {"rss": 0, "pss": 0, "uss": 0}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                value = rest.split()[0] if rest.split() else "0"
+                if key == "Rss":
+                    out["rss"] = int(value)
+                elif key == "Pss":
+                    out["pss"] = int(value)
+                elif key in ("Private_Clean", "Private_Dirty"):
+                    out["uss"] += int(value)
+    except (FileNotFoundError, PermissionError):
+        pass
+    return out
+
+def run(dataset, context: str, num_workers: int, batch_size: int, max_batches: int):
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=True, num_workers=num_workers,
+                        collate_fn=custom_collate_rnd, multiprocessing_context=context,
+                        persistent_workers=True)
+    start = time.perf_counter()
+    it = iter(loader)
+    next(it)
+    startup = time.perf_counter() - start
+    for i, _ in enumerate(it):
+        if i + 2 >= max_batches:
+            break
+    mems = [memory_kb(w.pid) for w in it._workers]
+    del it, loader
+    return startup, mems
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure dataset pickle size, worker startup time and per-worker memory.")
+    parser.add_argument("--config", type=Path, required=True, help="Dataset/dataloader config (yaml).")
+    parser.add_argument("--num_workers", type=int, default=4)
+    parser.add_argument("--max_batches", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=1, help="Repeat the train sequence list to scale up metadata.")
+    args = parser.parse_args()
+
+    cfg = OmegaConf.load(args.config)
+    start = time.perf_counter()
+    dataset = build_random_dataset(
+        data_dir=cfg.data_dir,
+        ev_repr_name=cfg.ev_repr_name,
+        seq_len=cfg.seq_len,
+        seq_ids=get_seq_ids("train") * args.repeat,
+        downsample=cfg.get("downsample", False),
+    )
+    build_s = time.perf_counter() - start
+    size = len(pickle.dumps(dataset))
+    print(f"dataset: {len(dataset)} windows, built in {build_s:.2f}s, pickled {size / 1024:.1f} KB")
+
+    for context in ("fork", "spawn"):
+        startup, mems = run(dataset, context, args.num_workers, cfg.batch_size.train, args.max_batches)
+        mean = {k: sum(m[k] for m in mems) / max(len(mems), 1) / 1024 for k in ("rss", "pss", "uss")}
+        print(f"{context:<5}: first batch {startup:.2f}s, per-worker RSS {mean['rss']:.1f} MB, "
+              f"PSS {mean['pss']:.1f} MB, USS {mean['uss']:.1f} MB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))  # リポジトリルートをパスに追加
+
+import h5py
+import numpy as np
+from src.data.utils.event_quant import EVENT_DTYPES, quantize_events
+
+def auto_scale(data: h5py.Dataset, dtype, num_probe: int = 64, percentile: float = 99.99):
+    """ uint8 の場合、先頭から間引いたフレームの percentile が 255 になるスケールを選ぶ """
+    if np.dtype(dtype) != np.uint8:
+        return 1.0
+    idx = np.unique(np.linspace(0, data.shape[0] - 1, num_probe).astype(int))
+    probe = data[idx]
+    high = float(np.percentile(probe, percentile))
+    # 整数値のヒストグラムで 255 以下に収まるなら量子化誤差なしで格納する
+    if high <= 255 and np.array_equal(probe, np.rint(probe)):
+        return 1.0
+    return max(high, 1e-6) / 255
+
+def convert(src: Path, dst: Path, dtype, scale, chunk: int = 64):
+    with h5py.File(src, "r") as fin, h5py.File(dst, "w") as fout:
+        data = fin["data"]
+        if scale is None:
+            scale = auto_scale(data, dtype)
+        out = fout.create_dataset(
+            "data", shape=data.shape, dtype=dtype,
+            chunks=data.chunks, compression=data.compression, compression_opts=data.compression_opts,
+        )
+        out.attrs["scale"] = scale
+        max_err = 0.0
+        for start in range(0, data.shape[0], chunk):
+            block = np.array(data[start:start + chunk])
+            if np.dtype(dtype) == np.uint8 and block.size and block.min() < 0:
+                raise ValueError(f"{src.name} has negative values (min={float(block.min()):.4g}); "
+                                 f"uint8 would clip them to 0. Use --dtype float16.")
+            q = quantize_events(block, dtype, scale)
+            out[start:start + chunk] = q
+            max_err = max(max_err, float(np.abs(q.astype(np.float32) * scale - block).max(initial=0.0)))
+        return data.dtype, data.shape, scale, max_err
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert preprocessed event HDF5 files to a compact dtype with a recorded scale.")
+    parser.add_argument("--data_dir", type=Path, required=True)
+    parser.add_argument("--ev_repr_name", required=True)
+    parser.add_argument("--dtype", choices=list(EVENT_DTYPES), default="uint8")
+    parser.add_argument("--scale", type=float, default=None, help="Quantization step (value ≈ stored * scale). Default: auto.")
+    parser.add_argument("--out_name", default=None, help="Output ev_repr_name (default: <ev_repr_name>_<dtype>).")
+    args = parser.parse_args()
+
+    src_dir = args.data_dir / "preprocessed" / args.ev_repr_name
+    dst_dir = args.data_dir / "preprocessed" / (args.out_name or f"{args.ev_repr_name}_{args.dtype}")
+    dst_dir.mkdir(parents=True, exist_ok=True)
+    dtype = np.dtype(EVENT_DTYPES[args.dtype])
+
+    for src in sorted(src_dir.glob("*.h5")):
+        dst = dst_dir / src.name
+        src_dtype, shape, scale, max_err = convert(src, dst, dtype, args.scale)
+        frame_bytes = int(np.prod(shape[1:]))
+        print(f"{src.stem}: {src_dtype} -> {dtype} scale={scale:.4g} max_abs_err={max_err:.4g} "
+              f"frame {frame_bytes * np.dtype(src_dtype).itemsize / 1024:.0f} KB -> {frame_bytes * dtype.itemsize / 1024:.0f} KB "
+              f"file {src.stat().st_size / 1024 ** 2:.1f} MB -> {dst.stat().st_size / 1024 ** 2:.1f} MB")
+    print(f"Use ev_repr_name: {dst_dir.name} with event_dtype: {args.dtype}")
+
+if __name__ == "__main__":
+    main()
@@ -1,43 +1,175 @@
 import argparse
-import cv2
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
-def create_mp4_from_pngs(image_dir: Path, output_path: Path, fps=10):
-    png_files = sorted(image_dir.glob("*.png"))
-    if not png_files:
-        print(f"[{image_dir.name}] No PNG files found.")
-        return
+import cv2
+import h5py
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))  # リポジトリルートをパスに追加
 
-    first_image = cv2.imread(str(png_files[0]))
-    if first_image is None:
-        print(f"[{image_dir.name}] Failed to read the first image.")
-        return
-    height, width, _ = first_image.shape
+from src.data.sequence_map import SequenceForMap
+from src.utils.visualize import draw_labels_on_image, overlay_events_on_image
 
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    video_writer = cv2.VideoWriter(str(output_path), fourcc, fps, (width, height))
+_DONE = object()
 
-    for img_path in png_files:
-        img = cv2.imread(str(img_path))
-        if img is not None:
-            video_writer.write(img)
+def _stage(fn, src: queue.Queue, dst: queue.Queue):
+    """ パイプラインの 1 ステージ。例外は後段へそのまま流す """
+    while True:
+        item = src.get()
+        if item is _DONE or isinstance(item, BaseException):
+            dst.put(item)
+            return
+        try:
+            dst.put(fn(item))
+        except BaseException as e:
+            dst.put(e)
+            return
 
-    video_writer.release()
-    print(f"[{image_dir.name}] Video saved to {output_path}")
+def _read_frames(paths, event_file, num_frames, out: queue.Queue):
+    """ read ステージ: PNG のバイト列と、(あれば) イベント 1 フレームを順に読む """
+    try:
+        f = h5py.File(event_file, "r") if event_file is not None else None
+        try:
+            for i in range(num_frames):
+                events = np.array(f["data"][i]) if f is not None else None
+                out.put((i, np.fromfile(paths(i), dtype=np.uint8), events))
+        finally:
+            if f is not None:
+                f.close()
+        out.put(_DONE)
+    except BaseException as e:
+        out.put(e)
 
-def process_all_sequences(base_dir: Path, output_dir: Path, fps=10):
-    sequence_dirs = sorted([p for p in base_dir.iterdir() if p.is_dir()])
+def render_sequence(job: dict):
+    """
+    1 シーケンスを動画にする（プロセスごとに 1 シーケンス）。
+    戻り値は (シーケンス名, 書き出したフレーム数, 秒, エラーメッセージ or None)。
+    読めないシーケンス（HDF5 がない、PNG が壊れているなど）は例外を送出せず error に入れて返し、
+    ほかのシーケンスの処理は続ける。
+    """
+    try:
+        return _render_sequence(job)
+    except Exception as e:
+        return job["name"], 0, 0.0, f"{type(e).__name__}: {e}"
 
-    for seq_dir in sequence_dirs:
-        output_path = output_dir / f"{seq_dir.name}.mp4"
-        create_mp4_from_pngs(seq_dir, output_path, fps)
+def _render_sequence(job: dict):
+    """ read (スレッド) -> decode + overlay (スレッド) -> encode (このスレッド) をキューでつないで並行に処理する """
+    cv2.setNumThreads(1)  # シーケンス単位で並列化するので、プロセス内の OpenCV スレッドは使わない
+    name, output_path, fps = job["name"], job["output_path"], job["fps"]
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Convert PNG images to MP4 video.")
+    if job["data_dir"] is not None:
+        modalities = ("images",) + tuple(m for m in ("events", "labels") if m in job["overlay"])
+        seq = SequenceForMap(job["data_dir"], name, job["ev_repr_name"], seq_len=1, modalities=modalities)
+        paths = seq._image_path
+        num_frames = seq.total_frames
+        event_file = seq.event_file if "events" in modalities else None
+        labels = seq.labels if "labels" in modalities else None
+    else:
+        png_files = sorted(Path(job["image_dir"]).glob("*.png"))
+        paths = lambda i: str(png_files[i])
+        num_frames = len(png_files)
+        event_file = labels = None
+
+    if num_frames == 0:
+        return name, 0, 0.0, "No PNG files found."
+
+    def overlay(item):
+        i, buf, events = item
+        img = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+        if img is None:
+            return None
+        if events is not None:
+            overlay_events_on_image(img, events)
+        if labels is not None:
+            draw_labels_on_image(img, labels.frame(i), in_place=True)
+        return img
+
+    start = time.perf_counter()
+    read_q, frame_q = queue.Queue(maxsize=job["queue_size"]), queue.Queue(maxsize=job["queue_size"])
+    threads = [
+        threading.Thread(target=_read_frames, args=(paths, event_file, num_frames, read_q), daemon=True),
+        threading.Thread(target=_stage, args=(overlay, read_q, frame_q), daemon=True),
+    ]
+    for t in threads:
+        t.start()
+
+    writer = None
+    written = 0
+    try:
+        while True:
+            img = frame_q.get()
+            if img is _DONE:
+                break
+            if isinstance(img, BaseException):
+                raise img
+            if img is None:
+                continue
+            if writer is None:
+                height, width = img.shape[:2]
+                output_path.parent.mkdir(parents=True, exist_ok=True)
+                fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+                writer = cv2.VideoWriter(str(output_path), fourcc, fps, (width, height))
+            writer.write(img)
+            written += 1
+    finally:
+        if writer is not None:
+            writer.release()
+    return name, written, time.perf_counter() - start, None
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert PNG images to MP4 video, optionally with event/label overlays.")
     parser.add_argument("--base_dir", type=Path, help="Base directory containing sequence folders.")
+    parser.add_argument("--data_dir", type=Path, default=None, help="Dataset root (images/, preprocessed/, labels/); used instead of --base_dir for overlays.")
+    parser.add_argument("--ev_repr_name", default=None, help="Event representation under preprocessed/ (required with --data_dir).")
+    parser.add_argument("--overlay", nargs="*", default=[], choices=["events", "labels"], help="Overlays to draw (with --data_dir).")
+    parser.add_argument("--seq_ids", nargs="+", default=None, help="Sequences to render (default: all).")
     parser.add_argument("--output_dir", type=Path, help="Output directory for the MP4 files.")
     parser.add_argument("--fps", type=int, default=10, help="Frames per second for the output video.")
+    parser.add_argument("--num_workers", type=int, default=None, help="Processes, one sequence each (default: CPU count).")
+    parser.add_argument("--queue_size", type=int, default=8, help="Frames buffered between pipeline stages.")
     args = parser.parse_args()
 
-    process_all_sequences(args.base_dir, args.output_dir, args.fps)
\ No newline at end of file
+    if args.data_dir is not None:
+        if args.ev_repr_name is None:
+            parser.error("--ev_repr_name is required with --data_dir")
+        image_root = args.data_dir / "images"
+    elif args.overlay:
+        parser.error("--overlay requires --data_dir")
+    else:
+        image_root = args.base_dir
+    seq_ids = args.seq_ids or sorted(p.name for p in image_root.iterdir() if p.is_dir())
+
+    jobs = [{
+        "name": seq,
+        "image_dir": image_root / seq,
+        "data_dir": args.data_dir,
+        "ev_repr_name": args.ev_repr_name,
+        "overlay": args.overlay,
+        "output_path": args.output_dir / f"{seq}.mp4",
+        "fps": args.fps,
+        "queue_size": args.queue_size,
+    } for seq in seq_ids]
+
+    start = time.perf_counter()
+    total = 0
+    failed = []
+    with ProcessPoolExecutor(max_workers=args.num_workers) as pool:
+        for name, frames, seconds, error in pool.map(render_sequence, jobs):
+            if error is not None:
+                print(f"[{name}] {error}")
+                failed.append(name)
+                continue
+            total += frames
+            print(f"[{name}] {frames} frames, {frames / max(seconds, 1e-9):.1f} frames/s -> {args.output_dir / f'{name}.mp4'}")
+    elapsed = time.perf_counter() - start
+    print(f"{len(jobs)} sequences, {total} frames in {elapsed:.1f}s ({total / max(elapsed, 1e-9):.1f} frames/s)")
+    if failed:
+        print(f"{len(failed)} sequences failed: {' '.join(failed)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))  # リポジトリルートをパスに追加
+
+from src.data.utils.dataset_index import scan_dataset, write_index
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Validate images / event HDF5 / labels in parallel and write a validated index for the loaders.",
+        epilog="The loaders ignore the index for a different data_dir and rescan sequences whose HDF5 / label files "
+               "or image directory changed. Images are checked by directory mtime only, so rerun this script "
+               "after overwriting PNG files in place.")
+    parser.add_argument("--data_dir", type=Path, required=True)
+    parser.add_argument("--ev_repr_name", required=True)
+    parser.add_argument("--seq_ids", nargs="+", default=None, help="Sequences to scan (default: every directory under images/).")
+    parser.add_argument("--num_workers", type=int, default=None, help="Worker processes (default: CPU count).")
+    parser.add_argument("--out_dir", type=Path, default=None, help="Output directory (default: <data_dir>/index/<ev_repr_name>).")
+    args = parser.parse_args()
+
+    seq_ids = args.seq_ids or sorted(p.name for p in (args.data_dir / "images").iterdir() if p.is_dir())
+    out_dir = args.out_dir or args.data_dir / "index" / args.ev_repr_name
+
+    report, entries = scan_dataset(args.data_dir, args.ev_repr_name, seq_ids, num_workers=args.num_workers)
+    write_index(out_dir, report, entries)
+
+    for seq, r in report["sequences"].items():
+        print(f"{seq}: {r['status']:<7} images={r['num_images']} events={r['num_event_frames']} labels={r['num_labels']}")
+        for issue in r["issues"]:
+            count = f" ({issue['count']})" if "count" in issue else ""
+            print(f"    [{issue['level']}] {issue['check']}: {issue['message']}{count}")
+    summary = report["summary"]
+    print(f"{summary['ok']} ok, {summary['warning']} warning, {summary['error']} error "
+          f"in {report['elapsed_s']:.1f}s -> {out_dir} (set index_dir to use it)")
+    sys.exit(1 if summary["error"] else 0)
+
+if __name__ == "__main__":
+    main()
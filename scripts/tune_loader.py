@@ -0,0 +1,150 @@
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))  # リポジトリルートをパスに追加
+
+from omegaconf import OmegaConf
+from src.data.dataloader import build_random_dataloader, build_stream_dataloader
+
+CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+def cpu_seconds(pid) -> float:
+    """ /proc/<pid>/stat の utime + stime [s] (Linux 以外では 0) """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / CLK_TCK
+    except (FileNotFoundError, ProcessLookupError, IndexError):
+        return 0.0
+
+def trial_cfg(cfg, mode: str, params: dict):
+    split = "train" if mode == "train" else "eval"
+    return OmegaConf.merge(cfg, {
+        "batch_size": {split: params["batch_size"]},
+        "hardware": {
+            "num_workers": {split: params["num_workers"]},
+            "prefetch_factor": params["prefetch_factor"],
+            "cv2_threads": params["cv2_threads"],
+        },
+    })
+
+def run_trial(build, cfg, mode: str, params: dict, warmup: int, max_batches: int, max_seconds: float):
+    """ warmup バッチ (ワーカー起動を含む) の後、max_batches か max_seconds まで回して samples/s と CPU 使用率を測る """
+    loader = build(mode=mode, cfg=trial_cfg(cfg, mode, params))
+    it = iter(loader)
+    try:
+        for _ in range(max(warmup, 1)):
+            next(it)
+        # ProfiledDataLoader (instrumentation.enabled) の it はジェネレータなので、ローダー側の記録から取る
+        workers = loader.worker_pids if hasattr(loader, "worker_pids") else [w.pid for w in getattr(it, "_workers", [])]
+        pids = [os.getpid()] + workers
+        cpu0 = sum(cpu_seconds(p) for p in pids)
+        start = time.perf_counter()
+        samples = batches = 0
+        for batch in it:
+            samples += len(batch["data"]["reset_state"])
+            batches += 1
+            if batches >= max_batches or time.perf_counter() - start >= max_seconds:
+                break
+        elapsed = time.perf_counter() - start
+        cpu = sum(cpu_seconds(p) for p in pids) - cpu0
+    except StopIteration:
+        return {"samples_per_s": 0.0, "cpu_util": 0.0, "batches": 0}
+    finally:
+        del it, loader
+    return {
+        "samples_per_s": samples / elapsed if elapsed > 0 else 0.0,
+        # 1.0 = 全 CPU コアを使い切っている
+        "cpu_util": cpu / elapsed / (os.cpu_count() or 1) if elapsed > 0 else 0.0,
+        "batches": batches,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune num_workers / batch size / cv2 threads / prefetch factor with short timed loader trials.")
+    parser.add_argument("--config", type=Path, required=True, help="Dataset/dataloader config (yaml).")
+    parser.add_argument("--mode", default="train", choices=["train", "val", "test"])
+    parser.add_argument("--streaming", action="store_true", help="Use build_stream_dataloader.")
+    parser.add_argument("--num_workers", type=int, nargs="+", default=None, help="Candidates (default: 0, 1, 2, 4, ... up to the CPU count).")
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=None, help="Candidates (default: the configured batch size only).")
+    parser.add_argument("--prefetch_factors", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--cv2_threads", type=int, nargs="+", default=[0, 1, 2])
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--max_batches", type=int, default=50)
+    parser.add_argument("--max_seconds", type=float, default=20.0)
+    parser.add_argument("--min_gain", type=float, default=0.05, help="Relative gain below which a dimension is considered plateaued.")
+    parser.add_argument("--patience", type=int, default=1, help="Candidates without gain before stopping a dimension (at least 2 for num_workers).")
+    parser.add_argument("--out", type=Path, default=Path("loader_autotune.yaml"), help="OmegaConf override file to write.")
+    args = parser.parse_args()
+
+    cfg = OmegaConf.load(args.config)
+    build = build_stream_dataloader if args.streaming else build_random_dataloader
+    split = "train" if args.mode == "train" else "eval"
+    hw = cfg.hardware
+
+    cpus = os.cpu_count() or 1
+    space = {
+        "num_workers": args.num_workers or [0] + [n for n in (1, 2, 4, 6, 8, 12, 16, 24, 32) if n <= cpus],
+        "batch_size": args.batch_sizes or [cfg.batch_size[split]],
+        "prefetch_factor": args.prefetch_factors,
+        "cv2_threads": args.cv2_threads,
+    }
+    best_params = {
+        "num_workers": hw.num_workers[split],
+        "batch_size": cfg.batch_size[split],
+        "prefetch_factor": hw.get("prefetch_factor", 2),
+        "cv2_threads": hw.get("cv2_threads", 0),
+    }
+
+    trials = []
+    seen = {tuple(best_params.values())}
+    best = run_trial(build, cfg, args.mode, best_params, args.warmup, args.max_batches, args.max_seconds)
+    trials.append({"params": dict(best_params), **best})
+    print(f"baseline {best_params}: {best['samples_per_s']:.1f} samples/s, cpu {best['cpu_util'] * 100:.0f}%")
+
+    # 1 次元ずつ候補を昇順に試し、min_gain 以上の改善が patience 回続かなければ打ち切る。
+    # num_workers は 0 -> 1 で（コンシューマのないベンチマークでは）遅くなることが多いので、
+    # 1 回の悪化では打ち切らない
+    for name, candidates in space.items():
+        patience = max(args.patience, 2) if name == "num_workers" else args.patience
+        misses = 0
+        for value in sorted(candidates):
+            if value == best_params[name]:
+                continue
+            params = dict(best_params, **{name: value})
+            if params["num_workers"] == 0 and name == "prefetch_factor":
+                continue  # ワーカーなしでは prefetch_factor は効かない
+            if tuple(params.values()) in seen:
+                continue
+            seen.add(tuple(params.values()))
+            result = run_trial(build, cfg, args.mode, params, args.warmup, args.max_batches, args.max_seconds)
+            trials.append({"params": params, **result})
+            print(f"{name}={value:<4}: {result['samples_per_s']:8.1f} samples/s, cpu {result['cpu_util'] * 100:3.0f}%")
+            if result["samples_per_s"] > best["samples_per_s"] * (1 + args.min_gain):
+                best, best_params, misses = result, params, 0
+            else:
+                misses += 1
+                if misses >= patience and value > best_params[name]:
+                    break
+
+    override = OmegaConf.create({
+        "batch_size": {split: best_params["batch_size"]},
+        "hardware": {
+            "num_workers": {split: best_params["num_workers"]},
+            "prefetch_factor": best_params["prefetch_factor"],
+            "cv2_threads": best_params["cv2_threads"],
+        },
+    })
+    args.out.parent.mkdir(parents=True, exist_ok=True)
+    OmegaConf.save(override, args.out)
+    trials_path = args.out.with_suffix(".trials.json")
+    with open(trials_path, "w") as f:
+        json.dump({"mode": args.mode, "streaming": args.streaming, "cpu_count": cpus,
+                   "best": {"params": best_params, **best}, "trials": trials}, f, indent=1)
+    print(f"best {best_params}: {best['samples_per_s']:.1f} samples/s -> {args.out} (trials: {trials_path})")
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,28 @@
+import warnings
+from functools import partial
+from pathlib import Path
 from typing import Literal
+
+import torch
+from omegaconf import DictConfig, OmegaConf
 from src.data.dataset import build_random_dataset, build_stream_datasets
+from src.data.utils.batch_transform import BatchAugment, BatchAugmentCollate
+from src.data.utils.block_shuffle_sampler import BlockShuffleSampler
+from src.data.sequence_map import MODALITIES
 from src.data.utils.multi_stream_sampler import MultiStreamSampler
 from src.data.utils.sharded_stream_sampler import ShardedSequenceSampler
+from src.data.utils.buffer_pool import BufferPool
 from src.data.utils.collate import custom_collate_rnd, custom_collate_streaming
-from torch.utils.data import DataLoader, get_worker_info
+from src.data.utils.dataset_index import DatasetIndex
+from src.data.utils.eval_cache import EvalCache
+from src.data.utils.io_backend import DelayedFS, ThreadedIO
+from src.data.utils.multi_root import MultiRootDataset, RootTaggedSequence, RootThroughput
+from src.data.utils.profiling import ProfiledDataLoader
+from src.data.utils.transform_factory import TransformFactory
+from src.data.utils.weighted_window_sampler import WeightedWindowSampler
+from src.data.utils.window_stats import KITTI_CLASSES, WindowStats
+from src.data.utils.worker_init import worker_init_fn
+from torch.utils.data import ConcatDataset, DataLoader, IterableDataset, get_worker_info
 
 def get_seq_ids(mode: str):
     if mode == "train":
@@ -11,40 +30,396 @@ def get_seq_ids(mode: str):
     else:
         return [f"{i:04d}" for i in range(17, 21)]
 
-def build_random_dataloader(mode: Literal["train", "val", "test"], cfg):
-    seq_ids = get_seq_ids(mode)
+def _modalities(cfg):
+    """ cfg.modalities (例: [events, labels]) 。未指定なら全モダリティを読む """
+    modalities = cfg.get("modalities", None)
+    return MODALITIES if modalities is None else tuple(modalities)
+
+def _batch_engine(cfg) -> bool:
+    transform_cfg = cfg.get("transform", None)
+    return transform_cfg is not None and transform_cfg.get("engine", "sample") == "batch"
+
+def _load_index(cfg):
+    """
+    index_dir: null   # scripts/scan_dataset.py の出力先。指定すると検証済みインデックスから即座に構築する
+    """
+    index_dir = cfg.get("index_dir", None)
+    return None if index_dir is None else DatasetIndex(index_dir)
+
+def _reads_in_order(mode: str, cfg) -> bool:
+    """ ウィンドウをシーケンス内でおおむね順に読むローダーか（後続ウィンドウの先読みが当たるか） """
+    if mode != "train":
+        return True  # val/test はシャッフルしない
+    sampler_cfg = cfg.get("sampler", None)
+    return sampler_cfg is not None and sampler_cfg.get("type", "random") == "block"
+
+def _build_io_backend(cfg, in_order: bool = True):
+    """
+    画像ファイルの読み込み方法（未指定なら従来どおりローカルから 1 枚ずつ）。
+    in_order: ウィンドウを順に読むローダーか (stream / block sampler / val・test)。False (シャッフル) では
+        次に要求されるウィンドウがほぼ予測できないので、後続ウィンドウを先読みしない
+
+    io:
+      backend: threaded     # local / threaded (ThreadedIO)
+      max_concurrency: 16   # 同時に行う読み込みの上限
+      retries: 3            # OSError の再試行回数
+      retry_delay: 0.05     # 最初の再試行までの待ち時間 [s]（倍々に伸ばす）
+      prefetch_windows: 1   # 先読みする後続ウィンドウ数（順に読むローダーのみ。シャッフルする train では常に 0）
+      delay_ms: 0           # > 0 で DelayedFS（ファイルごとに遅延を入れる検証用のシム）
+      jitter_ms: 0
+      fail_rate: 0.0
+    """
+    io_cfg = cfg.get("io", None)
+    if io_cfg is None or io_cfg.get("backend", "local") == "local":
+        return None
+    if io_cfg.backend != "threaded":
+        raise ValueError(f"Unknown io backend: {io_cfg.backend}")
+    fs = None
+    if io_cfg.get("delay_ms", 0) > 0 or io_cfg.get("fail_rate", 0.0) > 0:
+        fs = DelayedFS(latency=io_cfg.get("delay_ms", 0) / 1e3, jitter=io_cfg.get("jitter_ms", 0) / 1e3,
+                       fail_rate=io_cfg.get("fail_rate", 0.0))
+    prefetch_windows = io_cfg.get("prefetch_windows", None)
+    if not in_order:
+        if prefetch_windows:
+            warnings.warn("[io] prefetch_windows is ignored for shuffled loaders; use sampler.type: block")
+        prefetch_windows = 0
+    elif prefetch_windows is None:
+        prefetch_windows = 1
+    return ThreadedIO(
+        fs=fs,
+        max_concurrency=io_cfg.get("max_concurrency", 16),
+        retries=io_cfg.get("retries", 3),
+        retry_delay=io_cfg.get("retry_delay", 0.05),
+        prefetch_windows=prefetch_windows,
+    )
+
+def _roots(mode: str, cfg, in_order: bool = True) -> list:
+    """
+    データセットのルート一覧（未指定なら従来どおり data_dir と get_seq_ids の 1 ルート）。
+    in_order は _build_io_backend に渡す。
+
+    roots:
+      - name: kitti
+        data_dir: /data/kitti
+        seq_ids:                # 省略時は get_seq_ids(mode)。val/test が無ければ eval を使う
+          train: ["0000", "0001"]
+          eval: ["0017"]
+        index_dir: null         # ルートごとの DatasetIndex
+        io: {backend: threaded} # ルートごとの I/O バックエンド (_build_io_backend と同じ)
+      - name: inhouse
+        data_dir: /mnt/nfs/recordings
+        ...
+    """
+    roots_cfg = cfg.get("roots", None)
+    if not roots_cfg:
+        return [{"name": "default", "data_dir": cfg.data_dir, "seq_ids": get_seq_ids(mode),
+                 "index": _load_index(cfg), "io_backend": _build_io_backend(cfg, in_order)}]
+    roots = []
+    for i, root in enumerate(roots_cfg):
+        seq_ids = root.get("seq_ids", None)
+        if seq_ids is None:
+            seq_ids = get_seq_ids(mode)
+        else:
+            seq_ids = seq_ids.get(mode, None) or (seq_ids.get("eval", None) if mode != "train" else None) or []
+        roots.append({
+            "name": root.get("name", f"root{i}"),
+            "data_dir": root.data_dir,
+            "seq_ids": [str(s) for s in seq_ids],
+            "index": _load_index(root),
+            "io_backend": _build_io_backend(root, in_order),
+        })
+    return roots
+
+def _window_kwargs(mode: str, cfg) -> dict:
+    """
+    ウィンドウの間隔（train のみ。val/test は常に全ウィンドウ）。
+
+    stride: 1                       # seq_len で重複なしのウィンドウ（1 エポックの I/O を最大 1/seq_len に）
+    random_offset_per_epoch: False  # True でエポックごとに開始位置をずらす（set_dataset_epoch / DatasetEpochCallback）
+    """
+    if mode != "train":
+        return {}
+    return {
+        "stride": cfg.get("stride", 1),
+        "random_offset_per_epoch": cfg.get("random_offset_per_epoch", False),
+    }
+
+def set_dataset_epoch(loader, epoch: int):
+    """
+    loader が読む全シーケンスのエポックを設定する（random_offset_per_epoch 用）。
+    ストリームの sampler にも設定する（途中再開の状態を適用するエポックの判定用）。
+    ワーカーのイテレータを作る前（エポック開始前）に呼ぶ。
+    """
+    dataset = loader.dataset
+    if isinstance(dataset, _WorkerTaggedStream):
+        dataset.sampler.set_epoch(epoch)
+        datasets = dataset.sampler.datasets
+    elif isinstance(dataset, ConcatDataset):
+        datasets = dataset.datasets
+    else:
+        datasets = [dataset]
+    for ds in datasets:
+        if hasattr(ds, "set_epoch"):
+            ds.set_epoch(epoch)
+
+def _build_transform(mode: str, cfg):
+    """
+    transform:
+      target_size / rotate_range / zoom_weight
+      engine: sample       # sample: ワーカー内でサンプルごとに Compose (NumPy/cv2)
+                           # batch: collate 後の [B, T, C, H, W] テンソルにまとめて適用 (BatchAugment)
+      buffer_pool: False   # True で transform の出力バッファをワーカー内で使い回す (engine: sample のみ)
+    """
+    transform_cfg = cfg.get("transform", None)
+    if transform_cfg is None or _batch_engine(cfg):
+        return None
+    pool = None
+    if transform_cfg.get("buffer_pool", False):
+        batch_size = cfg.batch_size.train if mode == "train" else cfg.batch_size.eval
+        # collate されるまで batch_size 個のサンプルが同時に生きているため、それより 1 つ多く持つ
+        pool = BufferPool(num_slots=batch_size + 1)
+    return TransformFactory(mode, transform_cfg, pool=pool)
+
+def _build_eval_cache(mode: str, cfg):
+    """
+    val/test 用の変換済みサンプルキャッシュ（train はランダム拡張のため対象外）。
+
+    eval_cache:
+      enabled: False
+      dir: /path/to/cache
+      max_size_gb: null     # cache dir 全体の上限 (LRU で削除)
+      rebuild: False        # True で作り直す
+      num_threads: 8        # 構築時のデコード・変換スレッド数
+      verbose: False        # True でエントリを作るたびに所要時間を表示する
+    """
+    cache_cfg = cfg.get("eval_cache", None)
+    if mode == "train" or cache_cfg is None or not cache_cfg.get("enabled", False):
+        return None
+    transform_cfg = cfg.get("transform", None)
+    transform_desc = {
+        "mode": mode,
+        "transform": None if transform_cfg is None else OmegaConf.to_container(transform_cfg, resolve=True),
+    }
+    return EvalCache(
+        cache_dir=cache_cfg.dir,
+        transform_desc=transform_desc,
+        max_size_gb=cache_cfg.get("max_size_gb", None),
+        rebuild=cache_cfg.get("rebuild", False),
+        num_threads=cache_cfg.get("num_threads", 8),
+        verbose=cache_cfg.get("verbose", False),
+    )
+
+def _loader_kwargs(mode: str, cfg) -> dict:
+    """
+    cfg.hardware からワーカーのライフサイクル・先読み・pin_memory・
+    ワーカー初期化に関する DataLoader 引数を組み立てる。
+
+    hardware:
+      num_workers: {train: int, eval: int}
+      persistent_workers: True   # エポック間でワーカーを再利用（再 fork / 再 open を避ける）
+      prefetch_factor: 2         # ワーカーあたりの先読みバッチ数
+      pin_memory: True
+      cv2_threads: 0             # ワーカー内の OpenCV スレッド数 (null で変更しない)
+      torch_threads: null        # ワーカー内の torch intra-op スレッド数
+      seed: null                 # 指定するとワーカーの base_seed を固定
+    """
+    hw = cfg.hardware
+    num_workers = hw.num_workers.train if mode == "train" else hw.num_workers.eval
+
+    kwargs = {
+        "num_workers": num_workers,
+        "pin_memory": hw.get("pin_memory", True),
+    }
+
+    seed = hw.get("seed", None)
+    if seed is not None:
+        kwargs["generator"] = torch.Generator().manual_seed(int(seed))
+
+    if num_workers > 0:
+        kwargs["persistent_workers"] = hw.get("persistent_workers", True)
+        kwargs["prefetch_factor"] = hw.get("prefetch_factor", 2)
+        kwargs["worker_init_fn"] = partial(
+            worker_init_fn,
+            cv2_threads=hw.get("cv2_threads", 0),
+            torch_threads=hw.get("torch_threads", None),
+        )
+    return kwargs
+
+def _build_collate(mode: str, cfg, collate_fn, streaming: bool = False):
+    """ transform.engine が batch の場合は collate_fn を BatchAugmentCollate で包む """
+    if not _batch_engine(cfg):
+        return collate_fn
+    engine = BatchAugment(mode, cfg.transform, per_sequence=streaming)
+    return BatchAugmentCollate(collate_fn, engine, streaming=streaming)
+
+def _make_loader(cfg, dataset, collate_fn, **kwargs) -> DataLoader:
+    """
+    cfg.instrumentation.enabled が True の場合は ProfiledDataLoader を返す。
+    ワーカー側のステージ時間 (read/decode/transform/collate) はバッチの 'timings' に、
+    コンシューマ側の待ち時間とキュー深さは 'loader' に載る。
+
+    instrumentation:
+      enabled: False
+      trace_path: null         # 指定するとエポック終了ごとに Chrome trace JSON を書き出す
+      max_trace_events: 200000
+    """
+    inst = cfg.get("instrumentation", None)
+    if inst is None or not inst.get("enabled", False):
+        return DataLoader(dataset, collate_fn=collate_fn, **kwargs)
 
-    dataset = build_random_dataset(
-        data_dir=cfg.data_dir,
+    return ProfiledDataLoader(
+        dataset,
+        collate_fn=partial(collate_fn, profile=True),
+        trace_path=inst.get("trace_path", None),
+        max_trace_events=inst.get("max_trace_events", 200_000),
+        **kwargs,
+    )
+
+def _build_sampler(mode: str, cfg, dataset):
+    """
+    train のサンプル順。未指定なら従来どおり shuffle=True（全体シャッフル）。
+
+    sampler:
+      type: block          # ブロック単位シャッフル (BlockShuffleSampler)。DDP では rank ごとに分割
+      block_size: 64       # 1 ブロックの連続ウィンドウ数
+      buffer_size: 256     # ブロックをまたいでシャッフルするバッファのサイズ
+      seed: 0
+
+    sampler:
+      type: weighted       # ラベル統計の重みで抽選 (WeightedWindowSampler)
+      class_weights: {Pedestrian: 3.0, Cyclist: 5.0}  # そのクラスを含むウィンドウに加える重み
+      crowd_threshold: 20  # box 数 (seq_len フレームの延べ数) がこれ以上のウィンドウに crowd_weight を加える
+      crowd_weight: 1.0
+      num_samples: null    # 1 エポックのサンプル数（省略時はウィンドウ数）
+      replacement: True
+      class_names: [...]   # 統計を取るクラス（省略時は KITTI_CLASSES）
+      stats_file: null     # WindowStats の保存先 (.npz)。ウィンドウ数・クラス・ラベルファイルの更新時刻が一致すれば読み込み、
+                           # そうでなければ作り直して保存
+      seed: 0
+    """
+    sampler_cfg = cfg.get("sampler", None)
+    if mode != "train" or sampler_cfg is None or sampler_cfg.get("type", "random") == "random":
+        return None
+    if sampler_cfg.type == "weighted":
+        stats = _load_window_stats(sampler_cfg, dataset)
+        return WeightedWindowSampler(
+            stats.weights(
+                class_weights=_to_dict(sampler_cfg.get("class_weights", None)),
+                crowd_threshold=sampler_cfg.get("crowd_threshold", None),
+                crowd_weight=sampler_cfg.get("crowd_weight", 0.0),
+            ),
+            num_samples=sampler_cfg.get("num_samples", None),
+            replacement=sampler_cfg.get("replacement", True),
+            seed=sampler_cfg.get("seed", 0),
+        )
+    if sampler_cfg.type != "block":
+        raise ValueError(f"Unknown sampler type: {sampler_cfg.type}")
+    return BlockShuffleSampler(
+        dataset,
+        block_size=sampler_cfg.get("block_size", 64),
+        buffer_size=sampler_cfg.get("buffer_size", 256),
+        seed=sampler_cfg.get("seed", 0),
+    )
+
+def _to_dict(value) -> dict:
+    """ 設定の辞書 (DictConfig / dict / None) を dict にする """
+    if isinstance(value, DictConfig):
+        return OmegaConf.to_container(value, resolve=True)
+    return dict(value or {})
+
+def _load_window_stats(sampler_cfg, dataset) -> WindowStats:
+    class_names = tuple(sampler_cfg.get("class_names", None) or KITTI_CLASSES)
+    stats_file = sampler_cfg.get("stats_file", None)
+    if stats_file is not None and Path(stats_file).exists():
+        stats = WindowStats.load(stats_file)
+        if stats.is_current(dataset, class_names):
+            return stats
+    stats = WindowStats.from_dataset(dataset, class_names=class_names)
+    if stats_file is not None:
+        Path(stats_file).parent.mkdir(parents=True, exist_ok=True)
+        stats.save(stats_file)
+    return stats
+
+def _dataset_kwargs(mode: str, cfg) -> dict:
+    """ 全ルートで共通のデータセット引数 """
+    return dict(
         ev_repr_name=cfg.ev_repr_name,
         seq_len=cfg.seq_len,
-        seq_ids=seq_ids,
         downsample=cfg.get("downsample", False),
-        transform=cfg.get("transform", None),
+        transform=_build_transform(mode, cfg),
+        cache=_build_eval_cache(mode, cfg),
+        modalities=_modalities(cfg),
+        event_dtype=cfg.get("event_dtype", None),
+        event_scale=cfg.get("event_scale", 1.0),
+        **_window_kwargs(mode, cfg),
     )
 
-    return DataLoader(
+def build_random_dataloader(mode: Literal["train", "val", "test"], cfg):
+    kwargs = _dataset_kwargs(mode, cfg)
+    roots = _roots(mode, cfg, in_order=_reads_in_order(mode, cfg))
+
+    if cfg.get("roots", None):
+        # 複数ルートは O(1) のグローバルインデックスとルートごとのスループット集計を持つ MultiRootDataset に
+        parts = [
+            (root["name"], build_random_dataset(data_dir=root["data_dir"], seq_ids=root["seq_ids"],
+                                                index=root["index"], io_backend=root["io_backend"],
+                                                **kwargs).datasets)
+            for root in roots if root["seq_ids"]
+        ]
+        dataset = MultiRootDataset(parts, num_workers=_loader_kwargs(mode, cfg)["num_workers"])
+    else:
+        root = roots[0]
+        dataset = build_random_dataset(data_dir=root["data_dir"], seq_ids=root["seq_ids"],
+                                       index=root["index"], io_backend=root["io_backend"], **kwargs)
+
+    sampler = _build_sampler(mode, cfg, dataset)
+    return _make_loader(
+        cfg,
         dataset,
+        _build_collate(mode, cfg, custom_collate_rnd),
         batch_size=cfg.batch_size.train if mode == "train" else cfg.batch_size.eval,
-        shuffle=(mode == "train"),
+        sampler=sampler,
+        shuffle=(mode == "train" and sampler is None),
         drop_last=(mode == "train"),
-        num_workers=cfg.hardware.num_workers.train if mode == "train" else cfg.hardware.num_workers.eval,
-        pin_memory=True,
-        collate_fn=custom_collate_rnd,
+        **_loader_kwargs(mode, cfg),
     )
 
+class _WorkerTaggedStream(IterableDataset):
+    """
+    sampler が返すバッチに worker_id と、そのバッチ直後の sampler の状態（途中再開用）を付与する IterableDataset。
+    throughput: 複数ルートのときのルートごとの集計 (RootThroughput)。LoaderStatsCallback が読む
+    """
+    def __init__(self, sampler, throughput=None):
+        self.sampler = sampler
+        self.throughput = throughput
+
+    def __iter__(self):
+        worker_info = get_worker_info()
+        worker_id = 0 if worker_info is None else worker_info.id
+        for batch in self.sampler:
+            yield batch, worker_id, self.sampler.state_dict()
+
 def build_stream_dataloader(mode: Literal["train", "val", "test"],
                              cfg) -> DataLoader:
-    seq_ids = get_seq_ids(mode)
-
-    datasets = build_stream_datasets(
-        data_dir=cfg.data_dir,
-        ev_repr_name=cfg.ev_repr_name,
-        seq_len=cfg.seq_len,
-        seq_ids=seq_ids,
-        downsample=cfg.get("downsample", False),
-        transform=cfg.get("transform", None),
-    )
+    kwargs = _dataset_kwargs(mode, cfg)
+    loader_kwargs = _loader_kwargs(mode, cfg)
+    roots = [root for root in _roots(mode, cfg) if root["seq_ids"]]
+    # 複数ルートではランダムアクセスの MultiRootDataset と同様に、ルートごとのスループットを集計する
+    throughput = (RootThroughput([root["name"] for root in roots], loader_kwargs["num_workers"])
+                  if cfg.get("roots", None) else None)
+    datasets = []
+    for r, root in enumerate(roots):
+        seqs = build_stream_datasets(
+            data_dir=root["data_dir"],
+            seq_ids=root["seq_ids"],
+            tag_sequence=_batch_engine(cfg) and mode == "train",
+            index=root["index"],
+            io_backend=root["io_backend"],
+            **kwargs,
+        )
+        if throughput is not None:
+            seqs = [RootTaggedSequence(ds, r, throughput) for ds in seqs]
+        datasets += seqs
 
     # Sampler selection
     if mode == "train":
@@ -52,16 +427,10 @@ def build_stream_dataloader(mode: Literal["train", "val", "test"],
     else:
         sampler = ShardedSequenceSampler(datasets, batch_size=cfg.batch_size.eval)
 
-    def _wrapped_iter():
-        worker_info = get_worker_info()
-        worker_id = 0 if worker_info is None else worker_info.id
-        for batch in sampler:
-            yield batch, worker_id
-
-    return DataLoader(
-        dataset=_wrapped_iter(),
+    return _make_loader(
+        cfg,
+        _WorkerTaggedStream(sampler, throughput),
+        _build_collate(mode, cfg, custom_collate_streaming, streaming=True),
         batch_size=None,
-        num_workers=cfg.hardware.num_workers.train if mode == "train" else cfg.hardware.num_workers.eval,
-        pin_memory=True,
-        collate_fn=custom_collate_streaming,
+        **loader_kwargs,
     )
@@ -1,5 +1,6 @@
 from pathlib import Path
-from src.data.sequence_map import SequenceForMap
+from src.data.sequence_map import MODALITIES, SequenceForMap
+from src.data.utils.transform_factory import RandomTransform, TransformFactory
 from torch.utils.data import ConcatDataset
 
 def get_seq_ids(mode: str):
@@ -9,18 +10,44 @@ def get_seq_ids(mode: str):
         return [f"{i:04d}" for i in range(17, 21)]
 
 def build_random_dataset(data_dir, ev_repr_name, seq_len, seq_ids,
-                         downsample=False, transform=None):
-    return ConcatDataset([
+                         downsample=False, transform=None, cache=None,
+                         modalities=MODALITIES, event_dtype=None, event_scale=1.0,
+                         stride=1, random_offset_per_epoch=False, index=None, io_backend=None):
+    """
+    transform に TransformFactory を渡した場合は、サンプルごとに build_for_random() で再構築する。
+    cache (EvalCache) を渡した場合は、変換済みサンプルのディスクキャッシュから読む（val/test 用）。
+    modalities に含まれないモダリティは読み込まない（SequenceForMap 参照）。
+    event_dtype / event_scale: イベントのコンパクトな dtype と量子化スケール（SequenceForMap 参照）。
+    stride / random_offset_per_epoch: ウィンドウの間隔とエポックごとの開始位置のずらし（SequenceWindows 参照）。
+    index: DatasetIndex。検証でエラーになったシーケンスは除き、残りはインデックスから即座に構築する。
+    io_backend: 画像の読み込み方法（None でローカルから逐次、ThreadedIO で並行。SequenceForMap 参照）。
+    """
+    if index is not None:
+        seq_ids = index.filter(seq_ids)
+    if isinstance(transform, TransformFactory):
+        transform = RandomTransform(transform)
+
+    datasets = [
         SequenceForMap(
             data_dir=data_dir,
             sequence_name=seq_id,
             ev_repr_name=ev_repr_name,
             seq_len=seq_len,
             downsample=downsample,
-            transform=transform
+            transform=transform,
+            modalities=modalities,
+            event_dtype=event_dtype,
+            event_scale=event_scale,
+            stride=stride,
+            random_offset_per_epoch=random_offset_per_epoch,
+            index=index,
+            io_backend=io_backend
         )
         for seq_id in seq_ids
-    ])
+    ]
+    if cache is not None:
+        datasets = [cache.wrap(ds) for ds in datasets]
+    return ConcatDataset(datasets)
 
 
 # 🌀 ストリーム用（各シーケンスを個別に返す）
@@ -29,15 +56,45 @@ def build_stream_datasets(data_dir: Path,
                            seq_len: int,
                            seq_ids: list[str],
                            downsample: bool = False,
-                           transform=None):
-    return [
+                           transform=None,
+                           cache=None,
+                           modalities=MODALITIES,
+                           tag_sequence=False,
+                           event_dtype=None,
+                           event_scale=1.0,
+                           stride=1,
+                           random_offset_per_epoch=False,
+                           index=None,
+                           io_backend=None):
+    """
+    transform に TransformFactory を渡した場合は、シーケンスごとに build_for_stream(seq_id) で
+    一貫した transform を構築する。
+    tag_sequence: サンプルに 'sequence_name' を付与する（SequenceForMap 参照）
+    index: DatasetIndex (build_random_dataset 参照)
+    io_backend: 画像の読み込み方法 (build_random_dataset 参照)
+    """
+    if index is not None:
+        seq_ids = index.filter(seq_ids)
+    datasets = [
         SequenceForMap(
             data_dir=data_dir,
             sequence_name=seq_id,
             ev_repr_name=ev_repr_name,
             seq_len=seq_len,
             downsample=downsample,
-            transform=transform
+            transform=transform.build_for_stream(seq_id)
+            if isinstance(transform, TransformFactory) else transform,
+            modalities=modalities,
+            tag_sequence=tag_sequence,
+            event_dtype=event_dtype,
+            event_scale=event_scale,
+            stride=stride,
+            random_offset_per_epoch=random_offset_per_epoch,
+            index=index,
+            io_backend=io_backend
         )
         for seq_id in seq_ids
-    ]
\ No newline at end of file
+    ]
+    if cache is not None:
+        datasets = [cache.wrap(ds) for ds in datasets]
+    return datasets
@@ -0,0 +1,201 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import h5py
+import numpy as np
+
+from src.data.sequence_map import MODALITIES, SequenceForMap
+from src.data.utils.dataset_index import scan_image_dir
+
+_END = object()
+
+
+class OnlineSequenceReader:
+    def __init__(self, data_dir: Path, sequence_name: str, ev_repr_name: str,
+                 downsample: bool = False, transform=None, modalities=MODALITIES,
+                 history: int = 1, prefetch: int = 2, num_threads: int = 2,
+                 event_dtype: str = None, event_scale: float = 1.0, index=None,
+                 start_frame: int = 0, follow: bool = False,
+                 poll_interval: float = 0.05, follow_timeout: float = 5.0):
+        """
+        推論用に、シーケンスのフレームを 1 枚ずつ順に返すリーダー。
+
+        SequenceForMap と同じディレクトリ構成を読むが、seq_len のウィンドウではなく
+        各フレーム (image, event, labels) を一度だけ読み、直近 history フレームを
+        リングバッファ (self.history) に保持する。
+
+        バックグラウンドスレッドがファイル読み込み (read) を行い、デコードと transform は
+        num_threads のスレッドプールで並行に処理する。先読みは prefetch フレームまでに
+        制限するので、消費が遅くても古いフレームが溜まり続けることはない。
+
+        Parameters:
+            transform: 1 フレームのサンプル（T=1 の images / events / labels）に適用する
+                transform（TransformFactory("val", ...).build_for_random() など）。
+                history のフレームが同じバッファを指さないように、pool なしで構築したものを渡す
+            history: 保持する直近フレーム数
+            prefetch: 先読みするフレーム数の上限（遅延の上限）
+            start_frame: 読み始めるフレーム
+            follow: True で、既存フレームを読み終えた後も新しい画像・イベントの追加を
+                poll_interval ごとに確認し、follow_timeout 秒追加がなければ終了する
+                （ラベルは開始時に読んだもののみ）
+        """
+        # メタデータ（画像一覧・フレーム数・ラベル）と I/O の処理は SequenceForMap を使う
+        self.source = SequenceForMap(data_dir, sequence_name, ev_repr_name, seq_len=1,
+                                     downsample=downsample, modalities=modalities,
+                                     event_dtype=event_dtype, event_scale=event_scale, index=index)
+        self.modalities = self.source.modalities
+        self.transform = transform
+        self.history = deque(maxlen=history)
+        self.prefetch = prefetch
+        self.num_threads = num_threads
+        self.start_frame = start_frame
+        self.follow = follow
+        self.poll_interval = poll_interval
+        self.follow_timeout = follow_timeout
+
+        # フレームごとの遅延 [s]（read 開始から利用側に渡すまで）と、そのうち利用側を待った時間
+        self.latencies = []
+        self.waits = []
+
+    def __len__(self):
+        return max(0, self.source.total_frames - self.start_frame)
+
+    def _open_events(self):
+        return h5py.File(self.source.event_file, "r") if "events" in self.modalities else None
+
+    def _refresh(self, f):
+        """ follow 用に画像ディレクトリと HDF5 を開き直し、(HDF5, 読めるフレーム数) を返す """
+        src = self.source
+        src.image_ids, src.image_name_format, src.image_names = scan_image_dir(src.images_dir)
+        if f is not None:
+            f.close()
+            f = self._open_events()
+            src.num_event_frames = f["data"].shape[0]
+        src.total_frames = src.count_frames()  # events を読まない場合は画像の枚数だけで決まる
+        return f, src.total_frames
+
+    def _read(self, f, index: int) -> dict:
+        """ read ステージ: 画像ファイルのバイト列とイベント 1 フレームを読む """
+        raw = {"frame_index": index, "t_start": time.perf_counter()}
+        if "images" in self.modalities:
+            raw["image_bytes"] = np.fromfile(self.source._image_path(index), dtype=np.uint8)
+        if "events" in self.modalities:
+            raw["events"] = np.array(f["data"][index:index + 1])
+        return raw
+
+    def _decode(self, raw: dict) -> dict:
+        """ decode / transform ステージ（スレッドプール上で実行） """
+        src = self.source
+        sample = {}
+        if "images" in self.modalities:
+            sample["images"] = src._decode_image(raw["image_bytes"])[None]  # [1, C, H, W]
+        else:
+            sample["image_size"] = src.image_size.copy()
+        if "labels" in self.modalities:
+            sample["labels"] = [src.labels.frame(raw["frame_index"])]
+        if "events" in self.modalities:
+            sample["events"], scale = src._convert_events(raw["events"])
+            if src.event_dtype is not None:
+                sample["event_scale"] = np.float32(scale)
+
+        if self.transform:
+            sample = self.transform(sample)
+
+        # T=1 の次元を外して 1 フレームの形にする
+        frame = {"frame_index": raw["frame_index"], "t_start": raw["t_start"]}
+        for key, value in sample.items():
+            frame[key] = value[0] if key in ("images", "events", "labels") else value
+        return frame
+
+    def _produce(self, pool, out: queue.Queue, stop: threading.Event):
+        f = self._open_events()
+        try:
+            index = self.start_frame
+            idle_since = None
+            while not stop.is_set():
+                if index >= self.source.total_frames:
+                    if not self.follow:
+                        break
+                    f, total = self._refresh(f)
+                    if total > index:
+                        idle_since = None
+                        continue
+                    idle_since = idle_since or time.perf_counter()
+                    if time.perf_counter() - idle_since > self.follow_timeout:
+                        break
+                    time.sleep(self.poll_interval)
+                    continue
+                future = pool.submit(self._decode, self._read(f, index))
+                # キューが一杯なら空くまで待つ（先読みを prefetch フレームに制限）
+                while not stop.is_set():
+                    try:
+                        out.put(future, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+                index += 1
+        except Exception as e:
+            out.put(e)
+        finally:
+            if f is not None:
+                f.close()
+            out.put(_END)
+
+    def __iter__(self):
+        """ フレームを順に返す。各フレームは dict (frame_index, images [C, H, W], events [C, H, W], labels, ...) """
+        self.history.clear()
+        out = queue.Queue(maxsize=max(1, self.prefetch))
+        stop = threading.Event()
+        pool = ThreadPoolExecutor(max_workers=max(1, self.num_threads), thread_name_prefix="online_reader")
+        producer = threading.Thread(target=self._produce, args=(pool, out, stop), daemon=True)
+        producer.start()
+        try:
+            first = True
+            while True:
+                t_wait = time.perf_counter()
+                item = out.get()
+                if item is _END:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                frame = item.result()
+                now = time.perf_counter()
+                self.waits.append(now - t_wait)
+                self.latencies.append(now - frame.pop("t_start"))
+                frame["reset_state"] = first
+                first = False
+                self.history.append(frame)
+                yield frame
+        finally:
+            stop.set()
+            # 生産側がキューの空きを待っていれば解放する
+            while producer.is_alive():
+                try:
+                    out.get_nowait()
+                except queue.Empty:
+                    producer.join(timeout=0.01)
+            pool.shutdown(wait=True)
+
+    def history_stack(self, key: str) -> np.ndarray:
+        """ 保持している直近フレームの key を古い順に積み上げた配列 [T, ...] """
+        return np.stack([frame[key] for frame in self.history])
+
+    def latency_stats(self, percentiles=(50, 90, 99)) -> dict:
+        """ フレームごとの遅延 [ms] のパーセンタイル。wait は利用側がフレームを待った時間 """
+        if not self.latencies:
+            return {}
+        stats = {"frames": len(self.latencies)}
+        for name, values in (("latency", self.latencies), ("wait", self.waits)):
+            values = np.asarray(values) * 1e3
+            stats[f"{name}_mean_ms"] = float(values.mean())
+            for p in percentiles:
+                stats[f"{name}_p{p}_ms"] = float(np.percentile(values, p))
+        return stats
+
+    def reset_stats(self):
+        self.latencies.clear()
+        self.waits.clear()
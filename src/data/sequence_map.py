@@ -1,100 +1,275 @@
+import zlib
 import numpy as np
 from pathlib import Path
 import h5py
 import cv2
+import torch
 from torch.utils.data import Dataset
-from collections import defaultdict
+from src.data.utils.dataset_index import scan_image_dir
+from src.data.utils.label_table import LabelTable
+from src.data.utils.event_quant import event_dtype as _event_dtype, quantize_events
+from src.data.utils.profiling import StageTimer
+
+MODALITIES = ("images", "events", "labels")
+
+
+class SequenceWindows:
+    def __init__(self, total_frames: int, seq_len: int, stride: int = 1,
+                 random_offset_per_epoch: bool = False, seed_key: str = ""):
+        """
+        シーケンス内のウィンドウ (seq_len フレーム) の開始フレームを決める。
+
+        ウィンドウ k の開始フレームは offset + k * stride。stride = seq_len で重複なし
+        （1 エポックの I/O が最大 seq_len 分の 1）。
+        random_offset_per_epoch=True では offset を [0, max_offset] からエポックごとに選び、
+        エポックをまたいで全フレームを使う。ウィンドウ数はどの offset でも収まる数に固定し
+        （__len__ がエポックで変わらないように）、max_offset はその数のウィンドウを末尾に寄せたときの
+        offset (total_frames - seq_len - (len - 1) * stride) にする（stride - 1 で打ち切ると、
+        割り切れずに余る末尾のフレームがどのエポックでも読まれない）。
+
+        エポックは共有メモリのテンソルに持つので、DataLoader の（persistent な）ワーカー内の
+        コピーにも set_epoch() が反映される（offset をずらさない場合は持たない）。
+        """
+        assert stride >= 1
+        self.seq_len = seq_len
+        self.stride = stride
+        self.random_offset_per_epoch = random_offset_per_epoch and stride > 1
+        self.seed_key = zlib.crc32(str(seed_key).encode())
+        min_slack = stride - 1 if self.random_offset_per_epoch else 0
+        self.length = max(0, (total_frames - seq_len - min_slack) // stride + 1)
+        self.max_offset = 0
+        if self.random_offset_per_epoch and self.length > 0:
+            self.max_offset = total_frames - seq_len - (self.length - 1) * stride
+        self._epoch = torch.zeros(1, dtype=torch.int64).share_memory_() if self.random_offset_per_epoch else None
+
+    def __len__(self):
+        return self.length
+
+    def set_epoch(self, epoch: int):
+        if self._epoch is not None:
+            self._epoch[0] = epoch
+
+    def offset(self) -> int:
+        if not self.random_offset_per_epoch:
+            return 0
+        rng = np.random.default_rng([self.seed_key, int(self._epoch[0])])
+        return int(rng.integers(self.max_offset + 1))
+
+    def start(self, index: int) -> int:
+        """ ウィンドウ index の開始フレーム """
+        if index < 0 or index >= self.length:
+            raise IndexError(index)  # iter(ds) で最後のウィンドウの後に止まるように
+        return self.offset() + index * self.stride
+
+    def reset_state(self, index: int) -> bool:
+        # ウィンドウ間にフレームの抜けがある (stride > seq_len) 場合は毎回状態をリセットする
+        return index == 0 or self.stride > self.seq_len
 
 
 class SequenceForMap(Dataset):
     def __init__(self, data_dir: Path, sequence_name: str, ev_repr_name: str,
-                 seq_len: int, downsample: bool = False, transform=None):
-        self.data_dir = data_dir
+                 seq_len: int, downsample: bool = False, transform=None,
+                 modalities=MODALITIES, tag_sequence: bool = False,
+                 event_dtype: str = None, event_scale: float = 1.0,
+                 stride: int = 1, random_offset_per_epoch: bool = False, index=None,
+                 io_backend=None):
+        """
+        io_backend: 画像ファイルの読み込み方法。None (既定) はローカルディスクから 1 枚ずつ読む。
+            ThreadedIO を渡すと、ウィンドウの全フレームと後続ウィンドウの画像を並行に読む
+            （ネットワーク越しのファイルシステム向け）
+        index: DatasetIndex (scripts/scan_dataset.py の出力)。エントリが最新なら、そこから
+            画像ファイル・フレーム数・ラベルを読み、起動時のスキャンを省略する
+        stride: ウィンドウの開始フレームの間隔（1 で従来どおり全ウィンドウ、seq_len で重複なし）
+        random_offset_per_epoch: ウィンドウの開始位置をエポックごとにずらす（SequenceWindows 参照）。
+            エポックは set_epoch() で設定する
+        event_dtype: None / 'uint8' / 'float16'。指定するとイベントをこの dtype で読み出し・転送し、
+            サンプルに 'event_scale' (元の値 ≈ events * event_scale) を付与する。
+            HDF5 が既にこの dtype で保存されている場合 (scripts/compact_events.py) は、
+            ファイルの data.attrs['scale'] をそのまま使う。それ以外は event_scale で量子化する。
+            None では、スケール付きで保存されたファイルも元の単位 (float32) に戻して返す。
+        tag_sequence: True でサンプルに 'sequence_name' を付与する（collate 後に
+            シーケンス単位の処理を行う BatchAugment(per_sequence=True) 用）
+        modalities: 読み込むモダリティ ("images", "events", "labels" の部分集合)。
+            含まれないモダリティは I/O・デコード・transform を一切行わず、サンプルにもキーを含めない。
+            events を含まない場合は HDF5 を開かず、フレーム数は画像の枚数で決まる。
+            images を読まない場合は、bbox 変換用に元画像サイズ 'image_size' ([H, W]) を付与する。
+        """
+        unknown = set(modalities) - set(MODALITIES)
+        if unknown or not modalities:
+            raise ValueError(f"modalities must be a non-empty subset of {MODALITIES}: {modalities}")
+        self.modalities = tuple(m for m in MODALITIES if m in modalities)
+
+        self.data_dir = Path(data_dir)
         self.sequence_name = sequence_name
         self.ev_repr_name = ev_repr_name
         self.seq_len = seq_len
         self.downsample = downsample
         self.transform = transform
+        self.tag_sequence = tag_sequence
+        self.event_dtype = _event_dtype(event_dtype)
+        self.event_scale = event_scale
+        self.io_backend = io_backend
 
         self.images_dir = self.data_dir / "images" / sequence_name
         self.labels_file = self.data_dir / "labels" / f"{sequence_name}.txt"
         self.events_dir = self.data_dir / "preprocessed" / ev_repr_name
         self.event_file = self.events_dir / f"{sequence_name}.h5"
 
-        self.image_files = sorted(self.images_dir.glob("*.png"), key=lambda p: int(p.stem))
-        with h5py.File(self.event_file, "r") as f:
-            self.num_event_frames = f["data"].shape[0]
+        entry = index.entry(self.data_dir, sequence_name, ev_repr_name) if index is not None else None
+        if entry is not None:
+            # 検証済みインデックス (scripts/scan_dataset.py) があれば、glob / HDF5 / ラベルのパースを省略する
+            ids = entry["image_ids"]
+            self.image_ids = (range(ids["start"], ids["start"] + ids["count"]) if isinstance(ids, dict)
+                              else np.array(ids, dtype=np.int64))
+            self.image_name_format = entry["image_name_format"]
+            self.image_names = None if entry["image_names"] is None else np.array(entry["image_names"])
+            self.num_event_frames = entry["num_event_frames"]
+            self.stored_event_scale = entry["event_scale"]
+        else:
+            self.image_ids, self.image_name_format, self.image_names = scan_image_dir(self.images_dir)
+            self.num_event_frames, self.stored_event_scale = None, 1.0
+            if "events" in self.modalities:
+                with h5py.File(self.event_file, "r") as f:
+                    self.num_event_frames = f["data"].shape[0]
+                    self.stored_event_scale = float(f["data"].attrs.get("scale", 1.0))
+        if "events" not in self.modalities:
+            self.num_event_frames = None  # events を読まない場合は HDF5 を開かず、フレーム数も画像だけで決める
 
-        self.total_frames = min(len(self.image_files), self.num_event_frames)
-        self.length = self.total_frames - seq_len + 1
+        self.total_frames = self.count_frames()
+        self.windows = SequenceWindows(self.total_frames, seq_len, stride=stride,
+                                       random_offset_per_epoch=random_offset_per_epoch,
+                                       seed_key=sequence_name)
+        self.length = len(self.windows)
 
-        self.labels = self._load_labels()
+        # フレームごとのラベルは LabelTable (数値配列) で持つ
+        if "labels" not in self.modalities:
+            self.labels = LabelTable.empty(self.total_frames)
+        elif entry is not None:
+            self.labels = index.labels(sequence_name, self.total_frames, downsample=downsample)
+        else:
+            self.labels = self._load_labels()
+
+        self.image_size = None
+        if "images" not in self.modalities:
+            self.image_size = self._probe_image_size() if entry is None else self._scaled_size(entry["image_size"])
 
     def __len__(self):
         return self.length
 
+    def set_epoch(self, epoch: int):
+        self.windows.set_epoch(epoch)
+
+    def count_frames(self) -> int:
+        """ 読めるフレーム数（画像と、events を読む場合はイベントのフレーム数の小さい方） """
+        if self.num_event_frames is None:
+            return self.num_image_files
+        return min(self.num_image_files, self.num_event_frames)
+
     def _load_labels(self):
-        if not self.labels_file.exists():
-            raise FileNotFoundError(f"ラベルファイルが見つかりません: {self.labels_file}")
-
-        labels_per_frame = defaultdict(list)
-        with open(self.labels_file, 'r') as f:
-            for line in f:
-                fields = line.strip().split()
-                if not fields:
-                    continue
-                try:
-                    frame = int(fields[0])
-                    bbox = list(map(float, fields[6:10]))
-                    if self.downsample:
-                        bbox = [coord / 2 for coord in bbox]
-
-                    label = {
-                        "track_id": int(fields[1]),
-                        "type": fields[2],
-                        "truncated": float(fields[3]),
-                        "occluded": int(fields[4]),
-                        "alpha": float(fields[5]),
-                        "bbox": bbox,
-                        "dimensions": list(map(float, fields[10:13])),
-                        "location": list(map(float, fields[13:16])),
-                        "rotation_y": float(fields[16])
-                    }
-                    labels_per_frame[frame].append(label)
-                except Exception as e:
-                    raise ValueError(f"ラベル行のパースに失敗しました: {line}\nエラー: {e}")
-        return labels_per_frame
+        return LabelTable.from_kitti_file(self.labels_file, self.total_frames, downsample=self.downsample)
 
-    def _load_image(self, index: int):
-        path = self.image_files[index]
-        img = cv2.imread(str(path))
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    @property
+    def num_image_files(self) -> int:
+        return len(self.image_ids)
+
+    def _image_path(self, index: int) -> str:
+        if self.image_names is not None:
+            return str(self.images_dir / self.image_names[index])
+        return str(self.images_dir / self.image_name_format.format(self.image_ids[index]))
+
+    def _probe_image_size(self):
+        """ images を読まない場合に、先頭フレームから (downsample 後の) 画像サイズを一度だけ取得 """
+        img = cv2.imread(self._image_path(0))
+        return self._scaled_size(img.shape[:2])
+
+    def _scaled_size(self, size):
+        h, w = size
         if self.downsample:
-            h, w = img.shape[:2]
-            img = cv2.resize(img, (w // 2, h // 2))
-        img = np.transpose(img, (2, 0, 1))  # [C, H, W]
+            h, w = h // 2, w // 2
+        return np.array([h, w], dtype=np.int64)
+
+    def _frame_labels(self, index: int):
+        # 毎回新しい辞書を作るので、transform が bbox を書き換えても保持しているラベルは変わらない
+        return self.labels.frame(index)
+
+    def _read_events(self, start: int, stop: int):
+        """ HDF5 から [start, stop) のイベントを読み、event_dtype に変換して (events, scale) を返す """
+        with h5py.File(self.event_file, 'r') as f:
+            events = np.array(f["data"][start:stop])
+        return self._convert_events(events)
+
+    def _convert_events(self, events: np.ndarray):
+        """
+        HDF5 から読んだイベントを event_dtype に変換し、(events, scale) を返す。
+        event_dtype が None で、ファイルがスケール付きで保存されている (scripts/compact_events.py) 場合は
+        元の単位の float32 に戻す（サンプルに event_scale を付けないので、ここで掛けておく）。
+        """
+        scale = self.stored_event_scale
+        if self.event_dtype is None:
+            if scale != 1.0:
+                events = events.astype(np.float32) * np.float32(scale)
+            return events, 1.0
+        if events.dtype != self.event_dtype:
+            if scale != 1.0:
+                events = events.astype(np.float32) * np.float32(scale)
+            events = quantize_events(events, self.event_dtype, self.event_scale)
+            scale = self.event_scale
+        return events, scale
+
+    def _load_image(self, index: int):
+        path = self._image_path(index)
+        # 計測のため、ファイル読み込み (read) とデコード (decode) を分けて行う
+        with StageTimer("read"):
+            buf = np.fromfile(str(path), dtype=np.uint8)
+        return self._decode_image(buf)
+
+    def _decode_image(self, buf: np.ndarray):
+        with StageTimer("decode"):
+            img = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+            if self.downsample:
+                h, w = img.shape[:2]
+                img = cv2.resize(img, (w // 2, h // 2))
+            img = np.transpose(img, (2, 0, 1))  # [C, H, W]
         return img
 
+    def _load_images(self, index: int, frames: range):
+        """ ウィンドウの画像 [T, C, H, W]。io_backend があれば、後続ウィンドウの分も合わせて並行に読む """
+        if self.io_backend is None:
+            return np.stack([self._load_image(i) for i in frames])
+        prefetch = []
+        for k in range(index + 1, min(index + 1 + self.io_backend.prefetch_windows, self.length)):
+            start = self.windows.start(k)
+            prefetch += [self._image_path(i) for i in range(max(start, frames.stop), start + self.seq_len)]
+        with StageTimer("read"):
+            bufs = self.io_backend.read_many([self._image_path(i) for i in frames], prefetch=prefetch)
+        return np.stack([self._decode_image(buf) for buf in bufs])
+
     def __getitem__(self, index: int):
-        images = []
-        labels_seq = []
-        for i in range(index, index + self.seq_len):
-            images.append(self._load_image(i))
-            labels_seq.append(self.labels.get(i, []))  # ラベルがない場合は空リスト
+        start = self.windows.start(index)
+        frames = range(start, start + self.seq_len)
+        sample = {}
 
-        images = np.stack(images)  # [T, C, H, W]
+        if "images" in self.modalities:
+            sample["images"] = self._load_images(index, frames)  # [T, C, H, W]
+        else:
+            sample["image_size"] = self.image_size.copy()
 
-        with h5py.File(self.event_file, 'r') as f:
-            events = np.array(f["data"][index : index + self.seq_len])
+        if "labels" in self.modalities:
+            sample["labels"] = [self._frame_labels(i) for i in frames]  # ラベルがない場合は空リスト
+
+        if "events" in self.modalities:
+            with StageTimer("read"):
+                sample["events"], scale = self._read_events(start, start + self.seq_len)
+            if self.event_dtype is not None:
+                sample["event_scale"] = np.float32(scale)
 
-        sample = {
-            "images": images,
-            "labels": labels_seq,
-            "events": events,
-            "reset_state": index == 0
-        }
+        sample["reset_state"] = self.windows.reset_state(index)
+        if self.tag_sequence:
+            sample["sequence_name"] = self.sequence_name
 
         if self.transform:
-            sample = self.transform(sample)
+            with StageTimer("transform"):
+                sample = self.transform(sample)
 
         return sample
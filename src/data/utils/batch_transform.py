@@ -0,0 +1,251 @@
+# data/utils/batch_transform.py
+import math
+import random
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from src.data.utils.profiling import StageTimer
+
+
+def _translate(tx, ty):
+    return np.array([[1.0, 0.0, tx], [0.0, 1.0, ty], [0.0, 0.0, 1.0]])
+
+
+def _scale(sx, sy):
+    return np.array([[sx, 0.0, 0.0], [0.0, sy, 0.0], [0.0, 0.0, 1.0]])
+
+
+def _rotation(angle, cx, cy):
+    """ cv2.getRotationMatrix2D と同じ向き（正値で反時計回り）の 3x3 行列 """
+    m = np.eye(3)
+    m[:2] = np.array([
+        [math.cos(math.radians(angle)), math.sin(math.radians(angle)), 0.0],
+        [-math.sin(math.radians(angle)), math.cos(math.radians(angle)), 0.0],
+    ])
+    return _translate(cx, cy) @ m @ _translate(-cx, -cy)
+
+
+def _box_center(boxes: np.ndarray):
+    if len(boxes) == 0:
+        return None
+    cx = int(np.mean((boxes[:, 0] + boxes[:, 2]) / 2))
+    cy = int(np.mean((boxes[:, 1] + boxes[:, 3]) / 2))
+    return cx, cy
+
+
+def _apply_to_boxes(matrix: np.ndarray, boxes: np.ndarray, W: int, H: int):
+    """ bbox の 4 頂点を変換し、外接矩形を [0, W] x [0, H] にクリップする """
+    if len(boxes) == 0:
+        return boxes, np.zeros(0, dtype=bool)
+    xs = boxes[:, [0, 2, 0, 2]]
+    ys = boxes[:, [1, 1, 3, 3]]
+    tx = matrix[0, 0] * xs + matrix[0, 1] * ys + matrix[0, 2]
+    ty = matrix[1, 0] * xs + matrix[1, 1] * ys + matrix[1, 2]
+    out = np.stack([
+        np.clip(tx.min(1), 0, W), np.clip(ty.min(1), 0, H),
+        np.clip(tx.max(1), 0, W), np.clip(ty.max(1), 0, H),
+    ], axis=1)
+    keep = (out[:, 2] > out[:, 0]) & (out[:, 3] > out[:, 1])
+    return out, keep
+
+
+class BatchAugment:
+    def __init__(self, mode: str, transform_cfg, per_sequence: bool = False,
+                 in_scale=(1.0, 1.5), out_scale=(1.0, 1.2), center_margin_ratio=0.2,
+                 image_mode: str = "bilinear", event_mode: str = "bilinear"):
+        """
+        collate 後の [B, T, C, H, W] テンソルに対して resize / flip / rotate / zoom を
+        サンプルごとのパラメータで一括適用するエンジン（TransformFactory の代替）。
+
+        各サンプルの変換を 1 つのアフィン行列に合成し、affine_grid / grid_sample で
+        バッチ全体を 1 回で補間する。補間は torch の intra-op スレッドで並列化される
+        （ワーカー内のスレッド数は hardware.torch_threads で指定）。
+
+        per-sample の Compose との違い:
+            - パラメータはウィンドウ (T フレーム) 単位で、ズーム中心は先頭フレームのラベルから決める
+            - 画像外の領域は 0 埋め（Rotate の 114 埋めではない）
+            - bbox は変換後の外接矩形をクリップし、潰れた bbox は捨てる
+
+        Parameters:
+            mode: train では resize/flip/rotate/zoom、val/test では resize のみ
+            transform_cfg: TransformFactory と同じ transform 設定 (target_size, rotate_range, zoom_weight)
+            per_sequence: True でシーケンス名から決まる一貫したパラメータを使う（Streaming 用）。
+                サンプルに 'sequence_name' が必要
+        """
+        assert mode in ["train", "test", "val"], f"Invalid mode: {mode}"
+        self.mode = mode
+        self.target_size = tuple(transform_cfg.get("target_size"))
+        self.rotate_range = transform_cfg.get("rotate_range", None)
+        self.zoom_weight = transform_cfg.get("zoom_weight", None)
+        self.per_sequence = per_sequence
+        self.in_scale = in_scale
+        self.out_scale = out_scale
+        self.center_margin_ratio = center_margin_ratio
+        self.image_mode = image_mode
+        self.event_mode = event_mode
+        self._sequence_params = {}
+
+    # ---------------------------------------------------------------
+    # パラメータ
+    # ---------------------------------------------------------------
+    def _draw_params(self, rng: random.Random):
+        zoom_type = rng.choices(["in", "out"], weights=self.zoom_weight, k=1)[0]
+        return {
+            "hflip": rng.random() < 0.5,
+            "angle": rng.uniform(*self.rotate_range) if self.rotate_range else 0.0,
+            "zoom_type": zoom_type,
+            "scale": rng.uniform(*(self.in_scale if zoom_type == "in" else self.out_scale)),
+            "center": None,
+            "rng": rng,
+        }
+
+    def _params_for(self, sample: dict):
+        if self.mode != "train":
+            return None
+        if not self.per_sequence:
+            return self._draw_params(random.Random(random.getrandbits(64)))
+        seq = sample["sequence_name"]
+        if seq not in self._sequence_params:
+            self._sequence_params[seq] = self._draw_params(random.Random(int(seq)))
+        return self._sequence_params[seq]
+
+    def _geometry(self, params, H: int, W: int, first_boxes: np.ndarray):
+        """ (resize 後の) target 座標系での flip → rotate → zoom の合成行列 """
+        th, tw = self.target_size
+        if params is None:
+            return np.eye(3)
+        m = np.eye(3)
+        if params["hflip"]:
+            m = _translate(tw, 0) @ _scale(-1, 1) @ m
+        m = _rotation(params["angle"], tw / 2, th / 2) @ m
+
+        scale = params["scale"]
+        new_H, new_W = int(th / scale), int(tw / scale)
+        center = params["center"]
+        if center is None:
+            boxes, keep = _apply_to_boxes(m, first_boxes, tw, th)
+            center = _box_center(boxes[keep])
+            if center is None:
+                rng = params["rng"]
+                margin_x, margin_y = int(tw * self.center_margin_ratio), int(th * self.center_margin_ratio)
+                center = (rng.randint(margin_x, tw - margin_x), rng.randint(margin_y, th - margin_y))
+            if self.per_sequence:
+                params["center"] = center  # シーケンス内で固定
+        cx, cy = center
+        if params["zoom_type"] == "in":
+            x1 = max(0, min(int(cx - new_W // 2), tw - new_W))
+            y1 = max(0, min(int(cy - new_H // 2), th - new_H))
+            m = _scale(tw / new_W, th / new_H) @ _translate(-x1, -y1) @ m
+        else:
+            x1 = max(min(cx - new_W // 2, tw - new_W), 0)
+            y1 = max(min(cy - new_H // 2, th - new_H), 0)
+            m = _translate(x1, y1) @ _scale(new_W / tw, new_H / th) @ m
+        return m
+
+    # ---------------------------------------------------------------
+    # collate 前: ラベル変換とパディング
+    # ---------------------------------------------------------------
+    def prepare(self, samples: list):
+        """
+        サンプルごとにパラメータを決め、ラベルを変換し、画像・イベントを
+        バッチ内の最大サイズに右下パディングして stack 可能にする。
+        戻り値は apply() に渡す行列 (入力ピクセル → 出力ピクセル)。
+        """
+        th, tw = self.target_size
+        image_mats, event_mats = [], []
+        for sample in samples:
+            images = sample.get("images")
+            if images is not None:
+                H, W = images.shape[-2:]
+            else:
+                H, W = (int(v) for v in sample["image_size"])
+            s = min(tw / W, th / H)
+            resize_img = _scale(s, s)  # Resize と同じく左上寄せのレターボックス
+
+            labels = sample.get("labels")
+            first_boxes = np.zeros((0, 4))
+            if labels is not None and labels and labels[0]:
+                first_boxes = np.array([l["bbox"] for l in labels[0]], dtype=np.float64) * s
+            geometry = self._geometry(self._params_for(sample), H, W, first_boxes)
+
+            image_mats.append(geometry @ resize_img)
+            events = sample.get("events")
+            if events is not None:
+                He, We = events.shape[-2:]
+                event_mats.append(geometry @ _scale(tw / We, th / He))  # Resize は events を引き伸ばす
+
+            if labels is not None:
+                mat = image_mats[-1]
+                new_labels = []
+                for frame_labels in labels:
+                    boxes = np.array([l["bbox"] for l in frame_labels], dtype=np.float64).reshape(-1, 4)
+                    boxes, keep = _apply_to_boxes(mat, boxes, tw, th)
+                    new_labels.append([
+                        dict(label, bbox=box.tolist())
+                        for label, box, k in zip(frame_labels, boxes, keep) if k
+                    ])
+                sample["labels"] = new_labels
+            if "image_size" in sample:
+                sample["image_size"] = np.array([th, tw], dtype=np.int64)
+
+        for key in ("images", "events"):
+            if samples[0].get(key) is None:
+                continue
+            Hmax = max(s[key].shape[-2] for s in samples)
+            Wmax = max(s[key].shape[-1] for s in samples)
+            for s in samples:
+                h, w = s[key].shape[-2:]
+                if (h, w) != (Hmax, Wmax):
+                    padded = np.zeros((*s[key].shape[:-2], Hmax, Wmax), dtype=s[key].dtype)
+                    padded[..., :h, :w] = s[key]
+                    s[key] = padded
+        return {"images": image_mats, "events": event_mats}
+
+    # ---------------------------------------------------------------
+    # collate 後: バッチ全体の補間
+    # ---------------------------------------------------------------
+    def _warp(self, x: torch.Tensor, mats: list, mode: str) -> torch.Tensor:
+        B, T, C, H_in, W_in = x.shape
+        th, tw = self.target_size
+        n_in = np.array([[2.0 / W_in, 0.0, -1.0], [0.0, 2.0 / H_in, -1.0], [0.0, 0.0, 1.0]])
+        n_out_inv = np.array([[tw / 2.0, 0.0, tw / 2.0], [0.0, th / 2.0, th / 2.0], [0.0, 0.0, 1.0]])
+        # 出力の正規化座標 -> 入力の正規化座標
+        theta = np.stack([(n_in @ np.linalg.inv(m) @ n_out_inv)[:2] for m in mats])
+        theta = torch.from_numpy(theta).float().repeat_interleave(T, dim=0)
+
+        # uint8 / float16 (コンパクトなイベント) は float32 で補間して元の dtype に戻す
+        src = x.reshape(B * T, C, H_in, W_in).float()
+        grid = F.affine_grid(theta, (B * T, C, th, tw), align_corners=False)
+        out = F.grid_sample(src, grid, mode=mode, padding_mode="zeros", align_corners=False)
+        if not x.is_floating_point():
+            info = torch.iinfo(x.dtype)
+            out = out.round_().clamp_(info.min, info.max)
+        return out.to(x.dtype).reshape(B, T, C, th, tw)
+
+    def apply(self, data: dict, mats: dict) -> dict:
+        with StageTimer("transform"):
+            if "images" in data:
+                data["images"] = self._warp(data["images"], mats["images"], self.image_mode)
+            if "events" in data:
+                data["events"] = self._warp(data["events"], mats["events"], self.event_mode)
+        return data
+
+
+class BatchAugmentCollate:
+    def __init__(self, collate_fn, engine: BatchAugment, streaming: bool = False):
+        """
+        custom_collate_rnd / custom_collate_streaming の前後に BatchAugment を挟む collate_fn。
+        ラベル変換とパディングは collate 前、画像・イベントの補間は collate 後のテンソルに対して行う。
+        streaming: custom_collate_streaming 用（batch が (samples, worker_id) の形）
+        """
+        self.collate_fn = collate_fn
+        self.engine = engine
+        self.streaming = streaming
+
+    def __call__(self, batch, profile=False):
+        samples = batch[0] if self.streaming else batch
+        mats = self.engine.prepare(samples)
+        out = self.collate_fn(batch, profile=profile)
+        out["data"] = self.engine.apply(out["data"], mats)
+        return out
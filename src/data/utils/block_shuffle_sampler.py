@@ -0,0 +1,123 @@
+# data/utils/block_shuffle_sampler.py
+import itertools
+
+import numpy as np
+import torch.distributed as dist
+from torch.utils.data import ConcatDataset, Sampler
+
+
+class BlockShuffleSampler(Sampler):
+    def __init__(self, dataset: ConcatDataset, block_size: int = 64, buffer_size: int = 256,
+                 seed: int = 0, num_replicas: int = None, rank: int = None):
+        """
+        ブロック単位でシャッフルする Sampler（build_random_dataloader の train 用）。
+
+        ConcatDataset の各シーケンスを block_size 個の連続したウィンドウのブロックに分け、
+        ブロックの順序をランダムにする。ブロック内のウィンドウは、buffer_size 個の
+        バッファの中でシャッフルして返す。連続した読み出しはほぼ同じ HDF5 / 画像ディレクトリ
+        の近いフレームに集中するので、OS の先読み・HDF5 チャンクキャッシュ・フレームキャッシュが効く。
+
+        DDP では、全 rank が同じ (seed, epoch) から同じブロック順を作り、ブロックを rank ごとに
+        重ならないように割り当てる（サンプル数が均等になるよう貪欲に割り当て、不足分は
+        自分のブロックの先頭から補い、超過分は切り捨てる）。各 rank のサンプル数は ceil(N / num_replicas)。
+        Lightning の Trainer では use_distributed_sampler=False にして使う（二重に分割されないように）。
+
+        Parameters:
+            dataset: SequenceForMap (または CachedSequence) の ConcatDataset
+            block_size: 1 ブロックのウィンドウ数
+            buffer_size: シャッフルバッファのサイズ（1 以下でブロック内は順番どおり）
+            seed: エポックごとの乱数は seed + epoch で決まる
+            num_replicas, rank: 省略時は torch.distributed から取得
+
+        途中再開: load_state_dict({"epoch", "position"}) で、そのエポックの順序のうち先頭 position 個を
+        飛ばして続きから返す（順序はインデックスの計算だけで再生し、サンプルは読まない）。
+        """
+        if num_replicas is None:
+            num_replicas = dist.get_world_size() if dist.is_available() and dist.is_initialized() else 1
+        if rank is None:
+            rank = dist.get_rank() if dist.is_available() and dist.is_initialized() else 0
+        assert block_size >= 1 and 0 <= rank < num_replicas
+        self.dataset = dataset
+        self.block_size = block_size
+        self.buffer_size = max(1, buffer_size)
+        self.seed = seed
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.epoch = 0
+        self.position = 0
+        self._resume = None
+
+        # ブロック = (開始インデックス, 終了インデックス) のグローバルインデックス
+        starts, stops = [], []
+        offset = 0
+        for end in dataset.cumulative_sizes:
+            s = np.arange(offset, end, block_size)
+            starts.append(s)
+            stops.append(np.minimum(s + block_size, end))
+            offset = end
+        self.block_starts = np.concatenate(starts).astype(np.int64) if starts else np.zeros(0, np.int64)
+        self.block_stops = np.concatenate(stops).astype(np.int64) if stops else np.zeros(0, np.int64)
+        self.num_samples = -(-len(dataset) // num_replicas)
+
+    def set_epoch(self, epoch: int):
+        self.epoch = epoch
+
+    def state_dict(self) -> dict:
+        """ position はこの sampler が返したインデックス数（DataLoader の先読み分を含む） """
+        return {"epoch": self.epoch, "position": self.position}
+
+    def load_state_dict(self, state: dict):
+        self._resume = state
+
+    def _resume_position(self) -> int:
+        resume, self._resume = self._resume, None
+        if resume is None or resume.get("epoch") != self.epoch:
+            return 0
+        return int(resume.get("position", 0))
+
+    def __len__(self):
+        return self.num_samples
+
+    def _my_blocks(self, rng):
+        """ このエポックのブロック順と、この rank に割り当てられたブロック """
+        order = rng.permutation(len(self.block_starts))
+        if self.num_replicas == 1:
+            return order
+        # サンプル数が最も少ない rank に次のブロックを割り当てる（全 rank で同じ結果になる）
+        sizes = self.block_stops[order] - self.block_starts[order]
+        loads = np.zeros(self.num_replicas, dtype=np.int64)
+        owner = np.empty(len(order), dtype=np.int64)
+        for i, size in enumerate(sizes):
+            r = int(np.argmin(loads))
+            owner[i] = r
+            loads[r] += size
+        return order[owner == self.rank]
+
+    def __iter__(self):
+        start = self._resume_position()
+        self.position = start
+        for idx in itertools.islice(self._indices(), start, None):
+            self.position += 1
+            yield idx
+
+    def _indices(self):
+        rng = np.random.default_rng(self.seed + self.epoch)
+        blocks = self._my_blocks(rng)
+        indices = np.concatenate([
+            np.arange(self.block_starts[b], self.block_stops[b]) for b in blocks
+        ]) if len(blocks) else np.zeros(0, np.int64)
+        if len(indices) < self.num_samples:  # 不足分は先頭から補う (DistributedSampler と同様)
+            indices = np.resize(indices, self.num_samples)
+        indices = indices[:self.num_samples]
+
+        # バッファ内でシャッフル: 埋まったらランダムな位置を取り出し、新しいインデックスで置き換える
+        buffer = []
+        for idx in indices.tolist():
+            if len(buffer) < self.buffer_size:
+                buffer.append(idx)
+                continue
+            j = int(rng.integers(len(buffer)))
+            yield buffer[j]
+            buffer[j] = idx
+        rng.shuffle(buffer)
+        yield from buffer
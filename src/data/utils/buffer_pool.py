@@ -0,0 +1,69 @@
+# data/utils/buffer_pool.py
+import threading
+
+import numpy as np
+
+
+class BufferPool:
+    def __init__(self, num_slots: int = 1, reuse: bool = True):
+        """
+        transform の出力配列を使い回すためのバッファアリーナ（ワーカー・スレッドごと）。
+
+        - out(): サンプルの出力として collate まで生き残る配列。num_slots 個のスロットを
+          リングで使い、Compose が 1 サンプルごとに next_slot() で進める。
+          collate 前に同時に存在するサンプル数（= batch_size）より大きい num_slots が必要。
+        - scratch(): 1 回の transform 呼び出し内だけで使う一時配列（スロット共有）。
+
+        バッファは (名前, dtype) ごとに 1 次元で確保し、要求形状の先頭部分を reshape して返すので、
+        サイズが変わっても（ズーム倍率やシーケンスごとの解像度など）最大サイズ分で済み、常に連続配列になる。
+        reuse=False にすると毎回新規確保する（ベンチマークでの確保回数の計測用）。
+        """
+        assert num_slots >= 1
+        self.num_slots = num_slots
+        self.reuse = reuse
+        self.allocations = 0
+        self.allocated_bytes = 0
+        self._local = threading.local()
+
+    def __getstate__(self):
+        # ワーカーへはバッファを持ち込まず、各プロセスで確保し直す
+        state = self.__dict__.copy()
+        del state["_local"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def _arena(self):
+        arena = getattr(self._local, "arena", None)
+        if arena is None:
+            arena = self._local.arena = {
+                "slots": [{} for _ in range(self.num_slots)],
+                "scratch": {},
+                "cursor": 0,
+            }
+        return arena
+
+    def next_slot(self):
+        arena = self._arena()
+        arena["cursor"] = (arena["cursor"] + 1) % self.num_slots
+
+    def _take(self, buffers: dict, name: str, shape, dtype) -> np.ndarray:
+        dtype = np.dtype(dtype)
+        n = int(np.prod(shape))
+        flat = buffers.get((name, dtype)) if self.reuse else None
+        if flat is None or flat.size < n:
+            flat = np.empty(n, dtype=dtype)
+            self.allocations += 1
+            self.allocated_bytes += flat.nbytes
+            if self.reuse:
+                buffers[(name, dtype)] = flat
+        return flat[:n].reshape(shape)
+
+    def out(self, name: str, shape, dtype) -> np.ndarray:
+        arena = self._arena()
+        return self._take(arena["slots"][arena["cursor"]], name, shape, dtype)
+
+    def scratch(self, name: str, shape, dtype) -> np.ndarray:
+        return self._take(self._arena()["scratch"], name, shape, dtype)
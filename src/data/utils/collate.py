@@ -1,14 +1,27 @@
 # data/utils/collate.py
 
 from torch.utils.data._utils.collate import default_collate
+import time
 import numpy as np
 import torch
+from src.data.utils.profiling import StageTimer, pop_stage_timings
+
+def _stack_arrays(batch):
+    # Flip などが保留したビュー（負のストライド）は from_numpy できないので、
+    # np.stack でビューから直接 1 回のコピーでまとめる
+    if all(b.flags.c_contiguous for b in batch):
+        return torch.stack([torch.from_numpy(b) for b in batch])
+    return torch.from_numpy(np.stack(batch))
 
 custom_collate_fn_map = {
     torch.Tensor: default_collate,
-    np.ndarray: lambda batch: torch.stack([torch.from_numpy(b) for b in batch]),
+    np.ndarray: _stack_arrays,
+    bool: default_collate,
     int: default_collate,
     float: default_collate,
+    np.float64: default_collate,  # Rotate / Zoom が np.clip した bbox 座標
+    np.float32: default_collate,
+    np.int64: default_collate,
     str: lambda batch: batch,
     dict: lambda batch: {k: custom_collate([d[k] for d in batch]) for k in batch[0]},
     list: lambda batch: [custom_collate(b) for b in zip(*batch)],
@@ -20,17 +33,30 @@ def custom_collate(batch, collate_fn_map=custom_collate_fn_map):
         return collate_fn_map[elem_type](batch)
     raise TypeError(f"Unsupported type: {elem_type}")
 
-def custom_collate_rnd(batch):
-    worker_info = torch.utils.data.get_worker_info()
-    worker_id = 0 if worker_info is None else worker_info.id
-    return {
-        'data': custom_collate(batch),
+def _collate_with_meta(samples, worker_id, profile):
+    with StageTimer("collate"):
+        data = custom_collate(samples)
+    # profile しない場合も蓄積はリセットしておく（ワーカー内で溜め続けないため）
+    timings, spans = pop_stage_timings()
+    out = {
+        'data': data,
         'worker_id': worker_id,
     }
+    if profile:
+        out['timings'] = timings
+        out['spans'] = spans
+        out['collate_end'] = time.time()
+    return out
 
-def custom_collate_streaming(batch):
-    samples, worker_id = batch
-    return {
-        'data': custom_collate(samples),
-        'worker_id': worker_id,
-    }
+def custom_collate_rnd(batch, profile=False):
+    worker_info = torch.utils.data.get_worker_info()
+    worker_id = 0 if worker_info is None else worker_info.id
+    return _collate_with_meta(batch, worker_id, profile)
+
+def custom_collate_streaming(batch, profile=False):
+    # (samples, worker_id[, sampler の状態]) 。状態は途中再開用に 'sampler_state' として載せる
+    samples, worker_id, *state = batch
+    out = _collate_with_meta(samples, worker_id, profile)
+    if state and state[0] is not None:
+        out['sampler_state'] = state[0]
+    return out
@@ -0,0 +1,334 @@
+# data/utils/dataset_index.py
+import json
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import cv2
+import h5py
+import numpy as np
+from src.data.utils.label_table import LABEL_COLS, LabelTable, parse_kitti_fields
+
+# インデックスのレイアウトを変えたら上げる（古いインデックスは使わずにスキャンし直す）
+INDEX_VERSION = 1
+
+
+def scan_image_dir(images_dir: Path):
+    """
+    画像ディレクトリを (image_ids, name_format, names) で表す。
+        image_ids: フレーム番号（連番なら range、そうでなければ int64 配列）
+        name_format: ゼロ埋めの桁数が揃っていれば "{:06d}.png" のようなテンプレート（揃っていなければ None）
+        names: name_format が None の場合のファイル名の配列
+    """
+    names = [p.name for p in Path(images_dir).glob("*.png")]
+    return _image_layout(names)
+
+
+def _image_layout(names: list):
+    names = sorted(names, key=lambda n: int(n[:-4]))
+    ids = [int(n[:-4]) for n in names]
+    if ids and ids == list(range(ids[0], ids[0] + len(ids))):
+        image_ids = range(ids[0], ids[0] + len(ids))
+    else:
+        image_ids = np.array(ids, dtype=np.int64)
+    widths = {len(n) - 4 for n in names}
+    if len(widths) == 1 and all(n[:-4].isdigit() for n in names):
+        return image_ids, f"{{:0{widths.pop()}d}}.png", None
+    return image_ids, None, np.array(names)
+
+
+def _stamp(path: Path):
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def sequence_paths(data_dir, sequence_name: str, ev_repr_name: str) -> dict:
+    data_dir = Path(data_dir)
+    return {
+        "images": data_dir / "images" / sequence_name,
+        "events": data_dir / "preprocessed" / ev_repr_name / f"{sequence_name}.h5",
+        "labels": data_dir / "labels" / f"{sequence_name}.txt",
+    }
+
+
+def sequence_stamps(data_dir, sequence_name: str, ev_repr_name: str) -> dict:
+    """
+    インデックスが古くなっていないかを判定する (サイズ, 更新時刻)。画像はディレクトリの更新時刻
+    （同じ名前で上書きした PNG は検出しない。DatasetIndex 参照）
+    """
+    paths = sequence_paths(data_dir, sequence_name, ev_repr_name)
+    images = paths["images"].stat().st_mtime_ns if paths["images"].exists() else None
+    return {"images": images, "events": _stamp(paths["events"]), "labels": _stamp(paths["labels"])}
+
+
+# ---------------------------------------------------------------
+# スキャン（ワーカープロセスで実行）
+# ---------------------------------------------------------------
+def _check_pngs(images_dir: str, names: list):
+    """ PNG を全てデコードし、(名前, (H, W) またはエラー文字列) を返す """
+    results = []
+    for name in names:
+        try:
+            buf = np.fromfile(os.path.join(images_dir, name), dtype=np.uint8)
+            img = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+            results.append((name, img.shape[:2] if img is not None else "decode failed"))
+        except Exception as e:
+            results.append((name, f"{type(e).__name__}: {e}"))
+    return results
+
+
+def _check_events(path: str, chunk: int = 256):
+    out = {"shape": None, "dtype": None, "scale": 1.0, "errors": [], "nonfinite_frames": 0}
+    try:
+        with h5py.File(path, "r") as f:
+            if "data" not in f:
+                out["errors"].append("no 'data' dataset")
+                return out
+            data = f["data"]
+            out["shape"] = list(data.shape)
+            out["dtype"] = str(data.dtype)
+            out["scale"] = float(data.attrs.get("scale", 1.0))
+            if data.ndim != 4:
+                out["errors"].append(f"expected [F, C, H, W], got shape {tuple(data.shape)}")
+                return out
+            if data.dtype.kind not in "uif":
+                out["errors"].append(f"non-numeric dtype {data.dtype}")
+                return out
+            for start in range(0, data.shape[0], chunk):
+                try:
+                    block = data[start:start + chunk]
+                except Exception as e:
+                    out["errors"].append(f"frames {start}-{start + chunk - 1}: {type(e).__name__}: {e}")
+                    continue
+                if data.dtype.kind == "f":
+                    finite = np.isfinite(block.reshape(len(block), -1)).all(axis=1)
+                    out["nonfinite_frames"] += int((~finite).sum())
+    except Exception as e:
+        out["errors"].append(f"{type(e).__name__}: {e}")
+    return out
+
+
+def _check_labels(path: str):
+    out = {"rows": np.empty((0, LABEL_COLS)), "frames": np.empty(0, dtype=np.int64),
+           "types": [], "errors": [], "exists": os.path.exists(path)}
+    if not out["exists"]:
+        return out
+    types, rows, frames = {}, [], []
+    with open(path, "r") as f:
+        for lineno, line in enumerate(f, 1):
+            fields = line.strip().split()
+            if not fields:
+                continue
+            try:
+                frame, row = parse_kitti_fields(fields, types)
+            except Exception as e:
+                out["errors"].append(f"line {lineno}: {type(e).__name__}: {e}")
+                continue
+            frames.append(frame)
+            rows.append(row)
+    out["rows"] = np.array(rows, dtype=np.float64).reshape(-1, LABEL_COLS)
+    out["frames"] = np.array(frames, dtype=np.int64)
+    out["types"] = [t for t, _ in sorted(types.items(), key=lambda kv: kv[1])]
+    return out
+
+
+def _issue(issues: list, level: str, check: str, message: str, items=None, max_items: int = 20):
+    issue = {"level": level, "check": check, "message": message}
+    if items:
+        issue["count"] = len(items)
+        issue["items"] = list(items)[:max_items]
+    issues.append(issue)
+
+
+def _summarize(seq: str, paths: dict, names: list, pngs: list, events: dict, labels: dict):
+    """ 1 シーケンスのチェック結果から (レポート, インデックスのエントリ) を作る """
+    issues = []
+    if not names:
+        _issue(issues, "error", "images", f"no PNG files in {paths['images']}")
+    bad_png = [f"{n}: {r}" for n, r in pngs if isinstance(r, str)]
+    if bad_png:
+        _issue(issues, "error", "images", "PNG files that fail to decode", bad_png)
+    shapes = sorted({tuple(r) for _, r in pngs if not isinstance(r, str)})
+    if len(shapes) > 1:
+        _issue(issues, "warning", "images", f"mixed image sizes {shapes}")
+    image_ids, name_format, image_names = _image_layout(names) if names else (range(0), None, None)
+    if names and not isinstance(image_ids, range):
+        _issue(issues, "warning", "images", "frame ids are not contiguous")
+
+    for error in events["errors"]:
+        _issue(issues, "error", "events", error)
+    if events["nonfinite_frames"]:
+        _issue(issues, "error", "events", f"{events['nonfinite_frames']} frames contain NaN/inf")
+    num_event_frames = events["shape"][0] if events["shape"] else 0
+
+    total_frames = min(len(names), num_event_frames)
+    if len(names) != num_event_frames:
+        _issue(issues, "warning", "count",
+               f"{len(names)} PNG files vs {num_event_frames} event frames; using the first {total_frames}")
+
+    if not labels["exists"]:
+        _issue(issues, "error", "labels", f"missing label file {paths['labels']}")
+    if labels["errors"]:
+        _issue(issues, "error", "labels", "label lines that fail to parse", labels["errors"])
+    out_of_range = np.unique(labels["frames"][(labels["frames"] < 0) | (labels["frames"] >= total_frames)])
+    if len(out_of_range):
+        _issue(issues, "warning", "labels",
+               f"labels for frames outside [0, {total_frames}) are dropped", out_of_range.tolist())
+
+    levels = {i["level"] for i in issues}
+    status = "error" if "error" in levels else "warning" if levels else "ok"
+    report = {
+        "status": status,
+        "num_images": len(names),
+        "num_event_frames": num_event_frames,
+        "total_frames": total_frames,
+        "image_sizes": [list(s) for s in shapes],
+        "event_shape": events["shape"],
+        "event_dtype": events["dtype"],
+        "num_labels": int(len(labels["frames"])),
+        "issues": issues,
+    }
+    entry = None
+    if status != "error":
+        entry = {
+            "image_ids": ({"start": image_ids.start, "count": len(image_ids)} if isinstance(image_ids, range)
+                          else image_ids.tolist()),
+            "image_name_format": name_format,
+            "image_names": None if image_names is None else image_names.tolist(),
+            "image_size": list(shapes[0]),
+            "num_event_frames": num_event_frames,
+            "event_scale": events["scale"],
+        }
+    return report, entry
+
+
+def scan_dataset(data_dir, ev_repr_name: str, seq_ids: list, num_workers: int = None,
+                 chunk: int = 256):
+    """
+    全シーケンスの PNG デコード・HDF5 の形状/dtype/読み出し・ラベルのパースとフレーム範囲を
+    プロセスプールで並列にチェックする。
+
+    Returns:
+        report: {"sequences": {seq: {...}}, ...} 機械可読なレポート
+        entries: {seq: (インデックスのエントリ, ラベル)}  エラーのないシーケンスのみ
+    """
+    start = time.perf_counter()
+    jobs = {}
+    with ProcessPoolExecutor(max_workers=num_workers) as pool:
+        for seq in seq_ids:
+            paths = sequence_paths(data_dir, seq, ev_repr_name)
+            names = [p.name for p in paths["images"].glob("*.png")] if paths["images"].exists() else []
+            jobs[seq] = {
+                "paths": paths,
+                "names": names,
+                "stamps": sequence_stamps(data_dir, seq, ev_repr_name),
+                "pngs": [pool.submit(_check_pngs, str(paths["images"]), names[i:i + chunk])
+                         for i in range(0, len(names), chunk)],
+                "events": pool.submit(_check_events, str(paths["events"])),
+                "labels": pool.submit(_check_labels, str(paths["labels"])),
+            }
+
+        report = {"version": INDEX_VERSION, "data_dir": str(Path(data_dir).resolve()),
+                  "ev_repr_name": ev_repr_name, "sequences": {}}
+        entries = {}
+        for seq, job in jobs.items():
+            pngs = [r for f in job["pngs"] for r in f.result()]
+            labels = job["labels"].result()
+            seq_report, entry = _summarize(seq, job["paths"], job["names"], pngs,
+                                           job["events"].result(), labels)
+            report["sequences"][seq] = seq_report
+            if entry is not None:
+                entry["stamps"] = job["stamps"]
+                entries[seq] = (entry, labels)
+
+    statuses = [r["status"] for r in report["sequences"].values()]
+    report["summary"] = {s: statuses.count(s) for s in ("ok", "warning", "error")}
+    report["elapsed_s"] = time.perf_counter() - start
+    return report, entries
+
+
+def write_index(out_dir, report: dict, entries: dict):
+    """
+    <out_dir>/report.json      : scan_dataset のレポート
+    <out_dir>/index.json       : 検証済みシーケンスのメタデータ (DatasetIndex が読む)
+    <out_dir>/labels/<seq>.npz : ラベル (rows / frames / types。downsample 前の座標)
+    """
+    out_dir = Path(out_dir)
+    (out_dir / "labels").mkdir(parents=True, exist_ok=True)
+    for seq, (_, labels) in entries.items():
+        np.savez(out_dir / "labels" / f"{seq}.npz", rows=labels["rows"], frames=labels["frames"],
+                 types=np.array(labels["types"], dtype=str))
+    index = {
+        "version": INDEX_VERSION,
+        "data_dir": report["data_dir"],
+        "ev_repr_name": report["ev_repr_name"],
+        "sequences": {seq: entry for seq, (entry, _) in entries.items()},
+        "invalid": [seq for seq, r in report["sequences"].items() if r["status"] == "error"],
+    }
+    for name, obj in (("report.json", report), ("index.json", index)):
+        tmp = out_dir / f"{name}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(obj, f, indent=1)
+        os.replace(tmp, out_dir / name)
+
+
+# ---------------------------------------------------------------
+# ローダー側
+# ---------------------------------------------------------------
+class DatasetIndex:
+    def __init__(self, index_dir):
+        """
+        scripts/scan_dataset.py が書き出した検証済みインデックス。
+        SequenceForMap はここからメタデータとラベルを読み、ディレクトリの glob・HDF5 のオープン・
+        ラベルのパース・画像サイズの取得を省略する（起動が stat 数回で済む）。
+
+        ファイルの (サイズ, 更新時刻) が変わったシーケンスは古いとみなし、従来どおりスキャンする。
+        レポートでエラーになったシーケンスは invalid として読み込み対象から外す。
+        スキャンしたときと別の data_dir を読む場合はインデックスを使わない。
+
+        画像はディレクトリの更新時刻だけで判定する（起動時に PNG ごとの stat をしないため）。
+        ファイルの追加・削除・名前の変更は検出できるが、同じ名前で上書きした PNG は検出できない。
+        画像を上書きした場合は scripts/scan_dataset.py を実行し直すこと。
+        """
+        self.index_dir = Path(index_dir)
+        with open(self.index_dir / "index.json") as f:
+            index = json.load(f)
+        if index.get("version") != INDEX_VERSION:
+            raise ValueError(f"index version {index.get('version')} != {INDEX_VERSION}; rerun scripts/scan_dataset.py")
+        self.data_dir = Path(index["data_dir"])
+        self.ev_repr_name = index["ev_repr_name"]
+        self.sequences = index["sequences"]
+        self.invalid = set(index["invalid"])
+
+    def filter(self, seq_ids: list) -> list:
+        """ スキャンでエラーになったシーケンスを除く """
+        dropped = [s for s in seq_ids if s in self.invalid]
+        if dropped:
+            warnings.warn(f"[DatasetIndex] skipping sequences that failed validation: {dropped} "
+                          f"(see {self.index_dir / 'report.json'})")
+        return [s for s in seq_ids if s not in self.invalid]
+
+    def entry(self, data_dir, sequence_name: str, ev_repr_name: str):
+        """ 最新のエントリ（無い・古い場合は None） """
+        entry = self.sequences.get(sequence_name)
+        if entry is None or ev_repr_name != self.ev_repr_name:
+            return None
+        if Path(data_dir).resolve() != self.data_dir:
+            warnings.warn(f"[DatasetIndex] {self.index_dir} was built for {self.data_dir}, not "
+                          f"{Path(data_dir).resolve()}; scanning instead")
+            return None
+        if entry["stamps"] != sequence_stamps(data_dir, sequence_name, ev_repr_name):
+            warnings.warn(f"[DatasetIndex] {sequence_name}: files changed since the scan; rescanning")
+            return None
+        return entry
+
+    def labels(self, sequence_name: str, num_frames: int, downsample: bool = False) -> LabelTable:
+        with np.load(self.index_dir / "labels" / f"{sequence_name}.npz") as z:
+            rows, frames, types = z["rows"], z["frames"], z["types"].tolist()
+        table = LabelTable(rows, frames, types, num_frames)
+        return table.downsampled() if downsample else table
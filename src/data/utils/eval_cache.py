@@ -0,0 +1,285 @@
+# data/utils/eval_cache.py
+import hashlib
+import json
+import os
+import shutil
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from pathlib import Path
+
+import h5py
+import numpy as np
+from src.data.utils.label_table import LABEL_COLS, pack_labels, unpack_labels
+from torch.utils.data import Dataset
+
+# キャッシュのレイアウトを変えたら上げる（古いキャッシュは別キー扱いになる）
+CACHE_VERSION = 1
+
+
+def _file_stamp(path: Path):
+    st = path.stat()
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _images_stamp(images_dir: Path) -> str:
+    """
+    画像ディレクトリ内の全 PNG の (名前, サイズ, 更新時刻) のハッシュ。
+    ディレクトリの更新時刻はファイルの追加・削除でしか変わらないので、
+    同じ名前で上書きされた PNG も検出できるようにファイルごとに stat する。
+    """
+    digest = hashlib.sha1()
+    with os.scandir(images_dir) as it:
+        entries = sorted((e.name, e.stat()) for e in it if e.name.endswith(".png"))
+    for name, st in entries:
+        digest.update(f"{name}:{st.st_size}:{st.st_mtime_ns};".encode())
+    return digest.hexdigest()
+
+
+def _dir_size(path: Path) -> int:
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+
+
+class CachedSequence(Dataset):
+    """
+    EvalCache が作ったフレーム単位のキャッシュから、SequenceForMap と同じ形式のサンプルを返す。
+    eval の transform (Resize) はフレームごとに独立なので、ウィンドウはフレーム配列の
+    連続スライスになり、デコードなしのシーケンシャル読み出しで済む。
+    """
+    def __init__(self, entry_dir: Path, source):
+        self.entry_dir = entry_dir
+        self.sequence_name = source.sequence_name
+        self.seq_len = source.seq_len
+        self.modalities = source.modalities
+        self.total_frames = source.total_frames
+        self.length = source.length
+        self.windows = source.windows  # stride / エポックごとの offset も元のシーケンスと同じ
+        self.event_dtype = source.event_dtype
+        self._arrays = None  # memmap はワーカー内で遅延オープンする（pickle で中身が複製されないように）
+
+    def __len__(self):
+        return self.length
+
+    def set_epoch(self, epoch: int):
+        self.windows.set_epoch(epoch)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_arrays"] = None
+        return state
+
+    def _open(self):
+        with open(self.entry_dir / "meta.json") as f:
+            meta = json.load(f)
+        # mode="c" (copy-on-write) で開き、書き込み可能な配列として collate に渡す
+        arrays = {"types": meta["types"], "image_size": meta.get("image_size"),
+                  "event_scale": meta.get("event_scale", 1.0)}
+        for key in ("images", "events"):
+            if key in self.modalities:
+                arrays[key] = np.load(self.entry_dir / f"{key}.npy", mmap_mode="c")
+        if "labels" in self.modalities:
+            arrays["labels"] = np.load(self.entry_dir / "labels.npy")
+            arrays["offsets"] = np.load(self.entry_dir / "label_offsets.npy")
+        self._arrays = arrays
+
+    def __getitem__(self, index: int):
+        start = self.windows.start(index)
+        if self._arrays is None:
+            self._open()
+        a = self._arrays
+        end = start + self.seq_len
+        sample = {}
+        if "images" in a:
+            sample["images"] = np.asarray(a["images"][start:end])  # memmap -> ndarray のビュー
+        else:
+            sample["image_size"] = np.array(a["image_size"], dtype=np.int64)
+        if "labels" in a:
+            offsets = a["offsets"]
+            sample["labels"] = [
+                unpack_labels(a["labels"][offsets[i]:offsets[i + 1]], a["types"])
+                for i in range(start, end)
+            ]
+        if "events" in a:
+            sample["events"] = np.asarray(a["events"][start:end])
+            if self.event_dtype is not None:
+                sample["event_scale"] = np.float32(a["event_scale"])
+        sample["reset_state"] = self.windows.reset_state(index)
+        return sample
+
+
+class EvalCache:
+    def __init__(self, cache_dir, transform_desc: dict, max_size_gb: float = None,
+                 rebuild: bool = False, num_threads: int = 8, verbose: bool = False):
+        """
+        val/test 用の、変換済みサンプルのディスクキャッシュ。
+
+        キャッシュはフレーム単位で <cache_dir>/<key>/ に保存する:
+            images.npy / events.npy : [F, C, H, W] (np.load(mmap_mode=...) で開ける .npy)
+            labels.npy              : [L, 16] 数値化したラベル
+            label_offsets.npy       : [F + 1] フレーム f のラベルは labels[off[f]:off[f+1]]
+            meta.json               : 語彙・形状・キー情報
+
+        key は データ (各 PNG・HDF5・ラベルファイルの更新時刻/サイズ)、
+        シーケンス設定 (seq_len 以外)、transform の設定 のハッシュ。
+        どれかが変わると別キーになり、古いエントリは容量制限による LRU で消える。
+
+        Parameters:
+            cache_dir: キャッシュのルートディレクトリ
+            transform_desc: transform を一意に表す設定（モードと transform cfg）。
+                フレームごとに決定的な transform であること（eval の Resize のみ等）
+            max_size_gb: cache_dir 全体の上限。超える場合は古いエントリから削除し、
+                1 エントリだけで上限を超える場合はキャッシュせず元データを読む
+            rebuild: True で既存エントリを無視して作り直す
+            num_threads: 構築時のデコード・変換スレッド数
+            verbose: True でエントリを作るたびに所要時間を表示する
+        """
+        self.cache_dir = Path(cache_dir)
+        self.transform_desc = transform_desc
+        self.max_bytes = None if max_size_gb is None else int(max_size_gb * 1024 ** 3)
+        self.rebuild = rebuild
+        self.num_threads = num_threads
+        self.verbose = verbose
+
+    def key(self, seq) -> str:
+        desc = {
+            "version": CACHE_VERSION,
+            "data_dir": str(Path(seq.data_dir).resolve()),
+            "sequence": seq.sequence_name,
+            "ev_repr_name": seq.ev_repr_name,
+            "downsample": seq.downsample,
+            "modalities": list(seq.modalities),
+            "event_dtype": None if seq.event_dtype is None else str(seq.event_dtype),
+            "event_scale": seq.event_scale,
+            "total_frames": seq.total_frames,
+            "images": _images_stamp(seq.images_dir),
+            "events": _file_stamp(seq.event_file) if "events" in seq.modalities else None,
+            "labels": _file_stamp(seq.labels_file),
+            "transform": self.transform_desc,
+        }
+        digest = hashlib.sha1(json.dumps(desc, sort_keys=True, default=str).encode()).hexdigest()
+        return f"{seq.sequence_name}-{digest[:16]}"
+
+    def wrap(self, seq):
+        """ キャッシュがあれば CachedSequence を、作れなければ元の seq を返す """
+        entry_dir = self.cache_dir / self.key(seq)
+        if self.rebuild and entry_dir.exists():
+            shutil.rmtree(entry_dir, ignore_errors=True)
+        if not (entry_dir / "meta.json").exists():
+            if not self._build(seq, entry_dir):
+                return seq
+        os.utime(entry_dir / "meta.json")  # LRU 用に最終使用時刻を更新
+        return CachedSequence(entry_dir, seq)
+
+    def clear(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def _evict(self, needed_bytes: int, keep: Path) -> bool:
+        """ 最終使用が古いエントリから削除して needed_bytes の空きを作る """
+        if self.max_bytes is None:
+            return True
+        if needed_bytes > self.max_bytes:
+            return False
+        entries = []
+        for d in self.cache_dir.iterdir():
+            meta = d / "meta.json"
+            if d.is_dir() and d != keep and meta.exists():
+                entries.append((meta.stat().st_mtime, d, _dir_size(d)))
+        total = sum(size for _, _, size in entries)
+        for _, d, size in sorted(entries, key=lambda e: e[0]):
+            if total + needed_bytes <= self.max_bytes:
+                break
+            shutil.rmtree(d, ignore_errors=True)
+            total -= size
+        return total + needed_bytes <= self.max_bytes
+
+    def _transform_frame(self, seq, f: int, events):
+        sample = {}
+        if "images" in seq.modalities:
+            sample["images"] = seq._load_image(f)[None]
+        else:
+            sample["image_size"] = seq.image_size.copy()
+        if "labels" in seq.modalities:
+            sample["labels"] = [seq._frame_labels(f)]
+        if events is not None:
+            sample["events"] = events[None]
+        if seq.transform:
+            sample = seq.transform(sample)
+        return sample
+
+    def _build(self, seq, entry_dir: Path) -> bool:
+        start = time.perf_counter()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_dir = entry_dir.with_name(f"{entry_dir.name}.tmp-{os.getpid()}")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        F = seq.total_frames
+        use_events = "events" in seq.modalities
+        with (h5py.File(seq.event_file, "r") if use_events else nullcontext()) as h5:
+            event_scale = 1.0
+            if use_events:
+                first_events, event_scale = seq._convert_events(np.array(h5["data"][0:1]))
+            first = self._transform_frame(seq, 0, first_events[0] if use_events else None)
+            array_keys = [k for k in ("images", "events") if k in first]
+            needed = F * sum(first[k][0].nbytes for k in array_keys)
+            if not self._evict(needed, keep=entry_dir):
+                warnings.warn(f"[EvalCache] {seq.sequence_name}: {needed / 1024 ** 3:.2f} GB does not fit "
+                              f"in max_size_gb; reading uncached.")
+                return False
+
+            tmp_dir.mkdir(parents=True)
+            arrays = {
+                k: np.lib.format.open_memmap(tmp_dir / f"{k}.npy", mode="w+",
+                                             dtype=first[k].dtype, shape=(F, *first[k].shape[1:]))
+                for k in array_keys
+            }
+            types = {}
+            label_rows = [None] * F
+
+            def store(f, events):
+                # transform の出力は BufferPool のスロットを指すことがあり、同じスレッドの次の
+                # transform で上書きされるので、変換したスレッド内で memmap に書き込む
+                sample = self._transform_frame(seq, f, events)
+                for k in array_keys:
+                    arrays[k][f] = sample[k][0]
+                return sample.get("labels")
+
+            chunk = 64
+            with ThreadPoolExecutor(max_workers=self.num_threads) as pool:
+                for c0 in range(0, F, chunk):
+                    c1 = min(c0 + chunk, F)
+                    ev_chunk = seq._convert_events(np.array(h5["data"][c0:c1]))[0] if use_events else None
+                    labels = pool.map(lambda f: store(f, ev_chunk[f - c0] if use_events else None), range(c0, c1))
+                    for f, frame_labels in zip(range(c0, c1), labels):
+                        if frame_labels is not None:
+                            label_rows[f] = pack_labels(frame_labels[0], types)
+            for array in arrays.values():
+                array.flush()
+            del arrays
+
+        if "labels" in seq.modalities:
+            offsets = np.zeros(F + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum([len(r) for r in label_rows])
+            np.save(tmp_dir / "labels.npy", np.concatenate(label_rows) if F else np.empty((0, LABEL_COLS)))
+            np.save(tmp_dir / "label_offsets.npy", offsets)
+        with open(tmp_dir / "meta.json", "w") as f:
+            json.dump({
+                "sequence": seq.sequence_name,
+                "num_frames": F,
+                "modalities": list(seq.modalities),
+                "types": [t for t, _ in sorted(types.items(), key=lambda kv: kv[1])],
+                "image_size": first["image_size"].tolist() if "image_size" in first else None,
+                "event_scale": event_scale,
+                **{k: {"shape": list(first[k].shape[1:]), "dtype": str(first[k].dtype)} for k in array_keys},
+                "transform": self.transform_desc,
+            }, f, default=str)
+
+        # 他のプロセス (DDP の別 rank など) が先に作り終えていればそちらを使う
+        try:
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        if self.verbose:
+            print(f"[EvalCache] {seq.sequence_name}: cached {F} frames "
+                  f"({needed / 1024 ** 2:.1f} MB) in {time.perf_counter() - start:.1f}s -> {entry_dir}")
+        return True
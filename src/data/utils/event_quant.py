@@ -0,0 +1,61 @@
+# data/utils/event_quant.py
+import warnings
+
+import numpy as np
+import torch
+
+# イベント表現をコンパクトに保存・転送するときの dtype
+EVENT_DTYPES = {
+    "uint8": np.uint8,
+    "float16": np.float16,
+}
+
+
+def event_dtype(name):
+    """ 設定値 (None / 'uint8' / 'float16') を numpy dtype に変換する """
+    if name is None:
+        return None
+    if name not in EVENT_DTYPES:
+        raise ValueError(f"event_dtype must be one of {list(EVENT_DTYPES)} or null: {name}")
+    return np.dtype(EVENT_DTYPES[name])
+
+
+def quantize_events(events: np.ndarray, dtype, scale: float = 1.0) -> np.ndarray:
+    """
+    イベント表現を dtype に量子化する。元の値は events ≈ quantized * scale で復元できる。
+    uint8 は [0, 255] に丸めてクリップする（ヒストグラムなど非負の表現向け）。
+    負の値を含む（符号付きの）表現を uint8 にすると負の値が 0 に潰れるので警告する（float16 を使う）。
+    """
+    dtype = np.dtype(dtype)
+    if events.dtype == dtype and scale == 1.0:
+        return events
+    values = events if scale == 1.0 else events / np.float32(scale)
+    if dtype == np.uint8:
+        if values.size and values.min() < 0:
+            warnings.warn(f"quantizing a signed event representation (min={float(values.min()):.4g}) to uint8 "
+                          f"clips negative values to 0; use event_dtype: float16", stacklevel=2)
+        return np.clip(np.rint(values), 0, 255).astype(np.uint8)
+    return values.astype(dtype)
+
+
+def dequantize_events(events: torch.Tensor, scale=None, dtype: torch.dtype = torch.float32,
+                      mean=None, std=None) -> torch.Tensor:
+    """
+    GPU に転送した後のコンパクトなイベントテンソルを、学習用の浮動小数点に戻す（デバイス側で実行）。
+
+    Parameters:
+        events: [B, T, C, H, W] (uint8 / float16 など)
+        scale: バッチの 'event_scale' ([B] テンソル) または float。None なら 1.0
+        dtype: 出力 dtype
+        mean, std: 指定するとチャネルごと (長さ C) またはスカラーで正規化する
+    """
+    out = events.to(dtype)
+    if scale is not None:
+        if torch.is_tensor(scale):
+            scale = scale.to(device=out.device, dtype=dtype).view(-1, *([1] * (out.dim() - 1)))
+        out = out * scale
+    if mean is not None:
+        out = out - torch.as_tensor(mean, device=out.device, dtype=dtype).view(-1, 1, 1)
+    if std is not None:
+        out = out / torch.as_tensor(std, device=out.device, dtype=dtype).view(-1, 1, 1)
+    return out
@@ -0,0 +1,132 @@
+# data/utils/io_backend.py
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+class LocalFS:
+    """ ローカルディスクからファイルのバイト列を読む（SequenceForMap の従来の読み方と同じ） """
+    def read_bytes(self, path: str) -> np.ndarray:
+        return np.fromfile(str(path), dtype=np.uint8)
+
+
+class DelayedFS(LocalFS):
+    def __init__(self, latency: float = 0.005, jitter: float = 0.0, fail_rate: float = 0.0, seed: int = None):
+        """
+        NFS / オブジェクトストレージの FUSE マウントを模擬する、遅延付きの読み込み（ローカルでの検証用）。
+        1 ファイルごとに latency (+ [0, jitter) の一様乱数) 秒待ち、fail_rate の確率で OSError を出す。
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.seed = seed
+        self._rng = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_rng"] = None
+        return state
+
+    def read_bytes(self, path: str) -> np.ndarray:
+        if self._rng is None:
+            self._rng = np.random.default_rng(self.seed)
+        time.sleep(self.latency + (self._rng.random() * self.jitter if self.jitter else 0.0))
+        if self.fail_rate and self._rng.random() < self.fail_rate:
+            raise OSError(f"simulated read failure: {path}")
+        return super().read_bytes(path)
+
+
+class ThreadedIO:
+    def __init__(self, fs=None, max_concurrency: int = 16, retries: int = 3,
+                 retry_delay: float = 0.05, prefetch_windows: int = 1, max_prefetch: int = 256):
+        """
+        SequenceForMap の画像読み込みをスレッドプールで並行に行う I/O バックエンド。
+
+        ウィンドウの seq_len 枚（と、続く prefetch_windows 個のウィンドウの画像）の読み込みを
+        まとめて投げ、ファイルのバイト列だけを並行に取得する（デコードは呼び出し側で cv2.imdecode）。
+        ネットワーク越しのファイルシステムでは 1 ファイルごとの往復の待ち時間が重なるので、
+        逐次の open / read より大幅に速くなる。ファイルの読み込みはブロッキングな呼び出しなので、
+        asyncio ではなくスレッドで並行化する。
+
+        Parameters:
+            fs: read_bytes(path) を持つオブジェクト（既定は LocalFS。検証には DelayedFS）
+            max_concurrency: 同時に行う読み込みの上限（スレッド数）
+            retries: OSError のときの再試行回数（待ち時間は retry_delay から倍々に伸ばす）
+            prefetch_windows: 先読みする後続ウィンドウ数（ウィンドウを順に読むローダー向け。シャッフルでは 0）
+            max_prefetch: 先読みして保持するファイル数の上限（古いものから捨てる）
+
+        スレッドプールはプロセスごとに遅延生成する（DataLoader のワーカーへ fork / pickle しても安全）。
+        """
+        self.fs = fs if fs is not None else LocalFS()
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.prefetch_windows = prefetch_windows
+        self.max_prefetch = max_prefetch
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._pool = None
+        self._pending = OrderedDict()  # path -> Future（先読み分）
+        self._lock = threading.Lock()
+        self.stats = {"files": 0, "bytes": 0, "retries": 0, "prefetch_hits": 0}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ("_pool", "_pending", "_lock"):
+            state.pop(key)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset()
+
+    def _executor(self) -> ThreadPoolExecutor:
+        if self._pid != os.getpid():  # fork 後は親のスレッドが存在しないので作り直す
+            self._reset()
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="io")
+        return self._pool
+
+    def _read(self, path: str) -> np.ndarray:
+        delay = self.retry_delay
+        for attempt in range(self.retries + 1):
+            try:
+                return self.fs.read_bytes(path)
+            except OSError:
+                if attempt == self.retries:
+                    raise
+                with self._lock:
+                    self.stats["retries"] += 1
+                time.sleep(delay)
+                delay *= 2
+
+    def _submit(self, path: str):
+        return self._executor().submit(self._read, path)
+
+    def read_many(self, paths: list, prefetch: list = ()) -> list:
+        """ paths のバイト列を順に返す。prefetch のファイルは読み込みだけ投げておき、次回以降に使う """
+        with self._lock:
+            futures = []
+            for path in paths:
+                future = self._pending.pop(path, None)
+                if future is None:
+                    future = self._submit(path)
+                else:
+                    self.stats["prefetch_hits"] += 1
+                futures.append(future)
+            for path in prefetch:
+                if path not in self._pending and path not in paths:
+                    self._pending[path] = self._submit(path)
+            while len(self._pending) > self.max_prefetch:
+                self._pending.popitem(last=False)[1].cancel()
+        bufs = [future.result() for future in futures]
+        with self._lock:  # eval cache の構築スレッドなど、複数スレッドから呼ばれる
+            self.stats["files"] += len(bufs)
+            self.stats["bytes"] += sum(b.nbytes for b in bufs)
+        return bufs
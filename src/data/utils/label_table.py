@@ -0,0 +1,143 @@
+# data/utils/label_table.py
+from pathlib import Path
+
+import numpy as np
+
+# ラベル辞書 <-> 数値行 の対応 (キー, 列数, 型)。順序は従来の SequenceForMap のラベル辞書と同じ。
+# "type" は types 語彙へのインデックスとして格納する
+LABEL_FIELDS = [
+    ("track_id", 1, int),
+    ("type", 1, str),
+    ("truncated", 1, float),
+    ("occluded", 1, int),
+    ("alpha", 1, float),
+    ("bbox", 4, list),
+    ("dimensions", 3, list),
+    ("location", 3, list),
+    ("rotation_y", 1, float),
+]
+LABEL_COLS = sum(n for _, n, _ in LABEL_FIELDS)
+BBOX_COLS = slice(5, 9)  # rows[:, BBOX_COLS] が [x1, y1, x2, y2]
+
+
+def pack_labels(labels: list, types: dict) -> np.ndarray:
+    """ ラベル辞書のリストを [L, LABEL_COLS] の数値行にする。types は 種別名 -> インデックス """
+    rows = np.empty((len(labels), LABEL_COLS), dtype=np.float64)
+    for j, label in enumerate(labels):
+        row = []
+        for key, n, kind in LABEL_FIELDS:
+            if kind is str:
+                row.append(types.setdefault(label[key], len(types)))
+            elif kind is list:
+                row += list(label[key])
+            else:
+                row.append(label[key])
+        rows[j] = row
+    return rows
+
+
+def unpack_labels(rows: np.ndarray, type_names: list) -> list:
+    """ pack_labels の逆。毎回新しい辞書を返すので、transform が書き換えても元データは変わらない """
+    labels = []
+    for row in rows.tolist():
+        label = {}
+        col = 0
+        for key, n, kind in LABEL_FIELDS:
+            if kind is str:
+                label[key] = type_names[int(row[col])]
+            elif kind is list:
+                label[key] = row[col:col + n]
+            else:
+                label[key] = kind(row[col])
+            col += n
+        labels.append(label)
+    return labels
+
+
+def parse_kitti_fields(fields: list, types: dict, downsample: bool = False):
+    """ KITTI tracking 形式の 1 行 (split 済み) を (フレーム番号, ラベル行) にする """
+    if len(fields) < 17:
+        raise ValueError(f"expected at least 17 fields, got {len(fields)}")
+    bbox = [float(v) for v in fields[6:10]]
+    if downsample:
+        bbox = [coord / 2 for coord in bbox]
+    row = [
+        int(fields[1]),
+        types.setdefault(fields[2], len(types)),
+        float(fields[3]),
+        int(fields[4]),
+        float(fields[5]),
+        *bbox,
+        *[float(v) for v in fields[10:13]],
+        *[float(v) for v in fields[13:16]],
+        float(fields[16]),
+    ]
+    return int(fields[0]), row
+
+
+class LabelTable:
+    def __init__(self, rows: np.ndarray, frames: np.ndarray, types: list, num_frames: int):
+        """
+        シーケンスの全ラベルを、フレーム順に並べた 1 つの数値配列で持つ。
+
+        Python の辞書・リストを大量に持たないので、DataLoader のワーカーへ pickle (spawn) しても
+        小さく、fork 後に参照カウントの更新でページがコピーされることもない。
+
+        Parameters:
+            rows: [L, LABEL_COLS] ラベル行（pack_labels と同じ列）
+            frames: [L] 各行のフレーム番号
+            types: 種別名の語彙 (rows の type 列はこのインデックス)
+            num_frames: フレーム数。これ以降のフレームのラベルは持たない
+        """
+        keep = (frames >= 0) & (frames < num_frames)
+        order = np.argsort(frames[keep], kind="stable")
+        self.rows = np.ascontiguousarray(rows[keep][order])
+        self.frames = frames[keep][order].astype(np.int64)
+        self.offsets = np.searchsorted(self.frames, np.arange(num_frames + 1)).astype(np.int64)
+        self.types = list(types)
+
+    @classmethod
+    def from_kitti_file(cls, path: Path, num_frames: int, downsample: bool = False):
+        """ KITTI tracking 形式のラベルファイル (frame, track_id, type, ...) を読み込む """
+        if not Path(path).exists():
+            raise FileNotFoundError(f"ラベルファイルが見つかりません: {path}")
+
+        types = {}
+        rows, frames = [], []
+        with open(path, 'r') as f:
+            for line in f:
+                fields = line.strip().split()
+                if not fields:
+                    continue
+                try:
+                    frame, row = parse_kitti_fields(fields, types, downsample)
+                except Exception as e:
+                    raise ValueError(f"ラベル行のパースに失敗しました: {line}\nエラー: {e}")
+                frames.append(frame)
+                rows.append(row)
+
+        rows = np.array(rows, dtype=np.float64).reshape(-1, LABEL_COLS)
+        type_names = [t for t, _ in sorted(types.items(), key=lambda kv: kv[1])]
+        return cls(rows, np.array(frames, dtype=np.int64), type_names, num_frames)
+
+    def downsampled(self):
+        """ bbox を 1/2 にしたコピー（SequenceForMap の downsample 用） """
+        rows = self.rows.copy()
+        rows[:, BBOX_COLS] /= 2
+        return LabelTable(rows, self.frames, self.types, len(self.offsets) - 1)
+
+    @classmethod
+    def empty(cls, num_frames: int = 0):
+        return cls(np.empty((0, LABEL_COLS)), np.empty(0, dtype=np.int64), [], num_frames)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def frame_rows(self, index: int) -> np.ndarray:
+        return self.rows[self.offsets[index]:self.offsets[index + 1]]
+
+    def frame(self, index: int) -> list:
+        """ フレーム index のラベル辞書のリスト（ラベルがないフレームは空リスト） """
+        if index < 0 or index >= len(self.offsets) - 1:
+            return []
+        return unpack_labels(self.frame_rows(index), self.types)
@@ -0,0 +1,149 @@
+# data/utils/multi_root.py
+import os
+import time
+
+import numpy as np
+import torch
+from torch.utils.data import ConcatDataset, Dataset, get_worker_info
+
+
+class RootThroughput:
+    def __init__(self, root_names: list, num_workers: int = 0):
+        """
+        ルートごとのサンプル数と読み込み時間の集計（共有メモリ上。ワーカーごとに別の行に
+        書くので競合しない）。summary() で遅いディスクを見つけられる。
+
+        行数は DataLoader のワーカー数で決まるので、同じ num_workers のローダーで使う。
+        """
+        self.root_names = list(root_names)
+        # [スロット (0: メインプロセス, 1..: ワーカー), ルート, (サンプル数, 秒)]
+        self._stats = torch.zeros((num_workers + 1, len(self.root_names), 2), dtype=torch.float64).share_memory_()
+        self._pid = None
+        self._row = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_pid"] = None
+        state["_row"] = None  # memoryview は pickle できないので、各プロセスで作り直す
+        return state
+
+    def row(self) -> memoryview:
+        """ このプロセスの集計行 [ルート * 2] の memoryview """
+        if self._pid != os.getpid():
+            worker_info = get_worker_info()
+            slot = 0 if worker_info is None else worker_info.id + 1
+            if slot >= len(self._stats):
+                raise RuntimeError(
+                    f"the DataLoader has {worker_info.num_workers} workers but the per-root stats were sized "
+                    f"for {len(self._stats) - 1}; build the dataset with the loader's num_workers")
+            self._row = memoryview(self._stats[slot].numpy().reshape(-1))  # 共有メモリのビュー
+            self._pid = os.getpid()
+        return self._row
+
+    def reset(self):
+        self._stats.zero_()
+
+    def summary(self) -> dict:
+        """
+        ルートごとの {samples, seconds, samples_per_s}。seconds はワーカーでサンプルの
+        読み込み・transform に掛かった時間の合計で、samples_per_s は 1 ワーカーあたりの値。
+        """
+        totals = self._stats.sum(dim=0).numpy()
+        return {
+            name: {
+                "samples": int(samples),
+                "seconds": float(seconds),
+                "samples_per_s": float(samples / seconds) if seconds > 0 else 0.0,
+            }
+            for name, (samples, seconds) in zip(self.root_names, totals)
+        }
+
+
+class MultiRootDataset(ConcatDataset):
+    def __init__(self, parts: list, num_workers: int = 0):
+        """
+        複数のデータセットルート（KITTI と自前の収録など、別ディスクでもよい）の
+        シーケンスを 1 つのグローバルインデックスにまとめる ConcatDataset。
+
+        ConcatDataset は __getitem__ ごとに Python のリストを bisect するが、ここでは
+        グローバルインデックス -> シーケンス番号 の配列を持ち、O(1) で引く。
+        datasets / cumulative_sizes は ConcatDataset と同じなので、BlockShuffleSampler・
+        WindowStats・set_dataset_epoch はそのまま使える。
+
+        ルートごとのスループットは self.throughput (RootThroughput) に集計する。
+
+        Parameters:
+            parts: [(ルート名, そのルートのシーケンスのデータセットのリスト)]
+            num_workers: DataLoader のワーカー数（集計用の行数）
+        """
+        datasets = [ds for _, seqs in parts for ds in seqs]
+        super().__init__(datasets)
+        self.throughput = RootThroughput([name for name, _ in parts], num_workers)
+
+        lengths = np.array([len(ds) for ds in self.datasets], dtype=np.int64)
+        self.starts = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.int64)
+        self.seq_of = np.repeat(np.arange(len(self.datasets), dtype=np.int32), lengths)
+        self.root_of = np.concatenate([np.full(len(seqs), r, dtype=np.int64)
+                                       for r, (_, seqs) in enumerate(parts)])
+        self._pid = None
+        self._views = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_pid"] = None
+        state["_views"] = None  # memoryview は pickle できないので、各プロセスで作り直す
+        return state
+
+    def _lookup_views(self):
+        """
+        (seq_of, starts, root_of, このプロセスの集計行) の memoryview。
+        numpy のスカラー演算はサンプルごとだと 1 回数百 ns 掛かるため、memoryview で読み書きする。
+        """
+        if self._pid != os.getpid():
+            self._views = (memoryview(self.seq_of), memoryview(self.starts),
+                           memoryview(self.root_of), self.throughput.row())
+            self._pid = os.getpid()
+        return self._views
+
+    def __getitem__(self, idx: int):
+        if idx < 0:
+            idx += len(self)
+        if idx < 0 or idx >= len(self.seq_of):
+            raise IndexError(idx)
+        seq_of, starts, root_of, stats = self._lookup_views()
+        seq = seq_of[idx]
+        start = time.perf_counter()
+        sample = self.datasets[seq][idx - starts[seq]]
+
+        r = 2 * root_of[seq]
+        stats[r] += 1
+        stats[r + 1] += time.perf_counter() - start
+        return sample
+
+
+class RootTaggedSequence(Dataset):
+    def __init__(self, dataset, root: int, throughput: RootThroughput):
+        """
+        ストリーム用のシーケンスを包み、読み込みを throughput のルート root に集計する
+        （MultiRootDataset と同じ集計を build_stream_dataloader でも行うため）。
+        その他の属性 (set_epoch / sequence_name など) は元のデータセットのものを返す。
+        """
+        self.dataset = dataset
+        self.root = root
+        self.throughput = throughput
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getattr__(self, name):
+        if name in ("dataset", "root", "throughput"):  # unpickle 中の再帰を避ける
+            raise AttributeError(name)
+        return getattr(self.dataset, name)
+
+    def __getitem__(self, index: int):
+        start = time.perf_counter()
+        sample = self.dataset[index]
+        stats = self.throughput.row()
+        stats[2 * self.root] += 1
+        stats[2 * self.root + 1] += time.perf_counter() - start
+        return sample
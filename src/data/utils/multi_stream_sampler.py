@@ -1,22 +1,60 @@
 # data/utils/multi_stream_sampler.py
+import numpy as np
 import torch
 from torch.utils.data import IterableDataset
 
+from src.data.utils.sampler_state import SamplerEpoch, worker_resume_state
+
 class MultiStreamSampler(IterableDataset):
     def __init__(self, datasets, batch_size):
+        """
+        バッチの各要素ごとにランダムなシーケンスを選び、そのシーケンスの次のウィンドウを返す。
+
+        途中再開のため、各シーケンスの読み出し位置と乱数の状態をバッチごとに記録する
+        (state_dict())。load_state_dict() で渡した状態は、そのエポックの最初の __iter__ で
+        各ワーカーが自分の分を取り出し、位置を直接設定して続きから読む（読み飛ばしはしない）。
+        エポックは set_epoch()（set_dataset_epoch / DatasetEpochCallback）で設定する。
+        """
         self.datasets = datasets
         self.batch_size = batch_size
+        self.epoch = SamplerEpoch()
+        self._resume = None
+        self._state = None
+
+    def set_epoch(self, epoch: int):
+        self.epoch.set(epoch)
+
+    def state_dict(self):
+        """ このプロセスで最後に返したバッチの直後の状態（位置・乱数） """
+        return self._state
+
+    def load_state_dict(self, state: dict):
+        """ state: {"epoch", "num_workers", "workers": {worker_id: state_dict()}} """
+        self._resume = state
 
     def __iter__(self):
-        iters = [iter(ds) for ds in self.datasets]  # ✅ ここで毎回iterを作り直す
+        epoch = self.epoch.get()
+        lengths = [len(ds) for ds in self.datasets]
+        resume = worker_resume_state(self._resume, epoch)
+        self._resume = None
+        if resume is None:
+            positions = [0] * len(self.datasets)
+            # ワーカーの torch の乱数から種を取る（hardware.seed で再現可能）
+            rng = np.random.default_rng(int(torch.randint(0, 2 ** 62, size=(1,)).item()))
+        else:
+            positions = list(resume["positions"])
+            rng = np.random.default_rng()
+            rng.bit_generator.state = resume["rng"]
+
         while True:
             batch = []
             for _ in range(self.batch_size):
-                i = torch.randint(0, len(iters), size=(1,)).item()
-                try:
-                    batch.append(next(iters[i]))
-                except StopIteration:
+                i = int(rng.integers(len(self.datasets)))
+                if positions[i] >= lengths[i]:
                     continue
+                batch.append(self.datasets[i][positions[i]])
+                positions[i] += 1
             if not batch:
                 break
+            self._state = {"epoch": epoch, "positions": list(positions), "rng": rng.bit_generator.state}
             yield batch
@@ -0,0 +1,168 @@
+# data/utils/profiling.py
+import json
+import time
+from collections import defaultdict, deque
+from pathlib import Path
+
+import numpy as np
+from torch.utils.data import DataLoader
+
+# ワーカー（またはメインプロセス）内で、次の collate までに計測したステージ時間
+_stage_totals = defaultdict(float)
+_stage_spans = deque(maxlen=4096)
+
+
+class StageTimer:
+    """
+    read / decode / transform / collate などのステージ時間をプロセス内に蓄積する。
+    蓄積値は collate 時に pop_stage_timings() で取り出され、バッチのメタデータに載る。
+    """
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        duration = time.perf_counter() - self._t0
+        _stage_totals[self.stage] += duration
+        _stage_spans.append((self.stage, self.start, duration))
+
+
+def pop_stage_timings():
+    """ 前回の呼び出し以降に蓄積したステージ時間 (合計秒, span 一覧) を返してリセットする """
+    timings = dict(_stage_totals)
+    spans = list(_stage_spans)
+    _stage_totals.clear()
+    _stage_spans.clear()
+    return timings, spans
+
+
+def _queue_depth(iterator):
+    """
+    DataLoader イテレータの先読み状況。
+        outstanding: ワーカーに投げたが未消費のバッチ数
+        ready: 結果キューに届いていて取り出し待ちのバッチ数（取得できない環境では -1）
+    """
+    outstanding = getattr(iterator, "_tasks_outstanding", 0)
+    ready = -1
+    data_queue = getattr(iterator, "_data_queue", None)
+    if data_queue is not None:
+        try:
+            ready = data_queue.qsize()
+        except NotImplementedError:  # macOS の multiprocessing.Queue
+            pass
+    return outstanding, ready
+
+
+class LoaderStats:
+    """ コンシューマ側で観測したバッチごとの統計 """
+    def __init__(self):
+        self.wait_s = []
+        self.transport_s = []
+        self.outstanding = []
+        self.ready = []
+        self.stage_s = defaultdict(list)
+
+    def record(self, batch: dict):
+        loader = batch["loader"]
+        self.wait_s.append(loader["wait_s"])
+        self.transport_s.append(loader["transport_s"])
+        self.outstanding.append(loader["outstanding"])
+        self.ready.append(loader["ready"])
+        for stage, seconds in batch.get("timings", {}).items():
+            self.stage_s[stage].append(seconds)
+
+    def summary(self) -> dict:
+        out = {}
+        if self.wait_s:
+            out["wait_ms_mean"] = float(np.mean(self.wait_s)) * 1000
+            out["wait_ms_p90"] = float(np.percentile(self.wait_s, 90)) * 1000
+            out["transport_ms_mean"] = float(np.mean(self.transport_s)) * 1000
+            out["queue_outstanding_mean"] = float(np.mean(self.outstanding))
+            out["queue_ready_mean"] = float(np.mean(self.ready))
+        for stage, values in self.stage_s.items():
+            out[f"{stage}_ms_mean"] = float(np.mean(values)) * 1000
+        return out
+
+
+class ChromeTrace:
+    """
+    バッチのメタデータから chrome://tracing (Perfetto) 形式のトレースを組み立てる。
+    pid 0 がコンシューマ（学習ループ）、pid 1 以降が各ワーカー。
+    """
+    def __init__(self, max_events: int = 200_000):
+        self.events = deque(maxlen=max_events)
+
+    def add_batch(self, batch: dict):
+        worker_pid = int(batch.get("worker_id", 0)) + 1
+        for stage, start, duration in batch.get("spans", []):
+            self.events.append({
+                "name": stage, "ph": "X", "pid": worker_pid, "tid": 0,
+                "ts": start * 1e6, "dur": duration * 1e6,
+            })
+        loader = batch.get("loader")
+        if loader is not None:
+            self.events.append({
+                "name": "wait", "ph": "X", "pid": 0, "tid": 0,
+                "ts": loader["wait_start"] * 1e6, "dur": loader["wait_s"] * 1e6,
+                "args": {"worker_id": batch.get("worker_id", 0)},
+            })
+            self.events.append({
+                "name": "queue_depth", "ph": "C", "pid": 0,
+                "ts": (loader["wait_start"] + loader["wait_s"]) * 1e6,
+                "args": {"outstanding": loader["outstanding"], "ready": loader["ready"]},
+            })
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": list(self.events), "displayTimeUnit": "ms"}, f)
+
+
+class ProfiledDataLoader(DataLoader):
+    """
+    DataLoader のイテレータを包み、各バッチに 'loader' メタデータ
+    (wait_s: next() で待たされた時間, transport_s: ワーカーの collate 完了から受信までの時間,
+    outstanding / ready: 先読みキューの深さ) を付与する。
+    集計は LoaderStatsCallback が行う（ここではバッチごとの値を載せるだけで、保持しない）。
+    トレースは trace_path を指定した場合だけ記録する。
+    """
+    def __init__(self, *args, trace_path=None, max_trace_events: int = 200_000, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.trace = ChromeTrace(max_events=max_trace_events) if trace_path is not None else None
+        self.trace_path = trace_path
+        self.worker_pids = []  # 現在のイテレータのワーカープロセスの pid（scripts/tune_loader.py の CPU 計測用）
+
+    def __iter__(self):
+        iterator = super().__iter__()
+        self.worker_pids = [w.pid for w in getattr(iterator, "_workers", [])]
+        while True:
+            wait_start = time.time()
+            t0 = time.perf_counter()
+            try:
+                batch = next(iterator)
+            except StopIteration:
+                break
+            wait_s = time.perf_counter() - t0
+            received = time.time()
+            outstanding, ready = _queue_depth(iterator)
+
+            if isinstance(batch, dict):
+                collate_end = batch.get("collate_end", received)
+                batch["loader"] = {
+                    "wait_start": wait_start,
+                    "wait_s": wait_s,
+                    "transport_s": max(received - collate_end, 0.0),
+                    "outstanding": outstanding,
+                    "ready": ready,
+                }
+                if self.trace is not None:
+                    self.trace.add_batch(batch)
+            yield batch
+
+        if self.trace is not None:
+            self.trace.save(self.trace_path)
@@ -0,0 +1,45 @@
+# data/utils/sampler_state.py
+import warnings
+
+import torch
+from torch.utils.data import get_worker_info
+
+
+def worker_resume_state(resume: dict, epoch: int):
+    """
+    ストリーム用 sampler の load_state_dict() で渡された状態から、このワーカーの分を取り出す。
+
+    resume: {"epoch": int, "num_workers": int, "next_worker": int, "workers": {worker_id: 状態}}
+    DataLoader は再開後もワーカー 0 から順にバッチを取るので、保存時に次のバッチを返すはずだった
+    ワーカー (next_worker) の状態をワーカー 0 に割り当て、以降も順にずらして渡す
+    （バッチの順序は中断しなかった場合と同じになり、worker_id だけが入れ替わる）。
+    保存時のエポックと一致しない場合（エポック末の保存から再開した場合など）や、
+    ワーカー数が変わってレーンの割り当てが再現できない場合は None（最初から読む）。
+    """
+    if resume is None or resume.get("epoch") != epoch:
+        return None
+    worker_info = get_worker_info()
+    worker_id = worker_info.id if worker_info else 0
+    num_workers = worker_info.num_workers if worker_info else 1
+    if max(resume.get("num_workers", num_workers), 1) != num_workers:
+        warnings.warn(f"[resume] num_workers changed ({resume.get('num_workers')} -> {num_workers}); "
+                      f"restarting the epoch from the beginning")
+        return None
+    source = (worker_id + resume.get("next_worker", 0)) % num_workers
+    workers = resume.get("workers", {})
+    return workers.get(source, workers.get(str(source)))
+
+
+class SamplerEpoch:
+    """
+    エポックを共有メモリのテンソルに持つ（SequenceWindows と同様に、persistent な
+    ワーカー内の sampler のコピーにも set_epoch() が反映される）。
+    """
+    def __init__(self):
+        self._epoch = torch.zeros(1, dtype=torch.int64).share_memory_()
+
+    def set(self, epoch: int):
+        self._epoch[0] = epoch
+
+    def get(self) -> int:
+        return int(self._epoch[0])
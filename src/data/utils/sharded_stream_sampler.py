@@ -3,10 +3,32 @@ import torch
 import torch.distributed as dist
 from torch.utils.data import IterableDataset
 
+from src.data.utils.sampler_state import SamplerEpoch, worker_resume_state
+
 class ShardedSequenceSampler(IterableDataset):
     def __init__(self, datasets, batch_size):
+        """
+        シーケンスを (rank, ワーカー) ごとに分割し、各ワーカーは自分のシーケンスを
+        batch_size 本のレーンで並行に先頭から読む（読み終えたレーンは次のシーケンスに譲る）。
+
+        state_dict() / load_state_dict() は MultiStreamSampler と同じ形式で、
+        各シーケンスの読み出し位置とレーンの並び (lanes) を保存・復元する。
+        """
         self.datasets = datasets
         self.batch_size = batch_size
+        self.epoch = SamplerEpoch()
+        self._resume = None
+        self._state = None
+
+    def set_epoch(self, epoch: int):
+        self.epoch.set(epoch)
+
+    def state_dict(self):
+        """ このプロセスで最後に返したバッチの直後の状態（位置・レーン） """
+        return self._state
+
+    def load_state_dict(self, state: dict):
+        self._resume = state
 
     def __iter__(self):
         worker_info = torch.utils.data.get_worker_info()
@@ -16,20 +38,28 @@ class ShardedSequenceSampler(IterableDataset):
         rank = dist.get_rank() if dist.is_initialized() else 0
         global_worker_id = rank * num_workers + local_worker_id
 
-        # 分割
-        my_datasets = [
-            ds for i, ds in enumerate(self.datasets)
-            if i % (world_size * num_workers) == global_worker_id
-        ]
-        iters = [iter(ds) for ds in my_datasets]
-        while iters:
+        # 分割（lanes: 読み出し中・待ちのシーケンスの番号。先頭 batch_size 本がバッチに入る）
+        epoch = self.epoch.get()
+        resume = worker_resume_state(self._resume, epoch)
+        self._resume = None
+        if resume is None:
+            lanes = [i for i in range(len(self.datasets)) if i % (world_size * num_workers) == global_worker_id]
+            positions = {i: 0 for i in lanes}
+        else:
+            lanes = list(resume["lanes"])
+            positions = {int(i): p for i, p in resume["positions"].items()}
+
+        while lanes:
             batch = []
-            for i in range(min(self.batch_size, len(iters))):
-                try:
-                    batch.append(next(iters[i]))
-                except StopIteration:
-                    iters.pop(i)
+            exhausted = []
+            for i in lanes[:self.batch_size]:
+                if positions[i] >= len(self.datasets[i]):
+                    exhausted.append(i)
+                    continue
+                batch.append(self.datasets[i][positions[i]])
+                positions[i] += 1
+            lanes = [i for i in lanes if i not in exhausted]
+            # 読み終えたレーンだけのステップ（batch が空）でも、残りのシーケンスがあれば続ける
             if batch:
+                self._state = {"epoch": epoch, "lanes": list(lanes), "positions": dict(positions)}
                 yield batch
-            else:
-                break
@@ -0,0 +1,63 @@
+import numpy as np
+
+
+def image_hw(inputs: dict):
+    """
+    bbox の座標系となる画像サイズ (H, W) を返す。
+    images を読み込んでいない場合 (modalities で除外) は SequenceForMap が付与する
+    'image_size' を、それも無ければ events のサイズを使う。
+    """
+    images = inputs.get("images")
+    if images is not None:
+        return images.shape[-2:]
+    if inputs.get("image_size") is not None:
+        H, W = inputs["image_size"]
+        return int(H), int(W)
+    events = inputs.get("events")
+    if events is not None:
+        return events.shape[-2:]
+    raise ValueError("inputs must contain 'images', 'image_size' or 'events'")
+
+
+def num_frames(inputs: dict) -> int:
+    """ サンプルのフレーム数 T を、存在するモダリティから求める """
+    for key in ("images", "events", "labels"):
+        if inputs.get(key) is not None:
+            return len(inputs[key])
+    raise ValueError("inputs must contain at least one of 'images', 'events' or 'labels'")
+
+
+def set_image_size(inputs: dict, H: int, W: int):
+    """ images を持たないサンプルで、変換後の画像サイズを更新する """
+    if "image_size" in inputs:
+        inputs["image_size"] = np.array([H, W], dtype=np.int64)
+
+
+def alloc_out(pool, name: str, shape, dtype) -> np.ndarray:
+    """ サンプルの出力配列。pool (BufferPool) があればスロットのバッファを使い回す """
+    if pool is None:
+        return np.empty(shape, dtype=dtype)
+    return pool.out(name, shape, dtype)
+
+
+def alloc_scratch(pool, name: str, shape, dtype) -> np.ndarray:
+    """ transform 内だけで使う一時配列 """
+    if pool is None:
+        return np.empty(shape, dtype=dtype)
+    return pool.scratch(name, shape, dtype)
+
+
+def cv2_input(array: np.ndarray) -> np.ndarray:
+    """
+    cv2 の補間 (resize の線形補間・warpAffine) は float16 を扱えないため、float32 にして渡す。
+    出力は dst (元の dtype) に write_into で書き戻されるので、コンパクトな dtype が保たれる。
+    """
+    if array.dtype == np.float16:
+        return array.astype(np.float32)
+    return array
+
+
+def write_into(dst: np.ndarray, result: np.ndarray):
+    """ cv2 に dst= で渡した配列が、型・形状の不一致で再確保された場合だけコピーする """
+    if result is not dst:
+        dst[...] = result.reshape(dst.shape)
@@ -1,8 +1,11 @@
-import numpy as np
 from src.utils.timers import Timer
+from src.data.utils.transform.common import image_hw
+from src.data.utils.transform.lazy import flip_view
 
 
 class Flip:
+    pool = None  # BufferPool (Compose が設定)
+
     def __init__(self, vertical: bool = False, horizontal: bool = False):
         """
         Args:
@@ -14,49 +17,39 @@ class Flip:
 
     def __call__(self, inputs: dict) -> dict:
         with Timer("Flip"):
-            images = inputs.get("images")  # [T, C, H, W]
-            labels = inputs.get("labels")  # [T] list of label dicts
+            images = inputs.get("images")  # [T, C, H, W] (optional)
+            labels = inputs.get("labels")  # [T] list of label dicts (optional)
             events = inputs.get("events")  # [T, C, H, W] (optional)
 
-            if images is None or labels is None:
-                raise ValueError("inputs must contain 'images' and 'labels'")
-
-            T, C, H, W = images.shape
-
-            for t in range(T):
-                image = np.transpose(images[t], (1, 2, 0))  # [C, H, W] -> [H, W, C]
-
-                # Flip vertically
-                if self.vertical:
-                    image = np.flip(image, axis=0)
-                    for label in labels[t]:
-                        y1 = label["bbox"][1]
-                        y2 = label["bbox"][3]
-                        label["bbox"][1] = H - y2
-                        label["bbox"][3] = H - y1
-
-                # Flip horizontally
-                if self.horizontal:
-                    image = np.flip(image, axis=1)
-                    for label in labels[t]:
-                        x1 = label["bbox"][0]
-                        x2 = label["bbox"][2]
-                        label["bbox"][0] = W - x2
-                        label["bbox"][2] = W - x1
-
-                images[t] = np.transpose(image, (2, 0, 1))  # [H, W, C] -> [C, H, W]
-
-                # events も反転
-                if events is not None:
-                    for c in range(events.shape[1]):
+            H, W = image_hw(inputs)
+
+            # 反転はコピーせずビュー（負のストライド）として保留する。
+            # 後段の transform はビューをそのまま入力に使い、残ったビューは Compose の最後
+            # （または collate）で 1 回だけコピーされる（lazy.materialize）
+            do_flip = self.vertical or self.horizontal
+
+            if images is not None and do_flip:
+                inputs["images"] = flip_view(images, self.vertical, self.horizontal)
+
+            if labels is not None:
+                for frame_labels in labels:
+                    for label in frame_labels:
+                        # Flip vertically
                         if self.vertical:
-                            events[t, c] = np.flip(events[t, c], axis=0)
+                            y1 = label["bbox"][1]
+                            y2 = label["bbox"][3]
+                            label["bbox"][1] = H - y2
+                            label["bbox"][3] = H - y1
+                        # Flip horizontally
                         if self.horizontal:
-                            events[t, c] = np.flip(events[t, c], axis=1)
-
-            inputs["images"] = images
-            inputs["labels"] = labels
-            if events is not None:
-                inputs["events"] = events
+                            x1 = label["bbox"][0]
+                            x2 = label["bbox"][2]
+                            label["bbox"][0] = W - x2
+                            label["bbox"][2] = W - x1
+                inputs["labels"] = labels
+
+            # events も反転
+            if events is not None and do_flip:
+                inputs["events"] = flip_view(events, self.vertical, self.horizontal)
 
             return inputs
@@ -0,0 +1,31 @@
+import numpy as np
+from src.data.utils.transform.common import alloc_out
+
+# 遅延したビューを持ちうるサンプルのキー
+VIEW_KEYS = ("images", "events")
+
+
+def flip_view(array: np.ndarray, vertical: bool = False, horizontal: bool = False) -> np.ndarray:
+    """ [..., H, W] の反転。コピーせず、負のストライドを持つビューを返す """
+    return array[(..., slice(None, None, -1) if vertical else slice(None),
+                  slice(None, None, -1) if horizontal else slice(None))]
+
+
+def is_pending(array) -> bool:
+    """ まだ連続したメモリにコピーされていないビューか（Flip が保留した反転など） """
+    return isinstance(array, np.ndarray) and not array.flags.c_contiguous
+
+
+def materialize(inputs: dict, pool=None) -> dict:
+    """
+    保留中のビューを連続した配列に 1 回だけコピーする。
+    反転が何回重なっていても、ストライドに畳み込まれているのでコピーは 1 回で済む。
+    （Zoom の切り出しや Resize / Rotate の HWC 転置は、直後に cv2 が読むのでその場のビューのままで、保留しない）
+    """
+    for key in VIEW_KEYS:
+        array = inputs.get(key)
+        if is_pending(array):
+            out = alloc_out(pool, f"lazy.{key}", array.shape, array.dtype)
+            np.copyto(out, array)
+            inputs[key] = out
+    return inputs
@@ -2,8 +2,11 @@ import cv2
 import numpy as np
 from typing import Tuple
 from src.utils.timers import Timer
+from src.data.utils.transform.common import alloc_out, alloc_scratch, cv2_input, image_hw, set_image_size, write_into
 
 class Resize:
+    pool = None  # BufferPool (Compose が設定)
+
     def __init__(self, target_size: Tuple[int, int], mode: str = "bilinear", pad_value: int = 0):
         """
         Args:
@@ -24,53 +27,50 @@ class Resize:
 
     def __call__(self, inputs: dict) -> dict:
         with Timer("Resize"):
-            imgs = inputs.get("images")  # [T, C, H, W]
-            labels = inputs.get("labels")  # [T] list of labels per frame
+            imgs = inputs.get("images")  # [T, C, H, W] (optional)
+            labels = inputs.get("labels")  # [T] list of labels per frame (optional)
             events = inputs.get("events")  # optional [T, C, H, W]
 
-            if imgs is None or labels is None:
-                raise ValueError("'images' and 'labels' keys must be present in inputs.")
-
-            T, C, H, W = imgs.shape
+            H, W = image_hw(inputs)
             target_height, target_width = self.target_size
 
             scale = min(target_width / W, target_height / H)
             new_width, new_height = int(W * scale), int(H * scale)
 
-            resized_imgs = np.zeros((T, C, target_height, target_width), dtype=imgs.dtype)
-
-            for t in range(T):
-                img_hwc = np.transpose(imgs[t], (1, 2, 0))  # [C, H, W] → [H, W, C]
-                resized_img = cv2.resize(img_hwc, (new_width, new_height), interpolation=self.interpolation)
+            if imgs is not None:
+                T, C = imgs.shape[:2]
+                resized_imgs = alloc_out(self.pool, "resize.images", (T, C, target_height, target_width), imgs.dtype)
+                resized_hwc = alloc_scratch(self.pool, "resize.hwc", (new_height, new_width, C), imgs.dtype)
 
-                padded_img = cv2.copyMakeBorder(
-                    resized_img,
-                    top=0,
-                    bottom=target_height - new_height,
-                    left=0,
-                    right=target_width - new_width,
-                    borderType=cv2.BORDER_CONSTANT,
-                    value=[self.pad_value] * C
-                )
+                for t in range(T):
+                    img_hwc = np.transpose(imgs[t], (1, 2, 0))  # [C, H, W] → [H, W, C]
+                    out = cv2.resize(img_hwc, (new_width, new_height), dst=resized_hwc, interpolation=self.interpolation)
+                    resized_imgs[t, :, :new_height, :new_width] = np.transpose(out.reshape(resized_hwc.shape), (2, 0, 1))
 
-                resized_imgs[t] = np.transpose(padded_img, (2, 0, 1))  # [H, W, C] → [C, H, W]
+                # 右・下をパディング（バッファを使い回すため毎回埋める）
+                resized_imgs[:, :, new_height:, :] = self.pad_value
+                resized_imgs[:, :, :new_height, new_width:] = self.pad_value
+                inputs["images"] = resized_imgs
 
-                # bboxスケーリング
-                for label in labels[t]:
-                    bbox = label["bbox"]
-                    bbox = [coord * scale for coord in bbox]
-                    label["bbox"] = bbox
+            # bboxスケーリング
+            if labels is not None:
+                for frame_labels in labels:
+                    for label in frame_labels:
+                        bbox = label["bbox"]
+                        bbox = [coord * scale for coord in bbox]
+                        label["bbox"] = bbox
+                inputs["labels"] = labels
 
-            inputs["images"] = resized_imgs
-            inputs["labels"] = labels
+            set_image_size(inputs, target_height, target_width)
 
             # events も同様に resize
             if events is not None:
                 T_e, C_e, H_e, W_e = events.shape
-                resized_events = np.empty((T_e, C_e, target_height, target_width), dtype=events.dtype)
+                resized_events = alloc_out(self.pool, "resize.events", (T_e, C_e, target_height, target_width), events.dtype)
                 for t in range(T_e):
                     for c in range(C_e):
-                        resized_events[t, c] = cv2.resize(events[t, c], (target_width, target_height), interpolation=self.interpolation)
+                        dst = resized_events[t, c]
+                        write_into(dst, cv2.resize(cv2_input(events[t, c]), (target_width, target_height), dst=dst, interpolation=self.interpolation))
                 inputs["events"] = resized_events
 
             return inputs
@@ -2,8 +2,11 @@ import math
 import numpy as np
 import cv2
 from src.utils.timers import Timer
+from src.data.utils.transform.common import alloc_out, alloc_scratch, cv2_input, image_hw, write_into
 
 class Rotate:
+    pool = None  # BufferPool (Compose が設定)
+
     def __init__(self, angle: float = 0.0):
         """
         Args:
@@ -14,55 +17,57 @@ class Rotate:
 
     def __call__(self, inputs: dict) -> dict:
         with Timer("Rotate"):
-            images = inputs.get("images")  # [T, C, H, W]
-            labels = inputs.get("labels")  # [T] list of labels
+            images = inputs.get("images")  # [T, C, H, W] (optional)
+            labels = inputs.get("labels")  # [T] list of labels (optional)
             events = inputs.get("events")  # [T, C, H, W] (optional)
 
-            if images is None or labels is None:
-                raise ValueError("inputs must contain 'images' and 'labels'")
-
-            T, C, H, W = images.shape
-
-            for t in range(T):
-                image = np.transpose(images[t], (1, 2, 0))  # [C, H, W] → [H, W, C]
-                rotated_image = self.rotate_image(image, self.angle)
-                rotated_labels = self.rotate_bboxes(labels[t], self.angle, W, H)
+            H, W = image_hw(inputs)
 
-                images[t] = np.transpose(rotated_image, (2, 0, 1))  # [H, W, C] → [C, H, W]
-                labels[t] = rotated_labels
+            if images is not None:
+                T, C = images.shape[:2]
+                src_hwc = alloc_scratch(self.pool, "rotate.src", (H, W, C), images.dtype)
+                dst_hwc = alloc_scratch(self.pool, "rotate.dst", (H, W, C), images.dtype)
+                for t in range(T):
+                    np.copyto(src_hwc, np.transpose(images[t], (1, 2, 0)))  # [C, H, W] → [H, W, C]
+                    rotated_image = self.rotate_image(src_hwc, self.angle, dst=dst_hwc)
+                    images[t] = np.transpose(rotated_image.reshape(dst_hwc.shape), (2, 0, 1))  # [H, W, C] → [C, H, W]
+                inputs["images"] = images
 
-            inputs["images"] = images
-            inputs["labels"] = labels
+            if labels is not None:
+                for t in range(len(labels)):
+                    labels[t] = self.rotate_bboxes(labels[t], self.angle, W, H)
+                inputs["labels"] = labels
 
             # イベントも回転（各チャンネル独立）
             if events is not None:
                 T_e, C_e, H_e, W_e = events.shape
-                rotated_events = np.empty_like(events)
+                rotated_events = alloc_out(self.pool, "rotate.events", events.shape, events.dtype)
                 for t in range(T_e):
                     for c in range(C_e):
-                        rotated_events[t, c] = self.rotate_event_channel(events[t, c], self.angle)
+                        dst = rotated_events[t, c]
+                        write_into(dst, self.rotate_event_channel(cv2_input(events[t, c]), self.angle, dst=dst))
                 inputs["events"] = rotated_events
 
             return inputs
 
-    def rotate_image(self, image: np.ndarray, angle: float) -> np.ndarray:
+    def rotate_image(self, image: np.ndarray, angle: float, dst: np.ndarray = None) -> np.ndarray:
         """
-        画像を指定された角度で回転。
+        画像を指定された角度で回転。dst を渡すとそこへ書き込む。
         """
         H, W = image.shape[:2]
         center = (W / 2, H / 2)
         rotation_matrix = cv2.getRotationMatrix2D(center, angle, scale=1.0)
-        rotated_image = cv2.warpAffine(image, rotation_matrix, (W, H), borderValue=(114, 114, 114))
+        rotated_image = cv2.warpAffine(image, rotation_matrix, (W, H), dst=dst, borderValue=(114, 114, 114))
         return rotated_image
 
-    def rotate_event_channel(self, channel: np.ndarray, angle: float) -> np.ndarray:
+    def rotate_event_channel(self, channel: np.ndarray, angle: float, dst: np.ndarray = None) -> np.ndarray:
         """
-        単一チャネルのイベントマップを回転。
+        単一チャネルのイベントマップを回転。dst を渡すとそこへ書き込む。
         """
         H, W = channel.shape
         center = (W / 2, H / 2)
         rotation_matrix = cv2.getRotationMatrix2D(center, angle, scale=1.0)
-        return cv2.warpAffine(channel, rotation_matrix, (W, H), borderValue=0)
+        return cv2.warpAffine(channel, rotation_matrix, (W, H), dst=dst, borderValue=0)
 
     def rotate_bboxes(self, labels: list, angle: float, img_w: int, img_h: int) -> list:
         """
@@ -3,6 +3,7 @@ import numpy as np
 import random
 from typing import Tuple
 from src.utils.timers import Timer
+from src.data.utils.transform.common import alloc_scratch, image_hw, num_frames, write_into
 
 def _find_zoom_center(labels):
     if not labels:
@@ -19,6 +20,8 @@ def _find_zoom_center(labels):
     return avg_x, avg_y
 
 class RandomZoom:
+    pool = None  # BufferPool (Compose が設定)
+
     def __init__(self,
                  prob_weight=(8, 2),
                  in_scale=(1.0, 1.5),
@@ -38,39 +41,38 @@ class RandomZoom:
 
     def __call__(self, inputs: dict) -> dict:
         with Timer("RandomZoom"):
-            images = inputs.get("images")  # [T, C, H, W]
-            labels = inputs.get("labels")  # list of list of dict
+            images = inputs.get("images")  # [T, C, H, W] or None
+            labels = inputs.get("labels")  # list of list of dict or None
             events = inputs.get("events", None)  # [T, C, H, W] or None
 
-            if images is None or labels is None:
-                raise ValueError("inputs must contain 'images' and 'labels'")
-
-            T, C, H, W = images.shape
+            T = num_frames(inputs)
+            H, W = image_hw(inputs)
             zoom_type = random.choices(["in", "out"], weights=self.prob_weight, k=1)[0]
             scale = random.uniform(*(self.in_scale if zoom_type == "in" else self.out_scale))
+            zoom = self.zoom_in if zoom_type == "in" else self.zoom_out
 
             for t in range(T):
-                center = _find_zoom_center(labels[t])
+                center = _find_zoom_center(labels[t]) if labels is not None else None
                 if center is None:
                     center = self._get_random_center(H, W)
 
-                if zoom_type == "in":
-                    images[t], labels[t], event_out = self.zoom_in(
-                        images[t], labels[t],
-                        events[t] if events is not None else None,
-                        scale, center, H, W
-                    )
-                else:
-                    images[t], labels[t], event_out = self.zoom_out(
-                        images[t], labels[t],
-                        events[t] if events is not None else None,
-                        scale, center, H, W
-                    )
+                img_out, label_out, event_out = zoom(
+                    images[t] if images is not None else None,
+                    labels[t] if labels is not None else None,
+                    events[t] if events is not None else None,
+                    scale, center, H, W
+                )
+                if images is not None:
+                    images[t] = img_out
+                if labels is not None:
+                    labels[t] = label_out
                 if events is not None:
                     events[t] = event_out
 
-            inputs["images"] = images
-            inputs["labels"] = labels
+            if images is not None:
+                inputs["images"] = images
+            if labels is not None:
+                inputs["labels"] = labels
             if events is not None:
                 inputs["events"] = events
             return inputs
@@ -83,21 +85,26 @@ class RandomZoom:
         y1 = max(0, min(int(cy - new_H // 2), H - new_H))
 
         # 画像処理
-        img_hwc = np.transpose(img, (1, 2, 0))
-        cropped = img_hwc[y1:y1 + new_H, x1:x1 + new_W]
-        zoomed = cv2.resize(cropped, (W, H), interpolation=cv2.INTER_CUBIC)
-        img_out = np.transpose(zoomed, (2, 0, 1))
+        img_out = None
+        if img is not None:
+            img_hwc = np.transpose(img, (1, 2, 0))
+            cropped = img_hwc[y1:y1 + new_H, x1:x1 + new_W]
+            zoomed = alloc_scratch(self.pool, "zoom.hwc", (H, W, img.shape[0]), img.dtype)
+            write_into(zoomed, cv2.resize(cropped, (W, H), dst=zoomed, interpolation=cv2.INTER_CUBIC))
+            img_out = np.transpose(zoomed, (2, 0, 1))
 
         # イベント処理（各チャネル individually）
         event_out = None
         if event is not None:
             C = event.shape[0]
-            event_out = np.empty((C, H, W), dtype=event.dtype)
+            event_out = alloc_scratch(self.pool, "zoom.events", (C, H, W), event.dtype)
             for c in range(C):
                 cropped_event = event[c, y1:y1 + new_H, x1:x1 + new_W]
-                event_out[c] = cv2.resize(cropped_event, (W, H), interpolation=cv2.INTER_NEAREST)
+                write_into(event_out[c], cv2.resize(cropped_event, (W, H), dst=event_out[c], interpolation=cv2.INTER_NEAREST))
 
         # bboxスケーリング
+        if label_list is None:
+            return img_out, None, event_out
         new_labels = []
         for label in label_list:
             bbox = label["bbox"]
@@ -119,27 +126,36 @@ class RandomZoom:
 
     def zoom_out(self, img, label_list, event, scale, center, H, W):
         new_H, new_W = int(H / scale), int(W / scale)
-        img_hwc = np.transpose(img, (1, 2, 0))
-        resized = cv2.resize(img_hwc, (new_W, new_H), interpolation=cv2.INTER_CUBIC)
-
-        canvas = np.zeros((H, W, 3), dtype=img.dtype)
         cx, cy = center
         x1 = max(min(cx - new_W // 2, W - new_W), 0)
         y1 = max(min(cy - new_H // 2, H - new_H), 0)
-        canvas[y1:y1 + new_H, x1:x1 + new_W] = resized
-        img_out = np.transpose(canvas, (2, 0, 1))
+
+        img_out = None
+        if img is not None:
+            img_hwc = np.transpose(img, (1, 2, 0))
+            resized = alloc_scratch(self.pool, "zoom.resized", (new_H, new_W, 3), img.dtype)
+            write_into(resized, cv2.resize(img_hwc, (new_W, new_H), dst=resized, interpolation=cv2.INTER_CUBIC))
+
+            canvas = alloc_scratch(self.pool, "zoom.canvas", (H, W, 3), img.dtype)
+            canvas.fill(0)
+            canvas[y1:y1 + new_H, x1:x1 + new_W] = resized
+            img_out = np.transpose(canvas, (2, 0, 1))
 
         # event 処理
         event_out = None
         if event is not None:
             C = event.shape[0]
-            event_canvas = np.zeros((C, H, W), dtype=event.dtype)
+            event_canvas = alloc_scratch(self.pool, "zoom.events", (C, H, W), event.dtype)
+            event_canvas.fill(0)
+            resized_event = alloc_scratch(self.pool, "zoom.resized_event", (new_H, new_W), event.dtype)
             for c in range(C):
-                resized_event = cv2.resize(event[c], (new_W, new_H), interpolation=cv2.INTER_NEAREST)
+                write_into(resized_event, cv2.resize(event[c], (new_W, new_H), dst=resized_event, interpolation=cv2.INTER_NEAREST))
                 event_canvas[c, y1:y1 + new_H, x1:x1 + new_W] = resized_event
             event_out = event_canvas
 
         # bboxスケーリング
+        if label_list is None:
+            return img_out, None, event_out
         new_labels = []
         for label in label_list:
             bbox = label["bbox"]
@@ -159,6 +175,8 @@ class RandomZoom:
         return img_out, new_labels, event_out   
 
 class ZoomPerSequence:
+    pool = None  # BufferPool (Compose が設定)
+
     def __init__(self,
                  zoom_type: str = None,
                  scale: float = None,
@@ -207,34 +225,35 @@ class ZoomPerSequence:
 
     def __call__(self, inputs: dict) -> dict:
         with Timer("ZoomPerSequence"):
-            images = inputs["images"]  # [T, C, H, W]
-            labels = inputs["labels"]  # list of list of dict
+            images = inputs.get("images")  # [T, C, H, W] または None
+            labels = inputs.get("labels")  # list of list of dict または None
             events = inputs.get("events", None)  # [T, C, H, W] または None
-            T, C, H, W = images.shape
+            T = num_frames(inputs)
+            H, W = image_hw(inputs)
 
-            self._choose_zoom_params(H, W, labels[0])
+            self._choose_zoom_params(H, W, labels[0] if labels is not None else [])
+            self._zoom_helper.pool = self.pool
+            zoom = self._zoom_helper.zoom_in if self.zoom_type == "in" else self._zoom_helper.zoom_out
 
             for t in range(T):
-                if self.zoom_type == "in":
-                    img_out, label_out, event_out = self._zoom_helper.zoom_in(
-                        images[t], labels[t],
-                        events[t] if events is not None else None,
-                        self.scale, self.center, H, W
-                    )
-                else:
-                    img_out, label_out, event_out = self._zoom_helper.zoom_out(
-                        images[t], labels[t],
-                        events[t] if events is not None else None,
-                        self.scale, self.center, H, W
-                    )
-
-                images[t] = img_out
-                labels[t] = label_out
+                img_out, label_out, event_out = zoom(
+                    images[t] if images is not None else None,
+                    labels[t] if labels is not None else None,
+                    events[t] if events is not None else None,
+                    self.scale, self.center, H, W
+                )
+
+                if images is not None:
+                    images[t] = img_out
+                if labels is not None:
+                    labels[t] = label_out
                 if events is not None:
                     events[t] = event_out
 
-            inputs["images"] = images
-            inputs["labels"] = labels
+            if images is not None:
+                inputs["images"] = images
+            if labels is not None:
+                inputs["labels"] = labels
             if events is not None:
                 inputs["events"] = events
 
@@ -4,68 +4,99 @@ from src.data.utils.transform.resize import Resize
 from src.data.utils.transform.flip import Flip
 from src.data.utils.transform.rotate import Rotate
 from src.data.utils.transform.zoom import RandomZoom, ZoomPerSequence
+from src.data.utils.transform.lazy import materialize
 
 class Compose:
-    def __init__(self, transforms):
+    def __init__(self, transforms, pool=None, materialize_views: bool = True):
+        """
+        pool (BufferPool) を渡すと、各 transform は出力配列をプールのバッファへ dst= で書き込み、
+        サンプルごとの確保を行わない。1 サンプルごとにスロットを 1 つ進める。
+        materialize_views: Flip などが保留したビューを最後に連続した配列へコピーする。
+            False では保留したまま返し、collate のスタックでまとめてコピーする（コピーが 1 回減る）
+        """
         self.transforms = transforms
+        self.pool = pool
+        self.materialize_views = materialize_views
+        for t in self.transforms:
+            if hasattr(t, "pool"):
+                t.pool = pool
 
     def __call__(self, data):
+        if self.pool is not None:
+            self.pool.next_slot()
         for t in self.transforms:
             data = t(data)
+        if self.materialize_views:
+            data = materialize(data, self.pool)
         return data
 
+class RandomTransform:
+    """ サンプルごとに build_for_random() し直し、毎回異なるランダム拡張を適用する """
+    def __init__(self, factory):
+        self.factory = factory
+
+    def __call__(self, data):
+        return self.factory.build_for_random()(data)
+
 class TransformFactory:
-    def __init__(self, mode: str, transform_cfg: DictConfig):
+    def __init__(self, mode: str, transform_cfg: DictConfig, pool=None):
+        """
+        pool: 構築する Compose に渡す BufferPool（None なら従来どおり毎回確保）
+        transform_cfg.defer_views: True で Flip などのビューを collate までコピーしない
+            （Compose の materialize_views=False。DataLoader の collate を通す場合のみ）
+        """
         assert mode in ["train", "test", "val"], f"Invalid mode: {mode}"
+        self.pool = pool
         self.target_size = transform_cfg.get("target_size", None)
         self.rotate_range = transform_cfg.get("rotate_range", None)
         self.zoom_weight = transform_cfg.get("zoom_weight", None)
+        self.defer_views = transform_cfg.get("defer_views", False)
         self.mode = mode
 
     def rebuild(self, seq_id: str, worker_id: int = 0):
-        return self.build_for_stream(seq_id, worker_id)
+        return self.build_for_stream(seq_id)
 
     def build_for_random(self):
         """ ランダムアクセス用の transform を構築 """
-        angle = np.random.uniform(*self.rotate_range)
-        hflip = np.random.rand() < 0.5
-        vflip =False
-
         if self.mode == "train":
+            angle = np.random.uniform(*self.rotate_range)
+            hflip = np.random.rand() < 0.5
+            vflip = False
+
             # train の場合は、resize, flip, rotate, zoom を適用
             transform = Compose([
                 Resize(self.target_size),
                 Flip(horizontal=hflip, vertical=vflip),
                 Rotate(angle),
                 RandomZoom(prob_weight=self.zoom_weight)
-            ])
+            ], pool=self.pool, materialize_views=not self.defer_views)
         else:
             # test/val の場合は、resize, flip, rotate を適用
             transform = Compose([
                 Resize(self.target_size)
-            ])
+            ], pool=self.pool, materialize_views=not self.defer_views)
             
         return transform
     
     def build_for_stream(self, seq_id: str):
         """ Streaming 用に、seq_id に依存した一貫した transform を構築 """
-        rng = np.random.RandomState(seed=int(seq_id))
-        angle = rng.uniform(*self.rotate_range)
-        hflip = rng.rand() < 0.5
-        vflip = False
-
         if self.mode == "train":
+            rng = np.random.RandomState(seed=int(seq_id))
+            angle = rng.uniform(*self.rotate_range)
+            hflip = rng.rand() < 0.5
+            vflip = False
+
             # train の場合は、resize, flip, rotate, zoom を適用
             transform = Compose([
                 Resize(self.target_size),
                 Flip(horizontal=hflip, vertical=vflip),
                 Rotate(angle),
                 ZoomPerSequence(prob_weight=self.zoom_weight)
-            ])
+            ], pool=self.pool, materialize_views=not self.defer_views)
         else:
             # test/val の場合は、resize, flip, rotate を適用
             transform = Compose([
                 Resize(self.target_size)
-            ])
+            ], pool=self.pool, materialize_views=not self.defer_views)
 
         return transform
\ No newline at end of file
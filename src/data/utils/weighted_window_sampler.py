@@ -0,0 +1,72 @@
+# data/utils/weighted_window_sampler.py
+import numpy as np
+import torch.distributed as dist
+from torch.utils.data import Sampler
+
+
+class WeightedWindowSampler(Sampler):
+    def __init__(self, weights: np.ndarray, num_samples: int = None, replacement: bool = True,
+                 seed: int = 0, num_replicas: int = None, rank: int = None):
+        """
+        ウィンドウごとの重み (WindowStats.weights) に比例してサンプルする Sampler
+        （build_random_dataloader の train 用）。希少クラスや混雑したシーンのウィンドウを多く引く。
+
+        重みはラベル統計から事前に計算したものを使うので、サンプルの読み込みは不要。
+        数百万ウィンドウでも 1 エポックの抽選は numpy の 1 回の choice で済む。
+
+        DDP では、全 rank が同じ (seed, epoch) から num_samples * num_replicas 個を抽選し、
+        rank ごとに重ならないよう分ける。Lightning の Trainer では use_distributed_sampler=False にして使う。
+
+        Parameters:
+            weights: [N] 非負の重み（ConcatDataset のグローバルインデックス順）
+            num_samples: 1 エポックに各 rank が返すサンプル数（省略時は ceil(N / num_replicas)）
+            replacement: False では重複なしで抽選する（num_samples * num_replicas <= 重みが正のウィンドウ数）
+            seed: エポックごとの乱数は seed + epoch で決まる
+            num_replicas, rank: 省略時は torch.distributed から取得
+
+        途中再開: load_state_dict({"epoch", "position"}) で、そのエポックの抽選結果の
+        position 番目から返す（BlockShuffleSampler と同じ形式）。
+        """
+        if num_replicas is None:
+            num_replicas = dist.get_world_size() if dist.is_available() and dist.is_initialized() else 1
+        if rank is None:
+            rank = dist.get_rank() if dist.is_available() and dist.is_initialized() else 0
+        assert 0 <= rank < num_replicas
+        weights = np.asarray(weights, dtype=np.float64)
+        if weights.ndim != 1 or (weights < 0).any() or not weights.sum() > 0:
+            raise ValueError("weights must be a 1-D non-negative array with a positive sum")
+        self.probs = weights / weights.sum()
+        self.num_samples = num_samples if num_samples is not None else -(-len(weights) // num_replicas)
+        self.replacement = replacement
+        if not replacement and self.num_samples * num_replicas > np.count_nonzero(weights):
+            raise ValueError("num_samples * num_replicas exceeds the windows with positive weight")
+        self.seed = seed
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.epoch = 0
+        self.position = 0
+        self._resume = None
+
+    def set_epoch(self, epoch: int):
+        self.epoch = epoch
+
+    def state_dict(self) -> dict:
+        """ position はこの sampler が返したインデックス数（DataLoader の先読み分を含む） """
+        return {"epoch": self.epoch, "position": self.position}
+
+    def load_state_dict(self, state: dict):
+        self._resume = state
+
+    def __len__(self):
+        return self.num_samples
+
+    def __iter__(self):
+        rng = np.random.default_rng(self.seed + self.epoch)
+        total = self.num_samples * self.num_replicas
+        indices = rng.choice(len(self.probs), size=total, replace=self.replacement, p=self.probs)
+        resume, self._resume = self._resume, None
+        start = int(resume.get("position", 0)) if resume is not None and resume.get("epoch") == self.epoch else 0
+        self.position = start
+        for idx in indices[self.rank::self.num_replicas][start:].tolist():
+            self.position += 1
+            yield idx
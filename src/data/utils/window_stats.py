@@ -0,0 +1,149 @@
+# data/utils/window_stats.py
+import json
+from pathlib import Path
+
+import numpy as np
+from torch.utils.data import ConcatDataset
+
+from src.data.utils.label_table import LabelTable
+
+# 集計するクラス（DontCare は含めない）
+KITTI_CLASSES = ("Car", "Van", "Truck", "Pedestrian", "Person_sitting", "Cyclist", "Tram", "Misc")
+OCCLUSION_BINS = 4               # occluded: 0 (見えている) ~ 3 (不明)
+TRUNCATION_EDGES = (0.5, 1.5)    # truncated: KITTI tracking の 0 / 1 / 2 をそれぞれのビンに
+
+# LabelTable.rows の列
+_TYPE_COL, _TRUNC_COL, _OCC_COL = 1, 2, 3
+
+
+def frame_stats(labels: LabelTable, class_names=KITTI_CLASSES,
+                truncation_edges=TRUNCATION_EDGES) -> np.ndarray:
+    """
+    フレームごとの統計 [F, K + OCCLUSION_BINS + len(truncation_edges) + 1] (int32)。
+    列は クラス別の box 数 (K = len(class_names)) / occluded のヒストグラム / truncated のヒストグラム。
+    class_names に含まれないクラスの box は数えない。
+    """
+    num_frames = len(labels.offsets) - 1
+    num_trunc = len(truncation_edges) + 1
+    num_cols = len(class_names) + OCCLUSION_BINS + num_trunc
+
+    # シーケンスごとの種別語彙 -> class_names のインデックス (-1 は対象外)
+    lookup = {name: k for k, name in enumerate(class_names)}
+    cls_map = np.array([lookup.get(t, -1) for t in labels.types] + [-1], dtype=np.int64)
+    rows = labels.rows
+    cls = cls_map[rows[:, _TYPE_COL].astype(np.int64)] if len(rows) else np.zeros(0, np.int64)
+    keep = cls >= 0
+    frames = labels.frames[keep]
+    occ = np.clip(rows[keep, _OCC_COL].astype(np.int64), 0, OCCLUSION_BINS - 1)
+    trunc = np.digitize(rows[keep, _TRUNC_COL], truncation_edges)
+
+    # (フレーム, 列) ごとの個数を 1 回の bincount で数える
+    cols = np.concatenate([
+        cls[keep],
+        len(class_names) + occ,
+        len(class_names) + OCCLUSION_BINS + trunc,
+    ])
+    flat = np.tile(frames, 3) * num_cols + cols
+    counts = np.bincount(flat, minlength=num_frames * num_cols)
+    return counts.reshape(num_frames, num_cols).astype(np.int32)
+
+
+def window_sums(per_frame: np.ndarray, starts: np.ndarray, seq_len: int) -> np.ndarray:
+    """ 各ウィンドウ [start, start + seq_len) のフレーム統計の合計（累積和の差で O(F + W)） """
+    cumsum = np.zeros((len(per_frame) + 1, per_frame.shape[1]), dtype=np.int64)
+    np.cumsum(per_frame, axis=0, out=cumsum[1:])
+    return (cumsum[starts + seq_len] - cumsum[starts]).astype(np.int32)
+
+
+def label_stamps(dataset: ConcatDataset) -> list:
+    """ 各シーケンスのラベルファイルの [パス, サイズ, 更新時刻]（保存した統計が古くなっていないかの判定用） """
+    stamps = []
+    for seq in dataset.datasets:
+        st = Path(seq.labels_file).stat()
+        stamps.append([str(seq.labels_file), st.st_size, st.st_mtime_ns])
+    return stamps
+
+
+class WindowStats:
+    def __init__(self, counts: np.ndarray, class_names, truncation_edges=TRUNCATION_EDGES, stamps=None):
+        """
+        ConcatDataset の全ウィンドウの統計（グローバルインデックス順）。
+        画像・イベントを読まずにラベル (LabelTable) だけから作るので、WeightedWindowSampler の
+        重みをサンプルを読み込まずに決められる。
+
+        counts: [N, K + OCCLUSION_BINS + T] (int32)。列は frame_stats と同じ
+        stamps: 集計したラベルファイルの label_stamps()（None は不明）
+        """
+        self.counts = counts
+        self.class_names = tuple(class_names)
+        self.truncation_edges = tuple(truncation_edges)
+        self.stamps = stamps
+
+    @classmethod
+    def from_dataset(cls, dataset: ConcatDataset, class_names=KITTI_CLASSES,
+                     truncation_edges=TRUNCATION_EDGES):
+        """
+        build_random_dataset の ConcatDataset (SequenceForMap) から作る。random_offset_per_epoch のときは
+        offset 0 のウィンドウで集計する（エポックごとの位置のずれは windows.max_offset フレーム以内）。
+        """
+        parts = []
+        for seq in dataset.datasets:
+            # labels を読まない設定でも、ラベルファイルだけは読んで集計する
+            labels = seq.labels if "labels" in seq.modalities else seq._load_labels()
+            per_frame = frame_stats(labels, class_names, truncation_edges)
+            starts = np.arange(len(seq), dtype=np.int64) * seq.windows.stride
+            parts.append(window_sums(per_frame, starts, seq.seq_len))
+        num_cols = len(class_names) + OCCLUSION_BINS + len(truncation_edges) + 1
+        counts = np.concatenate(parts) if parts else np.zeros((0, num_cols), dtype=np.int32)
+        return cls(counts, class_names, truncation_edges, stamps=label_stamps(dataset))
+
+    def save(self, path: Path):
+        np.savez(path, counts=self.counts, class_names=np.array(self.class_names),
+                 truncation_edges=np.array(self.truncation_edges, dtype=np.float64),
+                 stamps=np.array(json.dumps(self.stamps)))
+
+    @classmethod
+    def load(cls, path: Path):
+        with np.load(path) as f:
+            stamps = json.loads(str(f["stamps"])) if "stamps" in f else None
+            return cls(f["counts"], [str(c) for c in f["class_names"]], f["truncation_edges"].tolist(), stamps)
+
+    def is_current(self, dataset: ConcatDataset, class_names=KITTI_CLASSES) -> bool:
+        """ dataset の同じラベルファイル（サイズ・更新時刻が一致）と class_names から作った統計か """
+        return (len(self) == len(dataset) and self.class_names == tuple(class_names)
+                and self.stamps == label_stamps(dataset))
+
+    def __len__(self):
+        return len(self.counts)
+
+    @property
+    def class_counts(self) -> np.ndarray:
+        """ [N, K] クラス別の box 数（フレームをまたいだ延べ数） """
+        return self.counts[:, :len(self.class_names)]
+
+    @property
+    def occlusion_hist(self) -> np.ndarray:
+        k = len(self.class_names)
+        return self.counts[:, k:k + OCCLUSION_BINS]
+
+    @property
+    def truncation_hist(self) -> np.ndarray:
+        return self.counts[:, len(self.class_names) + OCCLUSION_BINS:]
+
+    def num_boxes(self) -> np.ndarray:
+        return self.class_counts.sum(axis=1)
+
+    def weights(self, class_weights: dict = None, crowd_threshold: int = None,
+                crowd_weight: float = 0.0, base: float = 1.0) -> np.ndarray:
+        """
+        ウィンドウごとのサンプリング重み [N] (float64)。
+            base + Σ class_weights[c] (クラス c を含むウィンドウ) + crowd_weight (box 数 >= crowd_threshold)
+        """
+        w = np.full(len(self), base, dtype=np.float64)
+        for name, weight in (class_weights or {}).items():
+            if name not in self.class_names:
+                raise ValueError(f"Unknown class {name!r}; available: {self.class_names}")
+            w += weight * (self.class_counts[:, self.class_names.index(name)] > 0)
+        if crowd_threshold is not None:
+            w += crowd_weight * (self.num_boxes() >= crowd_threshold)
+        return w
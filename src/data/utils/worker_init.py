@@ -0,0 +1,27 @@
+# data/utils/worker_init.py
+import random
+
+import cv2
+import numpy as np
+import torch
+
+
+def worker_init_fn(worker_id: int, cv2_threads: int = 0, torch_threads: int = None):
+    """
+    DataLoader の各ワーカー起動時に一度だけ呼ばれる初期化関数。
+
+    - torch がワーカーごとに割り当てた seed (base_seed + worker_id) から
+      numpy / random の RNG を初期化し、ワーカー間で乱数列が重複しないようにする
+    - OpenCV / torch のスレッド数をワーカー単位で制限し、
+      num_workers 個のプロセスがそれぞれ全コアを使おうとする過剰並列を防ぐ
+
+    spawn でも pickle できるよう、functools.partial で引数を束縛して渡すこと。
+    """
+    seed = torch.initial_seed()
+    random.seed(seed)
+    np.random.seed(seed % 2**32)
+
+    if cv2_threads is not None:
+        cv2.setNumThreads(cv2_threads)
+    if torch_threads is not None:
+        torch.set_num_threads(torch_threads)
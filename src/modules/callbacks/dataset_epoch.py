@@ -0,0 +1,23 @@
+import lightning.pytorch as pl
+
+from src.data.dataloader import set_dataset_epoch
+
+
+class DatasetEpochCallback(pl.Callback):
+    """
+    random_offset_per_epoch: True のときに、train のシーケンスへエポックを伝える。
+
+    persistent_workers のワーカーは次エポックのイテレータ作成時に読み始めるので、
+    エポック終了時に「次の」エポックを設定しておく（学習開始時は再開時のエポック）。
+    """
+
+    def _set(self, trainer, epoch: int):
+        loader = trainer.train_dataloader
+        if loader is not None and hasattr(loader, "dataset"):
+            set_dataset_epoch(loader, epoch)
+
+    def on_train_start(self, trainer, pl_module):
+        self._set(trainer, trainer.current_epoch)
+
+    def on_train_epoch_end(self, trainer, pl_module):
+        self._set(trainer, trainer.current_epoch + 1)
@@ -0,0 +1,53 @@
+import lightning.pytorch as pl
+
+from src.data.utils.profiling import ChromeTrace, LoaderStats
+
+
+class LoaderStatsCallback(pl.Callback):
+    def __init__(self, log_every_n_steps: int = 50, trace_path: str = None,
+                 max_trace_events: int = 200_000):
+        """
+        instrumentation.enabled: True で構築した DataLoader のバッチメタデータを集計し、
+        loader/* としてロガーへ出力する。trace_path を指定すると学習終了時に
+        Chrome trace JSON (chrome://tracing / Perfetto で閲覧可) を書き出す。
+        roots で複数ルートを使う場合は、エポックごとにルート別のスループットを
+        loader/root/<name>/* として出力する（random / streaming の両方）。
+
+        Parameters:
+            log_every_n_steps: 何ステップごとに集計値をログに出すか
+            trace_path: Chrome trace の出力先 (None で出力しない)
+            max_trace_events: トレースに保持する最大イベント数
+        """
+        super().__init__()
+        self.log_every_n_steps = log_every_n_steps
+        self.trace_path = trace_path
+        self.trace = ChromeTrace(max_events=max_trace_events) if trace_path else None
+        self.stats = LoaderStats()
+
+    def on_train_batch_start(self, trainer, pl_module, batch, batch_idx):
+        if not isinstance(batch, dict) or "loader" not in batch:
+            return
+        self.stats.record(batch)
+        if self.trace is not None:
+            self.trace.add_batch(batch)
+
+        if (batch_idx + 1) % self.log_every_n_steps == 0:
+            summary = self.stats.summary()
+            pl_module.log_dict({f"loader/{k}": v for k, v in summary.items()},
+                               on_step=True, on_epoch=False)
+            self.stats = LoaderStats()
+
+    def on_train_epoch_end(self, trainer, pl_module):
+        # MultiRootDataset (random) / ストリームのデータセットのどちらも throughput に集計している
+        throughput = getattr(getattr(trainer.train_dataloader, "dataset", None), "throughput", None)
+        if throughput is None:
+            return
+        for name, r in throughput.summary().items():
+            pl_module.log_dict({f"loader/root/{name}/samples_per_s": r["samples_per_s"],
+                                f"loader/root/{name}/samples": float(r["samples"])},
+                               on_step=False, on_epoch=True)
+        throughput.reset()
+
+    def on_train_end(self, trainer, pl_module):
+        if self.trace is not None and trainer.is_global_zero:
+            self.trace.save(self.trace_path)
@@ -1,10 +1,14 @@
+import warnings
+
 import lightning.pytorch as pl
-from omegaconf import DictConfig
+import torch.distributed as dist
+from omegaconf import DictConfig, OmegaConf
 
 from src.data.dataloader import (
     build_random_dataloader,
     build_stream_dataloader
 )
+from src.data.utils.event_quant import dequantize_events
 
 class KittiDataModule(pl.LightningDataModule):
     def __init__(self,
@@ -14,39 +18,154 @@ class KittiDataModule(pl.LightningDataModule):
         """
         Parameters:
             dataset_cfg: データセットの設定（data_dir, ev_repr_name, seq_len など）
-            dataloader_cfg: DataLoader の設定（batch_size, num_workers など）
+                event_dtype: uint8 / float16 を指定するとイベントをコンパクトな dtype で転送し、
+                    GPU への転送後に on_after_batch_transfer で float32 に戻す
+                event_norm: {mean, std} (任意) 。指定すると逆量子化と同時に正規化する
+            dataloader_cfg: DataLoader の設定（batch_size, hardware など）
+                batch_size: {train: int, eval: int}
+                hardware:
+                  num_workers: {train: int, eval: int}
+                  persistent_workers / prefetch_factor / pin_memory /
+                  cv2_threads / torch_threads / seed (任意)
             use_streaming: TrueでStreamingモードを使用。FalseでRandomモード。
+
+        途中再開: state_dict() / load_state_dict() でチェックポイントに train ローダーの進み具合を保存し、
+        再開時はそのエポックの続きから読む（サンプルを読み飛ばさず、sampler の位置を直接設定する）。
+            Streaming: ワーカーごとの各シーケンスの位置・乱数・レーン（消費したバッチに載る sampler_state）
+            Random: 消費したサンプル数（sampler.type: block / weighted のみ。shuffle=True は再開不可）
+        Streaming ではエポックを sampler に伝えるため DatasetEpochCallback を併用する。
         """
         super().__init__()
         self.dataset_cfg = dataset_cfg
         self.dataloader_cfg = dataloader_cfg
         self.use_streaming = use_streaming
+        self._progress = {}       # 現在のエポックで消費した train バッチの記録
+        self._resume_state = None
+        self._train_loader = None
 
     def _build_loader(self, mode: str):
+        # builder は dataset / dataloader の設定を 1 つの cfg として受け取る
+        cfg = OmegaConf.merge(self.dataset_cfg, self.dataloader_cfg)
         if self.use_streaming:
-            return build_stream_dataloader(
-                dataset_mode=mode,
-                dataset_cfg=self.dataset_cfg,
-                batch_size=self.dataloader_cfg.batch_size,
-                num_workers=self.dataloader_cfg.num_workers,
-                pin_memory=self.dataloader_cfg.get("pin_memory", True),
-            )
+            return build_stream_dataloader(mode=mode, cfg=cfg)
         else:
-            return build_random_dataloader(
-                dataset_mode=mode,
-                dataset_cfg=self.dataset_cfg,
-                batch_size=self.dataloader_cfg.batch_size,
-                num_workers=self.dataloader_cfg.num_workers,
-                shuffle=self.dataloader_cfg.get("shuffle", True),
-                drop_last=self.dataloader_cfg.get("drop_last", True),
-                pin_memory=self.dataloader_cfg.get("pin_memory", True),
-            )
+            return build_random_dataloader(mode=mode, cfg=cfg)
 
     def train_dataloader(self):
-        return self._build_loader("train")
+        self._train_loader = self._build_loader("train")
+        self._apply_resume_state()
+        return self._train_loader
+
+    def _train_sampler(self):
+        loader = self._train_loader
+        if loader is None:
+            return None
+        sampler = loader.dataset.sampler if self.use_streaming else loader.sampler
+        return sampler if hasattr(sampler, "load_state_dict") else None
+
+    def _num_train_workers(self) -> int:
+        cfg = OmegaConf.merge(self.dataset_cfg, self.dataloader_cfg)
+        # ワーカーなしでも worker_id 0 の 1 本として扱う
+        return max(cfg.hardware.num_workers.train, 1)
+
+    def _record_progress(self, batch):
+        """ 消費した train バッチを記録する（先読みされただけのバッチは含まない） """
+        epoch = self.trainer.current_epoch
+        if self._progress.get("epoch") != epoch:
+            self._progress = {"epoch": epoch, "start": 0, "batches": 0,
+                              "num_workers": self._num_train_workers(), "next_worker": 0, "workers": {}}
+        self._progress["batches"] += 1
+        state = batch.pop("sampler_state", None)
+        if state is not None:
+            worker_id = int(batch.get("worker_id", 0))
+            # DataLoader はワーカーを順番に回すので、次のバッチはその次のワーカーから来る
+            self._progress["next_worker"] = (worker_id + 1) % self._progress["num_workers"]
+            self._progress["workers"][worker_id] = state
+
+    def state_dict(self):
+        if not self._progress:
+            return {}
+        cfg = OmegaConf.merge(self.dataset_cfg, self.dataloader_cfg)
+        state = {
+            "epoch": self._progress["epoch"],
+            "streaming": self.use_streaming,
+            "num_workers": self._progress["num_workers"],
+            "next_worker": self._progress["next_worker"],
+            "position": self._progress["start"] + self._progress["batches"] * cfg.batch_size.train,
+            "workers": dict(self._progress["workers"]),
+        }
+        if self.use_streaming and dist.is_available() and dist.is_initialized():
+            # ストリームの位置は rank ごとに異なるので、全 rank の分を集める（dump_checkpoint は全 rank で呼ばれる）
+            gathered = [None] * dist.get_world_size()
+            dist.all_gather_object(gathered, state["workers"])
+            state["workers"] = {r: w for r, w in enumerate(gathered)}
+            state["per_rank"] = True
+        return state
+
+    def load_state_dict(self, state_dict):
+        self._resume_state = state_dict or None
+        self._apply_resume_state()
+
+    def _apply_resume_state(self):
+        """ 保存した進み具合を train の sampler に渡す。実際に適用されるのは保存時と同じエポックの開始時 """
+        state = self._resume_state
+        sampler = self._train_sampler()
+        if state is None or self._train_loader is None:
+            return
+        if state.get("streaming") != self.use_streaming:
+            warnings.warn("[resume] loader mode changed; restarting the epoch from the beginning")
+        elif sampler is None:
+            warnings.warn("[resume] the train sampler is not resumable (use sampler.type: block / weighted); "
+                          "restarting the epoch from the beginning")
+        elif self.use_streaming:
+            workers = state["workers"]
+            if state.get("per_rank"):
+                rank = dist.get_rank() if dist.is_available() and dist.is_initialized() else 0
+                workers = workers.get(rank, {})
+            sampler.load_state_dict({"epoch": state["epoch"], "num_workers": state["num_workers"],
+                                     "next_worker": state["next_worker"], "workers": workers})
+            num_workers = self._num_train_workers()
+            if state["num_workers"] == num_workers:  # ワーカー数が変わった場合、sampler は最初から読む
+                # 再開後のワーカー w は保存時のワーカー (w + next_worker) の続きを読む（worker_resume_state）
+                resumed = {}
+                for w in range(num_workers):
+                    source = (w + state["next_worker"]) % num_workers
+                    worker_state = workers.get(source, workers.get(str(source)))
+                    if worker_state is not None:
+                        resumed[w] = worker_state
+                self._seed_progress(state, workers=resumed)
+        else:
+            sampler.load_state_dict({"epoch": state["epoch"], "position": state["position"]})
+            self._seed_progress(state, workers={})
+        self._resume_state = None
+
+    def _seed_progress(self, state: dict, workers: dict):
+        """
+        再開した位置から進み具合の記録を始める。再開後にまだバッチを消費していない時点や、
+        再開後にバッチを返していないワーカーがある時点で保存しても、再開した位置から続けられる。
+        """
+        self._progress = {"epoch": state["epoch"], "start": state["position"], "batches": 0,
+                          "num_workers": self._num_train_workers(), "next_worker": 0, "workers": workers}
 
     def val_dataloader(self):
         return self._build_loader("val")
 
     def test_dataloader(self):
         return self._build_loader("test")
+
+    def on_after_batch_transfer(self, batch, dataloader_idx: int):
+        if isinstance(batch, dict) and self.trainer is not None and self.trainer.training:
+            self._record_progress(batch)
+        elif isinstance(batch, dict):
+            batch.pop("sampler_state", None)
+
+        # コンパクトな dtype のイベントは、転送後にデバイス上で逆量子化・正規化する
+        data = batch.get("data") if isinstance(batch, dict) else None
+        if data is None or "event_scale" not in data or "events" not in data:
+            return batch
+        norm = self.dataset_cfg.get("event_norm", None) or {}
+        data["events"] = dequantize_events(
+            data["events"], data.pop("event_scale"),
+            mean=norm.get("mean", None), std=norm.get("std", None),
+        )
+        return batch
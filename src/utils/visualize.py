@@ -1,33 +1,60 @@
 import random
 import numpy as np
 import cv2
-from einops import rearrange, reduce
+
+# イベントの正負 (sign + 1 = 0: 負, 1: なし, 2: 正) -> 色
+EV_SIGN_LUT = np.array([[0, 0, 0], [127, 127, 127], [255, 255, 255]], dtype=np.uint8)
+
+def event_sign(input: np.ndarray) -> np.ndarray:
+    """
+    イベント表現 ([(posneg C), H, W]、前半が負・後半が正の極性) の画素ごとの符号
+    (正 - 負 の総和の符号, -1 / 0 / 1) を int8 の [H, W] で返します。
+    """
+    ch = input.shape[-3]
+    assert ch > 1 and ch % 2 == 0, "Input channels must be a positive even number."
+    half = ch // 2
+    if np.issubdtype(input.dtype, np.integer):
+        img_neg = input[..., :half, :, :].sum(axis=-3, dtype=np.int32)
+        img_pos = input[..., half:, :, :].sum(axis=-3, dtype=np.int32)
+    else:
+        # 従来どおり、極性ごとの総和を int32 に切り捨ててから比較する
+        img_neg = input[..., :half, :, :].sum(axis=-3).astype(np.int32)
+        img_pos = input[..., half:, :, :].sum(axis=-3).astype(np.int32)
+    np.subtract(img_pos, img_neg, out=img_pos)
+    return np.sign(img_pos).astype(np.int8)
 
 def ev_repr_to_img(input: np.ndarray):
     """
     イベント表現 (正の極性と負の極性) を RGB 画像に変換します。
     """
-    ch, ht, wd = input.shape[-3:]
-    assert ch > 1 and ch % 2 == 0, "Input channels must be a positive even number."
-    ev_repr_reshaped = rearrange(input, '(posneg C) H W -> posneg C H W', posneg=2)
-    img_neg = np.asarray(reduce(ev_repr_reshaped[0], 'C H W -> H W', 'sum'), dtype='int32')
-    img_pos = np.asarray(reduce(ev_repr_reshaped[1], 'C H W -> H W', 'sum'), dtype='int32')
-    img_diff = img_pos - img_neg
-    img = 127 * np.ones((ht, wd, 3), dtype=np.uint8)
-    img[img_diff > 0] = 255
-    img[img_diff < 0] = 0
-    return img
+    return EV_SIGN_LUT[event_sign(input) + 1]
+
+def overlay_events_on_image(image: np.ndarray, events: np.ndarray,
+                            pos_color=(0, 0, 255), neg_color=(255, 0, 0)) -> np.ndarray:
+    """
+    image: (H, W, 3) の画像（そのまま書き換えます）
+    events: [(posneg C), H', W'] のイベント表現。解像度が異なる場合は最近傍で画像サイズに合わせます。
+    イベントのある画素を正負の色 (既定は BGR の赤 / 青) で塗ります。
+    """
+    sign = event_sign(events)
+    h, w = image.shape[:2]
+    if sign.shape != (h, w):
+        sign = cv2.resize(sign, (w, h), interpolation=cv2.INTER_NEAREST)
+    image[sign > 0] = pos_color
+    image[sign < 0] = neg_color
+    return image
 
 # ---------------------------
 # 画像にラベル（2D boxとトラックID）を描画する関数
 # ---------------------------
 
-def draw_labels_on_image(image: np.ndarray, labels: list):
+def draw_labels_on_image(image: np.ndarray, labels: list, in_place: bool = False):
     """
     image: (H, W, 3) のRGB画像
     labels: 各ラベルは辞書形式で、少なくとも "bbox" (左, 上, 右, 下) と "track_id" を含むとする。
+    in_place: True でコピーせずに image へ直接描画する
     """
-    image_with_boxes = image.copy()
+    image_with_boxes = image if in_place else image.copy()
     for label in labels:
         bbox = label.get("bbox", None)
         track_id = label.get("track_id", None)
@@ -44,6 +71,16 @@ def draw_labels_on_image(image: np.ndarray, labels: list):
     return image_with_boxes
 
 
+def _color_for_id(track_id):
+    # 従来の random.seed(track_id) と同じ色（グローバルの random の状態は変えない）
+    rng = random.Random(track_id)
+    return tuple(rng.randint(0, 255) for _ in range(3))
+
+# トラックID -> 色 の表（範囲外の ID はその都度計算する）
+COLOR_LUT = [_color_for_id(i) for i in range(1024)]
+
 def get_color_for_id(track_id):
-    random.seed(track_id)  # トラックIDから一意の色を決定
-    return tuple(random.randint(0, 255) for _ in range(3))  # BGR
\ No newline at end of file
+    track_id = int(track_id)
+    if 0 <= track_id < len(COLOR_LUT):
+        return COLOR_LUT[track_id]  # BGR
+    return _color_for_id(track_id)